@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Compares the single-pass Parameters.get_query_string() with the former
+urlencode() + replace() pipeline on the parameters of typical pageviews.
+Every hit is a fresh Parameters instance, as in production, and the value
+cache of utils.encode_query_value() starts empty for each run.
+
+    python benchmarks/query_string.py
+'''
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    from urllib import urlencode
+except ImportError as e:
+    from urllib.parse import urlencode
+
+from pyga import utils
+from pyga.requests import Page, PageViewRequest, Parameters, Session, Tracker, Visitor
+
+
+def legacy_query_string(params):
+    query_string = urlencode(params.get_parameters()).replace('+', '%20')
+    return utils.convert_to_uri_component_encoding(query_string)
+
+
+def build_parameters(tracker, number):
+    '''Parameters of number distinct pageviews, each with its own visitor and session like real hits.'''
+    hits = []
+    for i in range(number):
+        visitor = Visitor()
+        visitor.ip_address = '194.54.176.%s' % (i % 256)
+        visitor.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)'
+        visitor.locale = 'en_US'
+        page = Page('/products/shoes?color=red&size=%s' % (i % 50))
+        page.title = u"Running shoes (men's) – Example Store"
+        page.referrer = 'https://www.google.com/search?q=running+shoes'
+        hits.append(PageViewRequest(tracker.config, tracker, visitor, Session(), page).build_parameters())
+    return hits
+
+
+def best_of(encode, hits, cold=False, repeat=3):
+    '''
+    Best time of encoding all hits, starting each run with an empty value cache,
+    which gets emptied before every single hit as well with cold.
+    '''
+    times = []
+    for i in range(repeat):
+        utils._query_value_cache.clear()
+        start = timeit.default_timer()
+        for params in hits:
+            if cold:
+                utils._query_value_cache.clear()
+            encode(params)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def main(number=20000):
+    tracker = Tracker('UA-0000-0000', 'example.com')
+    hits = build_parameters(tracker, number)
+
+    for params in hits[:100]:
+        assert params.get_query_string() == legacy_query_string(params)
+
+    for name, cold in (('values repeating across hits', False), ('no cached values', True)):
+        legacy = best_of(legacy_query_string, hits, cold)
+        single_pass = best_of(Parameters.get_query_string, hits, cold)
+        print('%s:' % name)
+        print('  legacy urlencode pipeline: %.2f us/hit' % (legacy / number * 1e6))
+        print('  single pass encoder:       %.2f us/hit' % (single_pass / number * 1e6))
+        print('  speedup:                   %.1fx' % (legacy / single_pass))
+
+if __name__ == '__main__':
+    main()
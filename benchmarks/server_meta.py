@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+'''
+Compares the cached, regex free Visitor.extract_from_server_meta() with the
+former implementation on a corpus of request metadata in which, like in real
+traffic, a few user agents and Accept-Language headers account for most requests.
+
+    python benchmarks/server_meta.py
+'''
+from __future__ import print_function
+
+import os
+import random
+import re
+import sys
+import timeit
+from operator import itemgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyga import utils
+from pyga.entities import Visitor
+
+RE_IP = re.compile(r'^[\d+]{1,3}\.[\d+]{1,3}\.[\d+]{1,3}\.[\d+]{1,3}$', re.I)
+RE_PRIV_IP = re.compile(r'^(?:127\.0\.0\.1|10\.|192\.168\.|172\.(?:1[6-9]|2[0-9]|3[0-1])\.)')
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/118.0',
+    'Mozilla/5.0 (Linux; Android 13; SM-S901B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Mobile Safari/537.36',
+]
+ACCEPT_LANGUAGES = [
+    'en-US,en;q=0.9',
+    'en-GB,en-US;q=0.9,en;q=0.8',
+    'de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7',
+    'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
+    'es-ES,es;q=0.9',
+    'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+    'ja,en-US;q=0.9,en;q=0.8',
+]
+
+
+def legacy_extract(visitor, meta):
+    if 'REMOTE_ADDR' in meta and meta['REMOTE_ADDR']:
+        ip = None
+        for key in ('HTTP_X_FORWARDED_FOR', 'REMOTE_ADDR'):
+            if key in meta and not ip:
+                ips = meta.get(key, '').split(',')
+                ip = ips[-1].strip()
+                if not RE_IP.match(str(ip)):
+                    ip = ''
+                if RE_PRIV_IP.match(str(ip)):
+                    ip = ''
+        if ip:
+            visitor.ip_address = ip
+
+    if 'HTTP_USER_AGENT' in meta and meta['HTTP_USER_AGENT']:
+        visitor.user_agent = meta['HTTP_USER_AGENT']
+
+    if 'HTTP_ACCEPT_LANGUAGE' in meta and meta['HTTP_ACCEPT_LANGUAGE']:
+        user_locals = []
+        matched_locales = utils.validate_locale(meta['HTTP_ACCEPT_LANGUAGE'])
+        if matched_locales:
+            lang_lst = map((lambda x: x.replace('-', '_')), (i[1] for i in matched_locales))
+            quality_lst = map((lambda x: x and x or 1), (float(i[4] and i[4] or '0') for i in matched_locales))
+            lang_quality_map = map((lambda x, y: (x, y)), lang_lst, quality_lst)
+            user_locals = [x[0] for x in sorted(lang_quality_map, key=itemgetter(1), reverse=True)]
+
+        if user_locals:
+            visitor.locale = user_locals[0]
+
+    return visitor
+
+
+def build_corpus(size, seed=42):
+    rnd = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        # Returning visitors: addresses repeat, a few headers dominate
+        ip = '%s.%s.%s.%s' % (rnd.choice((81, 94, 203)), rnd.randint(0, 20), rnd.randint(0, 20), rnd.randint(1, 254))
+        meta = {
+            'REMOTE_ADDR': '10.0.0.%s' % rnd.randint(1, 4),
+            'HTTP_X_FORWARDED_FOR': ip,
+            'HTTP_USER_AGENT': USER_AGENTS[min(int(rnd.expovariate(1)), len(USER_AGENTS) - 1)],
+            'HTTP_ACCEPT_LANGUAGE': ACCEPT_LANGUAGES[min(int(rnd.expovariate(0.7)), len(ACCEPT_LANGUAGES) - 1)],
+        }
+        corpus.append(meta)
+    return corpus
+
+
+def main(size=20000):
+    corpus = build_corpus(size)
+    visitor = Visitor()
+
+    for meta in corpus[:1000]:
+        expected = legacy_extract(Visitor(), meta)
+        actual = Visitor().extract_from_server_meta(meta)
+        assert (actual.ip_address, actual.locale) == (expected.ip_address, expected.locale)
+
+    def run_legacy():
+        for meta in corpus:
+            legacy_extract(visitor, meta)
+
+    def run_cached():
+        for meta in corpus:
+            visitor.extract_from_server_meta(meta)
+
+    legacy = min(timeit.repeat(run_legacy, number=1, repeat=3))
+    cached = min(timeit.repeat(run_cached, number=1, repeat=3))
+    print('legacy regex extraction: %.2f us/request' % (legacy / size * 1e6))
+    print('cached extraction:       %.2f us/request' % (cached / size * 1e6))
+    print('speedup:                 %.1fx' % (legacy / cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
-from pyga.requests import Q
+from pyga.requests import flush_queues
 
-def shutdown():
+def shutdown(workers=4, timeout=None):
     '''
-    Fire all stored GIF requests One by One.
+    Fire all stored GIF requests concurrently using a pool of worker threads.
     You should call this if you set Config.queue_requests = True
+
+    Requests which could not be sent within timeout seconds are dropped.
+    Returns a FlushResult with the amount of sent, failed and dropped requests.
     '''
-    map(lambda func: func(), Q.REQ_ARRAY)
+    return flush_queues(workers, timeout)
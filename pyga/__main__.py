@@ -0,0 +1,5 @@
+import sys
+
+from pyga.cli import main
+
+sys.exit(main())
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+'''
+asyncio support: an AsyncTracker whose track_* methods are coroutines sending
+requests over non-blocking, reused connections. Requires Python 3.5+.
+'''
+
+import asyncio
+import logging
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from pyga.exceptions import CircuitOpenError
+from pyga.requests import (Config, EventRequest, HitResult, ItemRequest, PageViewRequest,
+                           SocialInteractionRequest, Tracker, TransactionRequest,
+                           defers_sending, dispatch_http_request)
+from pyga.retry import is_transient_error
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncResponse(object):
+    '''
+    Properties:
+    status -- HTTP status code
+    reason -- HTTP reason phrase
+    headers -- Dict of lower-cased header names to values
+    body -- Response body as bytes
+    '''
+    def __init__(self, status, headers, body, reason=''):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class AsyncConnectionPool(object):
+    '''
+    Keeps open asyncio streams per endpoint host, so consecutive requests
+    don't pay for a new connection.
+
+    Properties:
+    maxsize -- Maximum amount of idle connections kept per host.
+    '''
+    def __init__(self, maxsize=10):
+        self.maxsize = maxsize
+        self.__pools = {}
+
+    async def urlopen(self, request, timeout=None):
+        '''
+        Sends a urllib Request object and returns an AsyncResponse. Like
+        ConnectionPool.urlopen(), raises HTTPError for error and redirect status codes.
+        '''
+        parts = urlsplit(request.get_full_url())
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        body = request.data
+        if body is not None and not isinstance(body, bytes):
+            body = body.encode('utf-8')
+
+        head = ['%s %s HTTP/1.1' % ('POST' if body is not None else 'GET', path)]
+        # Header names are case-insensitive, urllib capitalizes them like "Content-length"
+        headers = dict((name.lower(), (name, value)) for name, value in request.header_items())
+        headers.setdefault('host', ('Host', parts.netloc))
+        if body is not None:
+            headers['content-length'] = ('Content-Length', len(body))
+        for name, value in headers.values():
+            head.append('%s: %s' % (name, value))
+        payload = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+        conn, reused = self._get_connection(key)
+        try:
+            if conn is None:
+                conn = await asyncio.wait_for(self._connect(key), timeout)
+            response = await asyncio.wait_for(self._exchange(conn, payload), timeout)
+        except asyncio.TimeoutError:
+            if conn is not None:
+                conn[1].close()
+            raise
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            if conn is not None:
+                conn[1].close()
+            if not reused:
+                raise
+            logger.debug('Reconnecting to %s after error on reused connection', key[1])
+            conn = await asyncio.wait_for(self._connect(key), timeout)
+            try:
+                response = await asyncio.wait_for(self._exchange(conn, payload), timeout)
+            except Exception:
+                conn[1].close()
+                raise
+        except Exception:
+            if conn is not None:
+                conn[1].close()
+            raise
+
+        if response.headers.get('connection', '').lower() == 'close':
+            conn[1].close()
+        else:
+            self._put_connection(key, conn)
+
+        if response.status >= 300:
+            raise HTTPError(request.get_full_url(), response.status, response.reason, response.headers, None)
+        return response
+
+    def close(self):
+        '''Closes all idle connections.'''
+        pools, self.__pools = self.__pools, {}
+        for idle in pools.values():
+            for reader, writer in idle:
+                writer.close()
+
+    def _get_connection(self, key):
+        idle = self.__pools.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if reader.at_eof() or writer.transport.is_closing():
+                writer.close()
+                continue
+            return (reader, writer), True
+        return None, False
+
+    def _put_connection(self, key, conn):
+        idle = self.__pools.setdefault(key, [])
+        if len(idle) < self.maxsize:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return await asyncio.open_connection(host, int(port or 443), ssl=True)
+        return await asyncio.open_connection(host, int(port or 80))
+
+    async def _exchange(self, conn, payload):
+        reader, writer = conn
+        writer.write(payload)
+        await writer.drain()
+
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise asyncio.IncompleteReadError(b'', None)
+            parts = status_line.decode('latin-1').split(None, 2)
+            status = int(parts[1])
+            reason = parts[2].strip() if len(parts) > 2 else ''
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            # Skip interim responses like "100 Continue", the final one follows
+            if status >= 200:
+                break
+
+        if status in (204, 304):
+            # Never have a body, whatever the headers say
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+
+        return AsyncResponse(status, headers, body, reason)
+
+
+def is_transient_async_error(error):
+    '''is_transient_error() for the errors of AsyncConnectionPool.urlopen() as well.'''
+    return isinstance(error, (asyncio.TimeoutError, asyncio.IncompleteReadError)) or is_transient_error(error)
+
+
+class AsyncTracker(Tracker):
+    '''
+    Tracker for asyncio applications. Parameters are built exactly like with
+    Tracker, but the track_* methods are coroutines which send the requests
+    without blocking the event loop.
+
+    Requests are dispatched according to the config just like with Tracker:
+    transports (queue, export, ring buffer, spool, fire_and_forget dispatcher)
+    take them over without any network I/O in the event loop, otherwise they
+    are sent right away, with the retries, circuit breaker, "spool_on_failure"
+    and "error_severity" of the config.
+
+    Properties:
+    max_in_flight -- Maximum amount of requests being sent concurrently.
+    '''
+    def __init__(self, account_id='', domain_name='', conf=None, max_in_flight=10):
+        super(AsyncTracker, self).__init__(account_id, domain_name, conf)
+        self.max_in_flight = max_in_flight
+        self.connection_pool = AsyncConnectionPool(self.config.pool_maxsize)
+        self._semaphore = None
+
+    async def fire(self, request):
+        '''
+        Builds the given request right away and dispatches it. Returns the
+        AsyncResponse if it was sent right away, else None.
+        '''
+        config = self.config
+        http_request = request.build_http_request()
+        if defers_sending(config, self.queue):
+            return dispatch_http_request(config, http_request, self.queue)
+
+        try:
+            return await self.send(http_request)
+        except Exception as e:
+            if config.spool_directory and config.spool_on_failure:
+                config.get_spool().append(http_request)
+            elif config.error_severity == Config.ERROR_SEVERITY_RAISE:
+                raise
+            elif config.error_severity == Config.ERROR_SEVERITY_PRINT:
+                logger.warning('Sending request failed: %s', e)
+        return None
+
+    async def send(self, http_request):
+        '''
+        Sends an already built urllib request once a slot is free, retrying
+        transient errors like send_http_request() does.
+        '''
+        config = self.config
+        if not config.endpoint:
+            return None
+
+        breaker = config.get_circuit_breaker()
+        if not breaker.allow():
+            raise CircuitOpenError('Too many failed requests, not sending to %s for now.' % config.endpoint)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        policy = config.get_retry_policy()
+        retry = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self.connection_pool.urlopen(http_request, timeout=config.request_timeout)
+                break
+            except Exception as e:
+                transient = is_transient_async_error(e)
+                if retry >= policy.attempts or not transient:
+                    if transient:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    raise
+            await asyncio.sleep(policy.delay(retry))
+            retry += 1
+
+        breaker.record_success()
+        return response
+
+    async def track_pageview(self, page, session, visitor):
+        '''Equivalent of _trackPageview() in GA Javascript client.'''
+        params = {
+            'config': self.config,
+            'tracker': self,
+            'visitor': visitor,
+            'session': session,
+            'page': page,
+        }
+        return await self.fire(PageViewRequest(**params))
+
+    async def track_event(self, event, session, visitor):
+        '''Equivalent of _trackEvent() in GA Javascript client.'''
+        event.validate()
+
+        params = {
+            'config': self.config,
+            'tracker': self,
+            'visitor': visitor,
+            'session': session,
+            'event': event,
+        }
+        return await self.fire(EventRequest(**params))
+
+    async def track_transaction(self, transaction, session, visitor):
+        '''Combines _addTrans(), _addItem() (indirectly) and _trackTrans() of GA Javascript client.'''
+        transaction.validate()
+
+        params = {
+            'config': self.config,
+            'tracker': self,
+            'visitor': visitor,
+            'session': session,
+            'transaction': transaction,
+        }
+        await self.fire(TransactionRequest(**params))
+
+        for item in transaction.items:
+            item.validate()
+
+            params = {
+                'config': self.config,
+                'tracker': self,
+                'visitor': visitor,
+                'session': session,
+                'item': item,
+            }
+            await self.fire(ItemRequest(**params))
+
+    async def track_pageviews(self, hits):
+        '''
+        Batch version of track_pageview() for an iterable of (page, session, visitor)
+        tuples, see track_batch().
+        '''
+        return await self.track_batch(PageViewRequest, hits)
+
+    async def track_events(self, hits):
+        '''
+        Batch version of track_event() for an iterable of (event, session, visitor)
+        tuples, see track_batch().
+        '''
+        hits = list(hits)
+        for event, session, visitor in hits:
+            event.validate()
+        return await self.track_batch(EventRequest, hits)
+
+    async def track_batch(self, request_class, hits):
+        '''
+        Like Tracker.track_batch(), but requests sent right away are sent
+        concurrently by the event loop, up to max_in_flight at a time. Errors
+        are reported as error of the HitResult of their hit instead of raised.
+        '''
+        config = self.config
+        visitor_cache = {}
+        requests = []
+        for subject, session, visitor in hits:
+            request = request_class(config, self, visitor, session, subject)
+            request.visitor_cache = visitor_cache
+            requests.append(request.build_http_request())
+
+        if defers_sending(config, self.queue):
+            for http_request in requests:
+                dispatch_http_request(config, http_request, self.queue)
+            return [HitResult(http_request, None, None) for http_request in requests]
+
+        responses = await asyncio.gather(*[self.send(http_request) for http_request in requests],
+                                         return_exceptions=True)
+        results = []
+        for http_request, response in zip(requests, responses):
+            if not isinstance(response, Exception):
+                results.append(HitResult(http_request, response, None))
+                continue
+
+            results.append(HitResult(http_request, None, response))
+            if config.spool_directory and config.spool_on_failure:
+                config.get_spool().append(http_request)
+            elif config.error_severity == Config.ERROR_SEVERITY_PRINT:
+                logger.warning('Sending request failed: %s', response)
+        return results
+
+    async def track_social(self, social_interaction, page, session, visitor):
+        '''Equivalent of _trackSocial() in GA Javascript client.'''
+        params = {
+            'config': self.config,
+            'tracker': self,
+            'visitor': visitor,
+            'session': session,
+            'social_interaction': social_interaction,
+            'page': page,
+        }
+        return await self.fire(SocialInteractionRequest(**params))
+
+    def close(self):
+        '''Closes all idle connections.'''
+        self.connection_pool.close()
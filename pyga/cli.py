@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+'''
+Command line interface.
+
+    pyga replay UA-12345-1 example.com /var/log/nginx/access.log.1 /var/log/nginx/access.log.2.gz
+
+replays the pageviews of nginx/Apache access logs in the "combined" (or
+"common") format, streaming the logs and tracking the hits on a pool of
+worker processes. Hits of the same visitor (IP address and user agent)
+always go to the same worker, in log order.
+
+    pyga upload /var/spool/pyga-export
+
+sends the hits of the export files written with Config.export_directory.
+
+    pyga drain /dev/shm/pyga.ring
+
+is the sidecar sending the hits of the ring buffer of Config.ring_buffer_path.
+'''
+from __future__ import print_function
+
+import argparse
+import calendar
+import gzip
+import logging
+import multiprocessing
+import re
+import sys
+import time
+import zlib
+from collections import namedtuple
+from pyga import utils
+from pyga.entities import Page, Visitor
+from pyga.exceptions import WorkerError
+from pyga.export import ExportUploader
+from pyga.requests import Config, PageViewRequest, Tracker, send_http_request
+from pyga.ringbuffer import RingBuffer, RingBufferSender
+from pyga.sessions import SessionManager
+try:
+    from Queue import Empty, Full
+except ImportError as e:
+    from queue import Empty, Full
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+RE_COMBINED_LOG = re.compile(
+    r'^(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" '
+    r'(?P<status>\d{3}) \S+(?: "(?P<referrer>[^"]*)" "(?P<user_agent>[^"]*)")?')
+
+MONTHS = dict((month, i + 1) for i, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')))
+
+# Lines handed to a worker process at once
+CHUNK_SIZE = 500
+
+# Visitors remembered per worker process
+VISITOR_CACHE_SIZE = 100000
+
+# Seconds to wait for a worker process before checking whether it is still alive
+WORKER_POLL_INTERVAL = 1
+
+LogEntry = namedtuple('LogEntry', 'ip timestamp method path status referrer user_agent')
+
+# hits are the pageviews replayed, failed the ones which could not be sent
+ReplayResult = namedtuple('ReplayResult', 'lines hits skipped seconds failed')
+
+
+def read_lines(paths):
+    '''Yields the lines of the given files as text, gzip files and "-" for stdin included.'''
+    for path in paths:
+        if path == '-':
+            f = getattr(sys.stdin, 'buffer', sys.stdin)
+        elif path.endswith('.gz'):
+            f = gzip.open(path, 'rb')
+        else:
+            f = open(path, 'rb')
+
+        try:
+            for line in f:
+                yield line.decode('utf-8', 'replace')
+        finally:
+            if path != '-':
+                f.close()
+
+
+def parse_log_time(value):
+    '''Epoch seconds of an access log time like "10/Oct/2000:13:55:36 -0700".'''
+    day, month, rest = value.split('/', 2)
+    clock, _, offset = rest.partition(' ')
+    year, hour, minute, second = clock.split(':')
+    timestamp = calendar.timegm((int(year), MONTHS[month], int(day), int(hour), int(minute), int(second)))
+
+    if offset:
+        seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        timestamp -= seconds if offset[0] == '+' else -seconds
+    return timestamp
+
+
+def parse_lines(lines, min_status=200, max_status=399):
+    '''
+    Yields a LogEntry for each line of a pageview, which is a GET request answered
+    with a status between min_status and max_status. Other lines yield None, so
+    that callers can count them.
+    '''
+    last_time = last_timestamp = None
+    for line in lines:
+        match = RE_COMBINED_LOG.match(line)
+        if match is None:
+            yield None
+            continue
+
+        ip, log_time, method, path, status, referrer, user_agent = match.groups()
+        status = int(status)
+        if method != 'GET' or not min_status <= status <= max_status or not path.startswith('/'):
+            yield None
+            continue
+
+        # Lines come in chronological order, many of them within the same second
+        if log_time != last_time:
+            try:
+                last_timestamp = parse_log_time(log_time)
+            except (KeyError, ValueError):
+                yield None
+                continue
+            last_time = log_time
+
+        yield LogEntry(ip, last_timestamp, method, path, status,
+                       None if referrer in (None, '-') else referrer,
+                       None if user_agent in (None, '-') else user_agent)
+
+
+def visitor_key(entry):
+    '''Visitors are told apart by IP address and user agent.'''
+    return '%s %s' % (entry.ip, entry.user_agent or '')
+
+
+class Replayer(object):
+    '''
+    Tracks LogEntry objects as pageviews, keeping a Visitor and a Session per
+    visitor key, with sessions expiring after 30 minutes without hits (in log time).
+
+    Properties:
+    tracker -- Tracker used for all hits
+    dry_run -- Only build the requests without sending them
+
+    '''
+    def __init__(self, tracker, dry_run=False):
+        self.tracker = tracker
+        self.dry_run = dry_run
+        self.visitors = utils.LRUCache(VISITOR_CACHE_SIZE)
+        self.sessions = SessionManager()
+
+    def track(self, entry):
+        key = visitor_key(entry)
+        visitor = self.visitors.get(key)
+        if visitor is None:
+            visitor = Visitor()
+            visitor.ip_address = entry.ip
+            visitor.user_agent = entry.user_agent
+            # Stable across replays and worker processes
+            visitor.unique_id = utils.generate_hash(key) & 0x7fffffff
+            visitor.first_visit_timestamp = entry.timestamp
+            visitor.previous_visit_timestamp = entry.timestamp
+            visitor.current_visit_timestamp = entry.timestamp
+            self.visitors.set(key, visitor)
+
+        session = self.sessions.hit(key, visitor, now=entry.timestamp)
+
+        page = Page(entry.path)
+        page.referrer = entry.referrer
+
+        request = PageViewRequest(self.tracker.config, self.tracker, visitor, session, page)
+        if self.dry_run:
+            request.build_http_request()
+        else:
+            request.fire()
+
+
+def _build_tracker(options):
+    config = Config()
+    if options.get('endpoint'):
+        config.endpoint = options['endpoint']
+    # Failed hits get logged and counted by the caller of Replayer.track()
+    config.error_severity = Config.ERROR_SEVERITY_RAISE
+    return Tracker(options['account_id'], options['domain_name'], config)
+
+
+def _track(replayer, entry):
+    '''Tracks entry, returns whether that succeeded.'''
+    try:
+        replayer.track(entry)
+        return True
+    except Exception as e:
+        logger.warning('Replaying %s %s failed: %s', entry.ip, entry.path, e)
+        return False
+
+
+def _worker(inbox, results, options):
+    replayer = Replayer(_build_tracker(options), options.get('dry_run', False))
+    hits = failed = 0
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        for entry in chunk:
+            if _track(replayer, LogEntry(*entry)):
+                hits += 1
+            else:
+                failed += 1
+    results.put((hits, failed))
+
+
+def _check_alive(process):
+    if not process.is_alive():
+        raise WorkerError('Replay worker process exited with code %s.' % process.exitcode)
+
+
+def _put(inbox, process, chunk):
+    '''Hands chunk to a worker process, raises WorkerError if it died meanwhile.'''
+    while True:
+        try:
+            inbox.put(chunk, timeout=WORKER_POLL_INTERVAL)
+            return
+        except Full:
+            _check_alive(process)
+
+
+def _collect(results, processes):
+    '''Returns the summed up (hits, failed) of all worker processes, raises WorkerError if one died.'''
+    hits = failed = 0
+    for i in range(len(processes)):
+        ended = False
+        while True:
+            try:
+                worker_hits, worker_failed = results.get(timeout=WORKER_POLL_INTERVAL)
+                break
+            except Empty:
+                if not (any(process.exitcode for process in processes) or
+                        all(process.exitcode is not None for process in processes)):
+                    continue
+                # Give results sent right before exiting one more poll interval
+                if ended:
+                    codes = [process.exitcode for process in processes]
+                    raise WorkerError('Replay worker process exited without results, exit codes %s.' % codes)
+                ended = True
+        hits += worker_hits
+        failed += worker_failed
+    return hits, failed
+
+
+def replay(lines, options, workers=1, progress=None):
+    '''
+    Replays the pageviews of the given access log lines and returns a ReplayResult.
+    options is a dict with "account_id", "domain_name" and optionally "endpoint",
+    "dry_run", "min_status" and "max_status". progress, if given, is called with
+    the amount of lines read so far every CHUNK_SIZE lines.
+
+    Raises WorkerError if a worker process dies, as the amount of hits it replayed is lost.
+    '''
+    started = time.time()
+    entries = parse_lines(lines, options.get('min_status', 200), options.get('max_status', 399))
+    lines = skipped = 0
+
+    if workers <= 1:
+        replayer = Replayer(_build_tracker(options), options.get('dry_run', False))
+        hits = failed = 0
+        for entry in entries:
+            lines += 1
+            if progress is not None and lines % CHUNK_SIZE == 0:
+                progress(lines)
+            if entry is None:
+                skipped += 1
+                continue
+            if _track(replayer, entry):
+                hits += 1
+            else:
+                failed += 1
+        return ReplayResult(lines, hits, skipped, time.time() - started, failed)
+
+    # Bounded queues keep memory flat however large the logs are
+    inboxes = [multiprocessing.Queue(8) for i in range(workers)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_worker, args=(inbox, results, options))
+                 for inbox in inboxes]
+    for process in processes:
+        process.daemon = True
+        process.start()
+
+    chunks = [[] for i in range(workers)]
+    try:
+        for entry in entries:
+            lines += 1
+            if progress is not None and lines % CHUNK_SIZE == 0:
+                progress(lines)
+            if entry is None:
+                skipped += 1
+                continue
+
+            shard = zlib.crc32(visitor_key(entry).encode('utf-8')) % workers
+            chunk = chunks[shard]
+            chunk.append(tuple(entry))
+            if len(chunk) >= CHUNK_SIZE:
+                _put(inboxes[shard], processes[shard], chunk)
+                chunks[shard] = []
+
+        for inbox, process, chunk in zip(inboxes, processes, chunks):
+            if chunk:
+                _put(inbox, process, chunk)
+            _put(inbox, process, None)
+
+        hits, failed = _collect(results, processes)
+    except BaseException:
+        for inbox, process in zip(inboxes, processes):
+            # Chunks nobody is going to read must not block the exit of this process
+            inbox.cancel_join_thread()
+            process.terminate()
+        raise
+
+    for process in processes:
+        process.join()
+    return ReplayResult(lines, hits, skipped, time.time() - started, failed)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pyga', description='Google Analytics: Server Side tools.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('replay', help='Replay the pageviews of access logs.')
+    command.add_argument('account_id', help='Google Analytics account ID, like UA-12345-1')
+    command.add_argument('domain_name', help='Domain name of the tracked site')
+    command.add_argument('paths', nargs='+', metavar='LOG',
+                         help='Access log in "combined" format, .gz files and - for stdin allowed')
+    command.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                         help='Amount of worker processes (default: amount of CPUs)')
+    command.add_argument('--endpoint', help='URL to send hits to instead of the GA endpoint')
+    command.add_argument('--min-status', type=int, default=200,
+                         help='Lowest response status of replayed requests (default: 200)')
+    command.add_argument('--max-status', type=int, default=399,
+                         help='Highest response status of replayed requests (default: 399)')
+    command.add_argument('-n', '--dry-run', action='store_true',
+                         help='Build the hits without sending them')
+    command.add_argument('-q', '--quiet', action='store_true', help='Do not report progress')
+
+    command = commands.add_parser('upload', help='Send the hits of export files.')
+    command.add_argument('directory', help='Directory of the export files')
+    command.add_argument('-w', '--workers', type=int, default=4,
+                         help='Amount of threads sending concurrently (default: 4)')
+    command.add_argument('--keep', action='store_true',
+                         help='Rename sent files to <name>.done instead of removing them')
+
+    command = commands.add_parser('drain', help='Send the hits of a ring buffer until stopped.')
+    command.add_argument('path', help='Ring buffer file, created if missing')
+    command.add_argument('--size', type=int, default=8 * 1024 * 1024,
+                         help='Capacity in bytes of a newly created ring buffer (default: 8 MiB)')
+    command.add_argument('--interval', type=float, default=0.1,
+                         help='Seconds to wait once the ring buffer is empty (default: 0.1)')
+    return parser
+
+
+def upload(args):
+    config = Config()
+    config.retry_attempts = 2
+    uploader = ExportUploader(args.directory, lambda request: send_http_request(config, request),
+                              args.workers, keep=args.keep)
+    started = time.time()
+    result = uploader.upload()
+    print('%s hits sent (%.0f hits/s), %s failed' % (
+        result.sent, result.sent / max(time.time() - started, 1e-6), result.failed))
+    return 1 if result.failed else 0
+
+
+def drain(args):
+    config = Config()
+    config.retry_attempts = 2
+    sender = RingBufferSender(RingBuffer(args.path, args.size),
+                              lambda request: send_http_request(config, request), args.interval)
+    try:
+        sender.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    if args.command == 'upload':
+        return upload(args)
+    elif args.command == 'drain':
+        return drain(args)
+
+    options = {
+        'account_id': args.account_id,
+        'domain_name': args.domain_name,
+        'endpoint': args.endpoint,
+        'dry_run': args.dry_run,
+        'min_status': args.min_status,
+        'max_status': args.max_status,
+    }
+
+    started = time.time()
+
+    def progress(lines):
+        if lines % (CHUNK_SIZE * 200) == 0:
+            print('%s lines, %.0f lines/s' % (lines, lines / max(time.time() - started, 1e-6)),
+                  file=sys.stderr)
+
+    try:
+        result = replay(read_lines(args.paths), options, args.workers, None if args.quiet else progress)
+    except WorkerError as e:
+        logger.error('%s', e)
+        return 1
+
+    seconds = max(result.seconds, 1e-6)
+    print('%s lines (%.0f lines/s), %s hits (%.0f hits/s), %s failed, %s lines skipped' % (
+        result.lines, result.lines / seconds, result.hits, result.hits / seconds, result.failed, result.skipped))
+    return 1 if result.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+STRING_LENGTH = struct.Struct('>H')
+COUNT = struct.Struct('>I')
+
+# String length marking a None value
+NONE_LENGTH = 0xffff
+
+
+class RecordCodec(object):
+    '''
+    Compact, versioned binary layout for the state of an entity:
+
+        version (1 byte), None bitmap of the integer fields (1 byte),
+        integer fields (4 bytes each, unsigned, big endian),
+        string fields (2 bytes length + UTF-8, length 0xffff for None)
+
+    Records are self-delimiting, so several of them can be concatenated.
+
+    Properties:
+    version -- Format version written into and expected in every record
+    int_fields -- Sequence of (name, type) pairs; values are stored as unsigned
+                  32-bit integers and converted back with type (e.g. int or bool)
+    str_fields -- Sequence of names of text fields
+
+    '''
+    def __init__(self, version, int_fields, str_fields):
+        int_fields = tuple(int_fields)
+        if len(int_fields) > 8:
+            raise ValueError('A record can have at most 8 integer fields.')
+
+        self.version = version
+        self.int_fields = int_fields
+        self.str_fields = tuple(str_fields)
+        self.header = struct.Struct('>BB%sI' % len(self.int_fields))
+
+    def encode(self, state):
+        '''Encodes a dict holding (at least) all fields into bytes.'''
+        ints = []
+        nones = 0
+        for i, (name, typ) in enumerate(self.int_fields):
+            value = state.get(name)
+            if value is None:
+                nones |= 1 << i
+                value = 0
+            ints.append(int(value))
+
+        try:
+            chunks = [self.header.pack(self.version, nones, *ints)]
+        except struct.error:
+            raise ValueError('Integer fields have to be between 0 and 0xffffffff: %s' % (ints,))
+
+        for name in self.str_fields:
+            value = state.get(name)
+            if value is None:
+                chunks.append(STRING_LENGTH.pack(NONE_LENGTH))
+                continue
+
+            if not isinstance(value, bytes):
+                value = ('%s' % value).encode('utf-8')
+            if len(value) >= NONE_LENGTH:
+                raise ValueError('Field "%s" is too long to be encoded.' % name)
+            chunks.append(STRING_LENGTH.pack(len(value)))
+            chunks.append(value)
+
+        return b''.join(chunks)
+
+    def decode(self, data, offset=0):
+        '''Decodes the record at offset, returns the state dict and the offset following the record.'''
+        try:
+            values = self.header.unpack_from(data, offset)
+        except struct.error:
+            raise ValueError('Truncated record.')
+
+        version, nones = values[0], values[1]
+        if version != self.version:
+            raise ValueError('Unsupported record version %s, expected %s.' % (version, self.version))
+        offset += self.header.size
+
+        state = {}
+        for i, ((name, typ), value) in enumerate(zip(self.int_fields, values[2:])):
+            state[name] = None if nones & (1 << i) else typ(value)
+
+        for name in self.str_fields:
+            try:
+                length, = STRING_LENGTH.unpack_from(data, offset)
+            except struct.error:
+                raise ValueError('Truncated record.')
+            offset += STRING_LENGTH.size
+            if length == NONE_LENGTH:
+                state[name] = None
+                continue
+
+            value = data[offset:offset + length]
+            if len(value) < length:
+                raise ValueError('Truncated record.')
+            state[name] = value.decode('utf-8')
+            offset += length
+
+        return state, offset
+
+    def encode_many(self, states):
+        '''Encodes a sequence of state dicts into a single payload.'''
+        states = list(states)
+        return COUNT.pack(len(states)) + b''.join(self.encode(state) for state in states)
+
+    def decode_many(self, data):
+        '''Decodes a payload produced by encode_many(), returns a list of state dicts.'''
+        try:
+            count, = COUNT.unpack_from(data, 0)
+        except struct.error:
+            raise ValueError('Truncated record.')
+
+        offset = COUNT.size
+        states = []
+        for i in range(count):
+            state, offset = self.decode(data, offset)
+            states.append(state)
+        return states
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import select
+import socket
+import threading
+import time
+from collections import deque
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib import getproxies, proxy_bypass
+    from urllib2 import HTTPError
+    from urlparse import urlsplit
+except ImportError as e:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.error import HTTPError
+    from urllib.parse import urlsplit
+    from urllib.request import getproxies, proxy_bypass
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection(object):
+    '''
+    Wraps a persistent HTTP/1.1 connection with the bookkeeping needed
+    to decide whether it may be reused.
+
+    Properties:
+    connection -- httplib/http.client connection object
+    request_count -- Amount of requests sent over this connection so far
+    last_used -- time.time() of the moment the connection was returned to the pool
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+        self.request_count = 0
+        self.last_used = time.time()
+
+    def is_stale(self, idle_timeout):
+        '''
+        A connection is stale if it was idle for too long or if the server
+        already closed its side (an idle socket must never be readable).
+        '''
+        if idle_timeout and time.time() - self.last_used > idle_timeout:
+            return True
+
+        sock = self.connection.sock
+        if sock is None:
+            return True
+
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (ValueError, socket.error):
+            return True
+
+        return bool(readable)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool(object):
+    '''
+    A per endpoint host pool of persistent HTTP/1.1 connections, used by
+    GIFRequest instead of opening a new connection for each and every hit.
+
+    Properties:
+    maxsize -- Maximum amount of idle connections kept per host. When all of them
+        are in use, extra connections are opened and closed after use.
+    idle_timeout -- Seconds an idle connection may be kept before it is discarded.
+    max_requests -- Amount of requests after which a connection gets recycled,
+        None or 0 for no limit.
+    proxies -- Dict of scheme to proxy URL, like urllib's getproxies() returns,
+        which it defaults to. The pool doesn't talk to proxies, see is_proxied().
+
+    '''
+    def __init__(self, maxsize=10, idle_timeout=30, max_requests=100, proxies=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.proxies = getproxies() if proxies is None else proxies
+        self.__pools = {}
+        self.__lock = threading.Lock()
+
+    def is_proxied(self, url):
+        '''Whether url has to go through one of the proxies, so urllib should send it instead of the pool.'''
+        if not self.proxies:
+            return False
+
+        parts = urlsplit(url)
+        return parts.scheme in self.proxies and not proxy_bypass(parts.netloc)
+
+    def urlopen(self, request, timeout=None):
+        '''
+        Sends a urllib Request object over a pooled connection and returns the
+        already read response. A failure on a reused connection is retried once
+        on a fresh connection, as the server may have closed it in the meantime.
+        Like urlopen, raises HTTPError for error status codes; redirects are
+        not followed but raise HTTPError as well.
+        '''
+        parts = urlsplit(request.get_full_url())
+        key = (parts.scheme, parts.netloc)
+        url = parts.path or '/'
+        if parts.query:
+            url = '%s?%s' % (url, parts.query)
+
+        body = request.data if hasattr(request, 'data') else request.get_data()
+        if body is not None and not isinstance(body, bytes):
+            body = body.encode('utf-8')
+
+        method = 'POST' if body is not None else 'GET'
+        headers = dict(request.header_items())
+
+        conn, reused = self._get_connection(key, timeout)
+        try:
+            response = self._do_request(conn, method, url, body, headers)
+        except (HTTPException, socket.error) as e:
+            conn.close()
+            if not reused:
+                raise
+            logger.debug('Reconnecting to %s after error on reused connection: %s', key[1], e)
+            conn, reused = self._new_connection(key, timeout), False
+            try:
+                response = self._do_request(conn, method, url, body, headers)
+            except Exception:
+                conn.close()
+                raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put_connection(key, conn)
+
+        if response.status >= 300:
+            raise HTTPError(request.get_full_url(), response.status,
+                            response.reason, response.msg, None)
+        return response
+
+    def clear(self):
+        '''Closes all idle connections.'''
+        with self.__lock:
+            pools, self.__pools = self.__pools, {}
+
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+    def _do_request(self, conn, method, url, body, headers):
+        conn.request_count += 1
+        conn.connection.request(method, url, body, headers)
+        response = conn.connection.getresponse()
+        # The body has to be consumed before the connection can be reused
+        response.body = response.read()
+        return response
+
+    def _get_connection(self, key, timeout):
+        while True:
+            with self.__lock:
+                idle = self.__pools.get(key)
+                conn = idle.pop() if idle else None
+
+            if conn is None:
+                return self._new_connection(key, timeout), False
+
+            if conn.is_stale(self.idle_timeout):
+                conn.close()
+                continue
+
+            conn.connection.sock.settimeout(timeout)
+            return conn, True
+
+    def _new_connection(self, key, timeout):
+        scheme, netloc = key
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+
+        if scheme == 'https':
+            connection = HTTPSConnection(netloc, timeout=timeout)
+        else:
+            connection = HTTPConnection(netloc, timeout=timeout)
+
+        return PooledConnection(connection)
+
+    def _put_connection(self, key, conn):
+        if self.max_requests and conn.request_count >= self.max_requests:
+            conn.close()
+            return
+
+        conn.last_used = time.time()
+        with self.__lock:
+            idle = self.__pools.setdefault(key, deque())
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+
+        conn.close()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import namedtuple
+from pyga import utils
+from pyga.entities import Campaign, Session, Visitor
+try:
+    from urllib import unquote_plus
+except ImportError as e:
+    from urllib.parse import unquote_plus
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+COOKIE_CACHE_SIZE = 4096
+
+GACookies = namedtuple('GACookies', 'visitor session campaign')
+
+# Campaign type implied by the "utmcmd" (medium) key of the "__utmz" cookie
+UTMZ_MEDIUM_TYPES = {
+    '(none)': Campaign.TYPE_DIRECT,
+    'organic': Campaign.TYPE_ORGANIC,
+    'referral': Campaign.TYPE_REFERRAL,
+}
+
+# Parsed "__utma" and "__utmz" values, returning visitors send the same ones over and over
+_utma_cache = utils.LRUCache(COOKIE_CACHE_SIZE)
+_utmz_cache = utils.LRUCache(COOKIE_CACHE_SIZE)
+
+
+def parse_utma(utma):
+    '''
+    Parses a "__utma" cookie value into a (unique_id, first_visit_timestamp,
+    previous_visit_timestamp, current_visit_timestamp, visit_count) tuple.
+    '''
+    parts = utma.split('.')
+    if len(parts) != 6:
+        raise ValueError('The given "__utma" cookie value is invalid.')
+
+    unique_id = int(parts[1])
+    if unique_id < 0 or unique_id > 0x7fffffff:
+        raise ValueError('The given "__utma" cookie value has an invalid visitor ID.')
+
+    return (
+        unique_id,
+        utils.parse_ga_timestamp(parts[2]),
+        utils.parse_ga_timestamp(parts[3]),
+        utils.parse_ga_timestamp(parts[4]),
+        int(parts[5]),
+    )
+
+
+def parse_utmb(utmb):
+    '''Parses a "__utmb" cookie value into a (track_count, start_timestamp) tuple.'''
+    parts = utmb.split('.')
+    if len(parts) != 4:
+        raise ValueError('The given "__utmb" cookie value is invalid.')
+
+    return int(parts[1]), utils.parse_ga_timestamp(parts[3])
+
+
+def parse_utmz(utmz):
+    '''
+    Parses a "__utmz" cookie value into a (creation_timestamp, response_count,
+    campaign type, ((property, value), ...)) tuple.
+    '''
+    parts = utmz.split('.', 4)
+    if len(parts) != 5:
+        raise ValueError('The given "__utmz" cookie value is invalid.')
+
+    fields = []
+    typ = None
+    for param in parts[4].split(Campaign.CAMPAIGN_DELIMITER):
+        key, val = param.split('=')
+        try:
+            name = Campaign.UTMZ_PARAM_MAP[key]
+        except KeyError:
+            continue
+
+        val = unquote_plus(val)
+        if name == 'medium':
+            typ = UTMZ_MEDIUM_TYPES.get(val)
+        fields.append((name, val))
+
+    return utils.parse_ga_timestamp(parts[1]), int(parts[3]), typ, tuple(fields)
+
+
+def parse_cookie_header(header, use_cache=True):
+    '''
+    Builds Visitor, Session and Campaign objects from the "__utma", "__utmb" and
+    "__utmz" cookies of a raw HTTP Cookie header in a single pass over the header.
+
+    Returns a GACookies (visitor, session, campaign) tuple, with None in place
+    of objects whose cookie is missing or invalid. Parsed "__utma" and "__utmz"
+    values are cached unless use_cache is False; the returned objects are
+    always new ones, so they can be changed freely.
+    '''
+    utma = utmb = utmz = None
+    for cookie in header.split(';'):
+        name, sep, value = cookie.partition('=')
+        if not sep:
+            continue
+
+        name = name.strip()
+        if name == '__utma':
+            utma = value.strip().strip('"')
+        elif name == '__utmb':
+            utmb = value.strip().strip('"')
+        elif name == '__utmz':
+            utmz = value.strip().strip('"')
+
+    visitor = session = campaign = None
+
+    if utma:
+        values = _parse_cached(parse_utma, _utma_cache if use_cache else None, utma)
+        if values is not None:
+            visitor = Visitor()
+            (visitor.unique_id, visitor.first_visit_timestamp, visitor.previous_visit_timestamp,
+             visitor.current_visit_timestamp, visitor.visit_count) = values
+
+    if utmb:
+        values = _parse_cached(parse_utmb, None, utmb)
+        if values is not None:
+            session = Session()
+            session.track_count, session.start_timestamp = values
+
+    if utmz:
+        values = _parse_cached(parse_utmz, _utmz_cache if use_cache else None, utmz)
+        if values is not None:
+            campaign = Campaign(values[2])
+            campaign.creation_timestamp, campaign.response_count = values[0], values[1]
+            for name, val in values[3]:
+                setattr(campaign, name, val)
+
+    return GACookies(visitor, session, campaign)
+
+
+def clear_cache():
+    '''Empties the caches of parsed "__utma" and "__utmz" values.'''
+    _utma_cache.clear()
+    _utmz_cache.clear()
+
+
+def _parse_cached(parse, cache, value):
+    if cache is not None:
+        values = cache.get(value)
+        if values is not None:
+            return values
+
+    try:
+        values = parse(value)
+    except (ValueError, OverflowError) as e:
+        logger.debug('Ignoring invalid cookie value %r: %s', value, e)
+        return None
+
+    if cache is not None:
+        cache.set(value, values)
+    return values
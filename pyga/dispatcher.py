@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from pyga.queues import Empty, HitQueue
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher(object):
+    '''
+    Sends fully built hits from a bounded in-process queue using background
+    worker threads, so that the caller never waits for the network.
+
+    Properties:
+    send -- Callable which actually sends a single hit
+    queue -- HitQueue holding the hits waiting to be sent
+    workers -- Amount of worker threads draining the queue
+    exit_timeout -- Seconds (float allowed) close() waits for the workers on
+        interpreter exit, None to wait until everything queued is sent
+    close_on_exit -- Whether to register close() to run on interpreter exit,
+        disabled by owners closing the dispatcher themselves
+
+    '''
+    def __init__(self, send, queue_size=1000, workers=1, overflow=HitQueue.OVERFLOW_DROP_NEWEST, exit_timeout=10,
+                 close_on_exit=True):
+        self.send = send
+        self.queue = HitQueue(queue_size, overflow)
+        self.workers = workers
+        self.exit_timeout = exit_timeout
+        self.close_on_exit = close_on_exit
+        self.__threads = []
+        self.__lock = threading.Lock()
+
+    @property
+    def dropped(self):
+        '''Amount of hits dropped because the queue was full or closed.'''
+        return self.queue.dropped
+
+    def submit(self, hit):
+        '''Hands a hit over to the workers, returns False if it had to be dropped.'''
+        if not self.__threads:
+            self.start()
+
+        return self.queue.put(hit)
+
+    def start(self):
+        with self.__lock:
+            if self.__threads or self.queue.closed:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.__work,
+                                          name='pyga-dispatcher-%s' % i)
+                thread.daemon = True
+                thread.start()
+                self.__threads.append(thread)
+
+            if self.close_on_exit:
+                atexit.register(self.close, self.exit_timeout)
+
+    def close(self, timeout=None):
+        '''
+        Stops accepting hits and waits up to timeout seconds in total for the
+        workers to send out everything already queued. Workers still busy
+        after that are left behind, they don't keep the interpreter alive.
+        '''
+        self.queue.close()
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in self.__threads:
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+
+    def __work(self):
+        while True:
+            try:
+                hit = self.queue.get()
+            except Empty:
+                return
+
+            try:
+                self.send(hit)
+            except Exception as e:
+                logger.warning('Sending hit failed: %s', e)
+
+
+FlushResult = namedtuple('FlushResult', 'sent failed dropped')
+
+
+def flush(hits, send, workers=4, timeout=None):
+    '''
+    Sends the given hits concurrently using a pool of worker threads.
+    Hits not sent within timeout seconds are given up on.
+    Returns a FlushResult with the amount of sent, failed and dropped hits.
+    '''
+    pending = deque(hits)
+    total = len(pending)
+    counts = {'sent': 0, 'failed': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            try:
+                hit = pending.popleft()
+            except IndexError:
+                return
+
+            try:
+                send(hit)
+            except Exception as e:
+                logger.warning('Sending hit failed: %s', e)
+                key = 'failed'
+            else:
+                key = 'sent'
+
+            with lock:
+                if not stop.is_set():
+                    counts[key] += 1
+
+    threads = []
+    for i in range(min(workers, total)):
+        thread = threading.Thread(target=work, name='pyga-flush-%s' % i)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    deadline = None if timeout is None else time.time() + timeout
+    for thread in threads:
+        thread.join(None if deadline is None else max(deadline - time.time(), 0))
+
+    with lock:
+        stop.set()
+        sent, failed = counts['sent'], counts['failed']
+
+    result = FlushResult(sent, failed, total - sent - failed)
+    if result.dropped:
+        logger.warning('Dropped %s hits which could not be sent in time.', result.dropped)
+    return result
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
-from operator import itemgetter
+from operator import attrgetter
 from pyga import utils
 from pyga import exceptions
+from pyga.codec import RecordCodec
 try:
     from urlparse import urlparse
     from urllib import unquote_plus
@@ -16,13 +17,119 @@ __author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
 __license__ = "Simplified BSD"
 
 
-class Campaign(object):
+def datetime_view(name, doc=None):
+    '''
+    Property exposing the integer epoch seconds attribute "name" as naive UTC datetime.
+    Setting it accepts datetime objects as well as epoch seconds.
+    '''
+    def fget(self):
+        timestamp = getattr(self, name)
+        if timestamp is None:
+            return None
+        return utils.timestamp_to_datetime(timestamp)
+
+    def fset(self, value):
+        if isinstance(value, datetime):
+            value = utils.datetime_to_timestamp(value)
+        setattr(self, name, value)
+
+    return property(fget, fset, doc=doc)
+
+
+def field(name, validate=None, changed=None, doc=None):
+    '''
+    Property for the public attribute "name" stored in the slot "_name".
+    Reads are served without running any Python level code; writes call
+    validate(value), which raises on invalid values, and changed(instance).
+    '''
+    slot = '_%s' % name
+
+    def fset(self, value):
+        if validate is not None:
+            validate(value)
+        object.__setattr__(self, slot, value)
+        if changed is not None:
+            changed(self)
+
+    return property(attrgetter(slot), fset, doc=doc)
+
+
+class Entity(object):
+    '''
+    Base class of all entities. Entities use __slots__ instead of a per-instance
+    __dict__ and get pickled as a dict of their FIELDS. Former versions kept
+    times as datetime attributes, which are still pickled as LEGACY_FIELDS,
+    so objects stored by either version can be loaded by both.
+
+    Entities having a CODEC (see pyga.codec.RecordCodec) can also be stored in
+    a compact binary format using to_bytes() and from_bytes().
+    '''
+    __slots__ = ()
+    FIELDS = ()
+    LEGACY_FIELDS = ()
+    CODEC = None
+
+    def __getstate__(self):
+        state = self._fields_state()
+        for name in self.LEGACY_FIELDS:
+            state[name] = getattr(self, name)
+        return state
+
+    def _fields_state(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    def to_bytes(self):
+        '''Encodes this object with its CODEC.'''
+        return self.CODEC.encode(self._fields_state())
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Builds an object from bytes produced by to_bytes().'''
+        state, offset = cls.CODEC.decode(data)
+        if offset != len(data):
+            raise ValueError('Unexpected trailing data after record.')
+        return cls.__from_state(state)
+
+    @classmethod
+    def many_to_bytes(cls, entities):
+        '''Encodes a sequence of objects into one payload.'''
+        return cls.CODEC.encode_many(entity._fields_state() for entity in entities)
+
+    @classmethod
+    def many_from_bytes(cls, data):
+        '''Builds a list of objects from a payload produced by many_to_bytes().'''
+        return [cls.__from_state(state) for state in cls.CODEC.decode_many(data)]
+
+    @classmethod
+    def __from_state(cls, state):
+        entity = cls.__new__(cls)
+        entity.__setstate__(state)
+        return entity
+
+    def __setstate__(self, state):
+        self._init_slots()
+        for name, value in state.items():
+            try:
+                setattr(self, name, value)
+            except AttributeError:
+                # Not an attribute (anymore)
+                continue
+
+    def _init_slots(self):
+        '''Gives every field a value, so that unpickled objects are complete.'''
+        for name in self.FIELDS:
+            object.__setattr__(self, name, None)
+
+
+class Campaign(Entity):
     '''
     A representation of Campaign
 
     Properties:
     _type -- See TYPE_* constants, will be mapped to "__utmz" parameter.
-    creation_time --  Time of the creation of this campaign, will be mapped to "__utmz" parameter.
+    creation_timestamp -- Time of the creation of this campaign in epoch seconds,
+                          will be mapped to "__utmz" parameter.
+    creation_time -- creation_timestamp as UTC datetime.
     response_count -- Response Count, will be mapped to "__utmz" parameter.
         Is also used to determine whether the campaign is new or repeated,
         which will be mapped to "utmcn" and "utmcr" parameters.
@@ -60,10 +167,18 @@ class Campaign(object):
         'utmctr': 'term',
         'utmcct': 'content',
     }
+    UTMZ_PARAM_ORDER = ('utmcid', 'utmcsr', 'utmgclid', 'utmdclid', 'utmccn', 'utmcmd', 'utmctr', 'utmcct')
+
+    FIELDS = ('_type', 'creation_timestamp', 'response_count', 'id', 'source', 'g_click_id',
+              'd_click_id', 'name', 'medium', 'term', 'content')
+    LEGACY_FIELDS = ('creation_time',)
+    __slots__ = ('_type', '_creation_timestamp', 'response_count', '_id', '_source', '_g_click_id',
+                 '_d_click_id', '_name', '_medium', '_term', '_content', '_utmz_cache')
 
     def __init__(self, typ):
+        self._utmz_cache = None
         self._type = None
-        self.creation_time = None
+        self.creation_timestamp = None
         self.response_count = 0
         self.id = None
         self.source = None
@@ -92,7 +207,47 @@ class Campaign(object):
             else:
                 self._type = None
 
-        self.creation_time = datetime.utcnow()
+        self.creation_timestamp = utils.get_timestamp()
+
+    def __clear_utmz_cache(self):
+        self._utmz_cache = None
+
+    creation_timestamp = field('creation_timestamp', changed=__clear_utmz_cache)
+    creation_time = datetime_view('creation_timestamp')
+    id = field('id', changed=__clear_utmz_cache)
+    source = field('source', changed=__clear_utmz_cache)
+    g_click_id = field('g_click_id', changed=__clear_utmz_cache)
+    d_click_id = field('d_click_id', changed=__clear_utmz_cache)
+    name = field('name', changed=__clear_utmz_cache)
+    medium = field('medium', changed=__clear_utmz_cache)
+    term = field('term', changed=__clear_utmz_cache)
+    content = field('content', changed=__clear_utmz_cache)
+
+    def _init_slots(self):
+        super(Campaign, self)._init_slots()
+        self._utmz_cache = None
+
+    def get_utmz_tail(self):
+        '''
+        The part of the "__utmz" cookie value which does not change from hit to hit:
+        creation timestamp and campaign tracking fields. Returns a (creation, tracking)
+        tuple, cached until one of the underlying properties changes.
+        '''
+        cache = self._utmz_cache
+        if cache is None:
+            tracking = []
+            for key in Campaign.UTMZ_PARAM_ORDER:
+                val = getattr(self, Campaign.UTMZ_PARAM_MAP[key])
+                if val:
+                    # Only spaces and pluses get escaped in gaforflash and ga.js, so we do the same
+                    tracking.append('%s=%s' % (key, val.replace('+', '%20').replace(' ', '%20')))
+
+            cache = (
+                self.creation_timestamp,
+                Campaign.CAMPAIGN_DELIMITER.join(tracking).rstrip(Campaign.CAMPAIGN_DELIMITER),
+            )
+            self._utmz_cache = cache
+        return cache
 
     def validate(self):
         if not self.source:
@@ -112,7 +267,7 @@ class Campaign(object):
         if len(parts) != 5:
             raise ValueError('The given "__utmz" cookie value is invalid.')
 
-        self.creation_time = utils.convert_ga_timestamp(parts[1])
+        self.creation_timestamp = utils.parse_ga_timestamp(parts[1])
         self.response_count = int(parts[3])
         params = parts[4].split(Campaign.CAMPAIGN_DELIMITER)
 
@@ -127,7 +282,7 @@ class Campaign(object):
         return self
 
 
-class CustomVariable(object):
+class CustomVariable(Entity):
     '''
     Represent a Custom Variable
 
@@ -148,6 +303,9 @@ class CustomVariable(object):
     SCOPE_SESSION = 2
     SCOPE_PAGE = 3
 
+    FIELDS = ('index', 'name', 'value', 'scope')
+    __slots__ = ('_index', 'name', 'value', '_scope')
+
     def __init__(self, index=None, name=None, value=None, scope=3):
         self.index = index
         self.name = name
@@ -156,19 +314,19 @@ class CustomVariable(object):
         if scope:
             self.scope = scope
 
-    def __setattr__(self, name, value):
-        if name == 'scope':
-            if value and value not in range(1, 4):
-                raise ValueError('Custom Variable scope has to be one of the 1,2 or 3')
+    def __validate_scope(value):
+        if value and value not in range(1, 4):
+            raise ValueError('Custom Variable scope has to be one of the 1,2 or 3')
 
-        if name == 'index':
-            # Custom Variables are limited to five slots officially, but there seems to be a
-            # trick to allow for more of them which we could investigate at a later time (see
-            # http://analyticsimpact.com/2010/05/24/get-more-than-5-custom-variables-in-google-analytics/
-            if value and (value < 0 or value > 5):
-                raise ValueError('Custom Variable index has to be between 1 and 5.')
+    def __validate_index(value):
+        # Custom Variables are limited to five slots officially, but there seems to be a
+        # trick to allow for more of them which we could investigate at a later time (see
+        # http://analyticsimpact.com/2010/05/24/get-more-than-5-custom-variables-in-google-analytics/
+        if value and (value < 0 or value > 5):
+            raise ValueError('Custom Variable index has to be between 1 and 5.')
 
-        object.__setattr__(self, name, value)
+    index = field('index', __validate_index)
+    scope = field('scope', __validate_scope)
 
     def validate(self):
         '''
@@ -183,7 +341,7 @@ class CustomVariable(object):
             raise exceptions.ValidationError('Custom Variable combined name and value length must not be larger than 128 bytes.')
 
 
-class Event(object):
+class Event(Entity):
     '''
     Represents an Event
     https://developers.google.com/analytics/devguides/collection/gajs/eventTrackerGuide
@@ -201,6 +359,8 @@ class Event(object):
                       will not be used in bounce rate calculations.
                       (default False)
     '''
+    FIELDS = ('category', 'action', 'label', 'value', 'noninteraction')
+    __slots__ = FIELDS
 
     def __init__(self, category=None, action=None, label=None, value=None, noninteraction=False):
         self.category = category
@@ -217,7 +377,7 @@ class Event(object):
             raise exceptions.ValidationError('Events, at least need to have a category and action defined.')
 
 
-class Item(object):
+class Item(Entity):
     '''
     Represents an Item in Transaction
 
@@ -230,6 +390,8 @@ class Item(object):
     quantity -- Unit Quantity, will be mapped to "utmiqt" parameter
 
     '''
+    FIELDS = ('order_id', 'sku', 'name', 'variation', 'price', 'quantity')
+    __slots__ = FIELDS
 
     def __init__(self):
         self.order_id = None
@@ -244,7 +406,7 @@ class Item(object):
             raise exceptions.ValidationError('sku/product is a required parameter')
 
 
-class Page(object):
+class Page(Entity):
     '''
     Contains all parameters needed for tracking a page
 
@@ -258,6 +420,9 @@ class Page(object):
     '''
     REFERRER_INTERNAL = '0'
 
+    FIELDS = ('path', 'title', 'charset', 'referrer', 'load_time')
+    __slots__ = ('_path', 'title', 'charset', 'referrer', '_load_time')
+
     def __init__(self, path):
         self.path = None
         self.title = None
@@ -268,35 +433,46 @@ class Page(object):
         if path:
             self.path = path
 
-    def __setattr__(self, name, value):
-        if name == 'path':
-            if value and value != '':
-                if value[0] != '/':
-                    raise ValueError('The page path should always start with a slash ("/").')
-        elif name == 'load_time':
-            if value and not isinstance(value, int):
-                raise ValueError('Page load time must be specified in integer milliseconds.')
+    def __validate_path(value):
+        if value and value != '':
+            if value[0] != '/':
+                raise ValueError('The page path should always start with a slash ("/").')
 
-        object.__setattr__(self, name, value)
+    def __validate_load_time(value):
+        if value and not isinstance(value, int):
+            raise ValueError('Page load time must be specified in integer milliseconds.')
 
+    path = field('path', __validate_path)
+    load_time = field('load_time', __validate_load_time)
 
-class Session(object):
+
+class Session(Entity):
     '''
     You should serialize this object and store it in the user session to keep it
     persistent between requests (similar to the "__umtb" cookie of the GA Javascript client).
+    Besides pickle, to_bytes() and from_bytes() give a compact binary representation.
 
     Properties:
     session_id -- A unique per-session ID, will be mapped to "utmhid" parameter
     track_count -- The amount of pageviews that were tracked within this session so far,
                    will be part of the "__utmb" cookie parameter.
                    Will get incremented automatically upon each request
-    start_time -- Timestamp of the start of this new session, will be part of the "__utmb" cookie parameter
+    start_timestamp -- Timestamp of the start of this new session in epoch seconds,
+                       will be part of the "__utmb" cookie parameter
+    start_time -- start_timestamp as UTC datetime.
 
     '''
+    FIELDS = ('session_id', 'track_count', 'start_timestamp')
+    LEGACY_FIELDS = ('start_time',)
+    __slots__ = FIELDS
+    CODEC = RecordCodec(1, ((name, int) for name in FIELDS), ())
+
     def __init__(self):
         self.session_id = utils.get_32bit_random_num()
         self.track_count = 0
-        self.start_time = datetime.utcnow()
+        self.start_timestamp = utils.get_timestamp()
+
+    start_time = datetime_view('start_timestamp')
 
     @staticmethod
     def generate_session_id():
@@ -312,12 +488,12 @@ class Session(object):
             raise ValueError('The given "__utmb" cookie value is invalid.')
 
         self.track_count = int(parts[1])
-        self.start_time = utils.convert_ga_timestamp(parts[3])
+        self.start_timestamp = utils.parse_ga_timestamp(parts[3])
 
         return self
 
 
-class SocialInteraction(object):
+class SocialInteraction(Entity):
     '''
 
     Properties:
@@ -328,6 +504,8 @@ class SocialInteraction(object):
     target -- Optional. A string representing the URL (or resource) which receives the action.
 
     '''
+    FIELDS = ('action', 'network', 'target')
+    __slots__ = FIELDS
 
     def __init__(self, action=None, network=None, target=None):
         self.action = action
@@ -339,7 +517,7 @@ class SocialInteraction(object):
             raise exceptions.ValidationError('Social interactions need to have at least the "network" and "action" attributes defined.')
 
 
-class Transaction(object):
+class Transaction(Entity):
     '''
     Represents parameters for a Transaction call
 
@@ -355,6 +533,9 @@ class Transaction(object):
     items -- @entity.Items in a transaction
 
     '''
+    FIELDS = ('items', 'order_id', 'affiliation', 'total', 'tax', 'shipping', 'city', 'state', 'country')
+    __slots__ = ('items', '_order_id', 'affiliation', 'total', 'tax', 'shipping', 'city', 'state', 'country')
+
     def __init__(self):
         self.items = []
         self.order_id = None
@@ -366,11 +547,11 @@ class Transaction(object):
         self.state = None
         self.country = None
 
-    def __setattr__(self, name, value):
-        if name == 'order_id':
-            for itm in self.items:
-                itm.order_id = value
-        object.__setattr__(self, name, value)
+    def __propagate_order_id(self):
+        for itm in getattr(self, 'items', None) or ():
+            itm.order_id = self._order_id
+
+    order_id = field('order_id', changed=__propagate_order_id)
 
     def validate(self):
         if len(self.items) == 0:
@@ -383,17 +564,26 @@ class Transaction(object):
             self.items.append(item)
 
 
-class Visitor(object):
+class Visitor(Entity):
     '''
     You should serialize this object and store it in the user database to keep it
     persistent for the same user permanently (similar to the "__umta" cookie of
-    the GA Javascript client).
+    the GA Javascript client). Besides pickle, to_bytes() and from_bytes() give a compact
+    binary representation, many_to_bytes() and many_from_bytes() do the same for many visitors.
+    The binary format stores java_enabled as a flag and screen_colour_depth as text.
+
+    Set Visitor.intern_pool to a utils.InternPool to have the INTERNED_FIELDS of all
+    visitors share their strings when extracted from server meta data or deserialized.
 
     Properties:
     unique_id -- Unique user ID, will be part of the "__utma" cookie parameter
-    first_visit_time -- Time of the very first visit of this user, will be part of the "__utma" cookie parameter
-    previous_visit_time -- Time of the previous visit of this user, will be part of the "__utma" cookie parameter
-    current_visit_time -- Time of the current visit of this user, will be part of the "__utma" cookie parameter
+    first_visit_timestamp -- Time of the very first visit of this user in epoch seconds,
+                             will be part of the "__utma" cookie parameter
+    previous_visit_timestamp -- Time of the previous visit of this user in epoch seconds,
+                                will be part of the "__utma" cookie parameter
+    current_visit_timestamp -- Time of the current visit of this user in epoch seconds,
+                               will be part of the "__utma" cookie parameter
+    first_visit_time, previous_visit_time, current_visit_time -- The above as UTC datetime.
     visit_count -- Amount of total visits by this user, will be part of the "__utma" cookie parameter
     ip_address -- IP Address of the end user, will be mapped to "utmip" parameter and "X-Forwarded-For" request header
     user_agent -- User agent string of the end user, will be mapped to "User-Agent" request header
@@ -403,13 +593,29 @@ class Visitor(object):
     screen_colour_depth -- Visitor's screen color depth, will be mapped to "utmsc" parameter
     screen_resolution -- Visitor's screen resolution, will be mapped to "utmsr" parameter
     '''
+    FIELDS = ('unique_id', 'first_visit_timestamp', 'previous_visit_timestamp', 'current_visit_timestamp',
+              'visit_count', 'ip_address', 'user_agent', 'locale', 'flash_version', 'java_enabled',
+              'screen_colour_depth', 'screen_resolution')
+    LEGACY_FIELDS = ('first_visit_time', 'previous_visit_time', 'current_visit_time')
+    __slots__ = ('_unique_id',) + FIELDS[1:]
+    INTERNED_FIELDS = ('user_agent', 'locale', 'flash_version', 'screen_colour_depth', 'screen_resolution')
+    intern_pool = None
+    CODEC = RecordCodec(1, (
+        ('unique_id', int),
+        ('first_visit_timestamp', int),
+        ('previous_visit_timestamp', int),
+        ('current_visit_timestamp', int),
+        ('visit_count', int),
+        ('java_enabled', bool),
+    ), ('ip_address', 'user_agent', 'locale', 'flash_version', 'screen_colour_depth', 'screen_resolution'))
+
     def __init__(self):
-        now = datetime.utcnow()
+        now = utils.get_timestamp()
 
         self.unique_id = None
-        self.first_visit_time = now
-        self.previous_visit_time = now
-        self.current_visit_time = now
+        self.first_visit_timestamp = now
+        self.previous_visit_timestamp = now
+        self.current_visit_timestamp = now
         self.visit_count = 1
         self.ip_address = None
         self.user_agent = None
@@ -419,25 +625,40 @@ class Visitor(object):
         self.screen_colour_depth = None
         self.screen_resolution = None
 
-    def __setattr__(self, name, value):
-        if name == 'unique_id':
-            if value and (value < 0 or value > 0x7fffffff):
-                raise ValueError('Visitor unique ID has to be a 32-bit integer between 0 and 0x7fffffff')
-        object.__setattr__(self, name, value)
+    def __get_unique_id(self):
+        if self._unique_id is None:
+            self.unique_id = self.generate_unique_id()
+        return self._unique_id
+
+    def __set_unique_id(self, value):
+        if value and (value < 0 or value > 0x7fffffff):
+            raise ValueError('Visitor unique ID has to be a 32-bit integer between 0 and 0x7fffffff')
+        self._unique_id = value
+
+    unique_id = property(__get_unique_id, __set_unique_id)
 
-    def __getattribute__(self, name):
-        if name == 'unique_id':
-            tmp = object.__getattribute__(self, name)
-            if tmp is None:
-                self.unique_id = self.generate_unique_id()
-        return object.__getattribute__(self, name)
+    first_visit_time = datetime_view('first_visit_timestamp')
+    previous_visit_time = datetime_view('previous_visit_timestamp')
+    current_visit_time = datetime_view('current_visit_timestamp')
 
     def __getstate__(self):
-        state = self.__dict__
-        if state.get('user_agent') is None:
-            state['unique_id'] = self.generate_unique_id()
+        if self.user_agent is None:
+            self.unique_id = self.generate_unique_id()
 
-        return state
+        return super(Visitor, self).__getstate__()
+
+    def __setstate__(self, state):
+        super(Visitor, self).__setstate__(state)
+        if self.intern_pool is not None:
+            self.intern_strings()
+
+    def intern_strings(self):
+        '''Replaces the INTERNED_FIELDS values with the equal strings from Visitor.intern_pool.'''
+        pool = self.intern_pool
+        for name in self.INTERNED_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, pool.intern(value))
 
     def extract_from_utma(self, utma):
         '''
@@ -449,9 +670,9 @@ class Visitor(object):
             raise ValueError('The given "__utma" cookie value is invalid.')
 
         self.unique_id = int(parts[1])
-        self.first_visit_time = utils.convert_ga_timestamp(parts[2])
-        self.previous_visit_time = utils.convert_ga_timestamp(parts[3])
-        self.current_visit_time = utils.convert_ga_timestamp(parts[4])
+        self.first_visit_timestamp = utils.parse_ga_timestamp(parts[2])
+        self.previous_visit_timestamp = utils.parse_ga_timestamp(parts[3])
+        self.current_visit_timestamp = utils.parse_ga_timestamp(parts[4])
         self.visit_count = int(parts[5])
 
         return self
@@ -467,34 +688,27 @@ class Visitor(object):
                 if key in meta and not ip:
                     ips = meta.get(key, '').split(',')
                     ip = ips[-1].strip()
-                    if not utils.is_valid_ip(ip):
-                        ip = ''
-                    if utils.is_private_ip(ip):
+                    info = utils.classify_ip(ip)
+                    if info is None or info.private:
                         ip = ''
             if ip:
                 self.ip_address = ip
 
+        pool = self.intern_pool
+
         if 'HTTP_USER_AGENT' in meta and meta['HTTP_USER_AGENT']:
-            self.user_agent = meta['HTTP_USER_AGENT']
+            self.user_agent = meta['HTTP_USER_AGENT'] if pool is None else pool.intern(meta['HTTP_USER_AGENT'])
 
         if 'HTTP_ACCEPT_LANGUAGE' in meta and meta['HTTP_ACCEPT_LANGUAGE']:
-            user_locals = []
-            matched_locales = utils.validate_locale(meta['HTTP_ACCEPT_LANGUAGE'])
-            if matched_locales:
-                lang_lst = map((lambda x: x.replace('-', '_')), (i[1] for i in matched_locales))
-                quality_lst = map((lambda x: x and x or 1), (float(i[4] and i[4] or '0') for i in matched_locales))
-                lang_quality_map = map((lambda x, y: (x, y)), lang_lst, quality_lst)
-                user_locals = [x[0] for x in sorted(lang_quality_map, key=itemgetter(1), reverse=True)]
-
-            if user_locals:
-                self.locale = user_locals[0]
+            locale = utils.parse_accept_language(meta['HTTP_ACCEPT_LANGUAGE'])
+            if locale:
+                self.locale = locale if pool is None else pool.intern(locale)
 
         return self
 
     def generate_hash(self):
         '''Generates a hashed value from user-specific properties.'''
-        tmpstr = "%s%s%s" % (self.user_agent, self.screen_resolution, self.screen_colour_depth)
-        return utils.generate_hash(tmpstr)
+        return utils.cached_generate_hash('%s%s%s' % (self.user_agent, self.screen_resolution, self.screen_colour_depth))
 
     def generate_unique_id(self):
         '''Generates a unique user ID from the current user-specific properties.'''
@@ -505,8 +719,8 @@ class Visitor(object):
         Updates the "previousVisitTime", "currentVisitTime" and "visitCount"
         fields based on the given session object.
         '''
-        start_time = session.start_time
-        if start_time != self.current_visit_time:
-            self.previous_visit_time = self.current_visit_time
-            self.current_visit_time = start_time
+        start_time = session.start_timestamp
+        if start_time != self.current_visit_timestamp:
+            self.previous_visit_timestamp = self.current_visit_timestamp
+            self.current_visit_timestamp = start_time
             self.visit_count = self.visit_count + 1
@@ -1,2 +1,12 @@
 class ValidationError(Exception):
     pass
+
+
+class CircuitOpenError(Exception):
+    '''Raised instead of sending a request while the circuit breaker is open.'''
+    pass
+
+
+class WorkerError(Exception):
+    '''Raised once a worker process exited without reporting its results.'''
+    pass
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+import errno
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from pyga.dispatcher import FlushResult, flush
+from pyga.spool import RECORD_HEADER, pack_record
+try:
+    from urllib2 import Request as urllib_request
+except ImportError as e:
+    from urllib.request import Request as urllib_request
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSONL = 'jsonl'
+FORMAT_BINARY = 'bin'
+
+# Suffix of the file a sink is still writing to
+PARTIAL_SUFFIX = '.part'
+
+# Timestamp and lengths of URL, body and headers of a binary record
+HIT_HEADER = struct.Struct('>dIII')
+
+# Body length marking a request without body
+NO_BODY = 0xffffffff
+
+ExportedHit = namedtuple('ExportedHit', 'timestamp request')
+
+
+def _request_parts(request):
+    data = request.data if hasattr(request, 'data') else request.get_data()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    headers = dict((k, str(v)) for k, v in request.header_items())
+    return request.get_full_url(), data, headers
+
+
+def encode_jsonl(request, timestamp):
+    '''Encodes a built urllib request as a JSON line.'''
+    url, data, headers = _request_parts(request)
+    hit = {'ts': timestamp, 'url': url, 'data': data, 'headers': headers}
+    return json.dumps(hit, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def encode_binary(request, timestamp):
+    '''
+    Encodes a built urllib request as a binary record: timestamp and the lengths
+    of URL, body and headers (HIT_HEADER), followed by these in UTF-8, framed like
+    the records of the disk spool (length and CRC32).
+    '''
+    url, data, headers = _request_parts(request)
+    url = url.encode('utf-8')
+    body = b'' if data is None else data.encode('utf-8')
+    headers = '\n'.join('%s: %s' % item for item in sorted(headers.items())).encode('utf-8')
+    header = HIT_HEADER.pack(timestamp, len(url), NO_BODY if data is None else len(body), len(headers))
+    return pack_record(header + url + body + headers)
+
+
+def read_jsonl(f):
+    '''Yields an ExportedHit for each line of a JSONL export file, skipping broken ones.'''
+    for line in f:
+        try:
+            hit = json.loads(line.decode('utf-8'))
+            yield ExportedHit(hit['ts'], urllib_request(hit['url'], hit['data'], hit['headers']))
+        except (ValueError, KeyError) as e:
+            logger.warning('Skipping broken exported hit: %s', e)
+
+
+def read_binary(f):
+    '''Yields an ExportedHit for each record of a binary export file, stopping at a broken one.'''
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, crc = RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            logger.warning('Skipping broken remainder of export file %s', getattr(f, 'name', f))
+            return
+
+        timestamp, url_length, body_length, headers_length = HIT_HEADER.unpack_from(payload)
+        offset = HIT_HEADER.size
+        url = payload[offset:offset + url_length].decode('utf-8')
+        offset += url_length
+        data = None
+        if body_length != NO_BODY:
+            data = payload[offset:offset + body_length].decode('utf-8')
+            offset += body_length
+        headers = {}
+        for line in payload[offset:offset + headers_length].decode('utf-8').split('\n'):
+            if line:
+                name, _, value = line.partition(': ')
+                headers[name] = value
+        yield ExportedHit(timestamp, urllib_request(url, data, headers))
+
+
+FORMATS = {
+    FORMAT_JSONL: (encode_jsonl, read_jsonl),
+    FORMAT_BINARY: (encode_binary, read_binary),
+}
+
+
+def read_export(path):
+    '''Yields an ExportedHit for each hit of an export file, of either format.'''
+    name = path[:-len(PARTIAL_SUFFIX)] if path.endswith(PARTIAL_SUFFIX) else path
+    read = FORMATS[os.path.splitext(name)[1][1:]][1]
+    with open(path, 'rb') as f:
+        for hit in read(f):
+            yield hit
+
+
+def export_files(directory):
+    '''Sorted paths of the complete export files in directory, oldest first.'''
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if os.path.splitext(name)[1][1:] in FORMATS]
+
+
+def _process_exists(pid):
+    if os.name != 'posix':
+        # os.kill() would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def abandoned_files(directory):
+    '''
+    Sorted paths of the partial export files in directory which are not going to
+    be completed anymore, because their writer process no longer exists. Only
+    processes of this host are known, so hosts must not share a directory.
+    '''
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(PARTIAL_SUFFIX):
+            continue
+        try:
+            pid = int(name.split('-')[1])
+        except (IndexError, ValueError):
+            continue
+        if not _process_exists(pid):
+            paths.append(os.path.join(directory, name))
+    return paths
+
+
+class ExportSink(object):
+    '''
+    Writes built hits, each with the time it was written, to rotating files
+    instead of sending them: JSON lines (FORMAT_JSONL) or length-prefixed
+    binary records (FORMAT_BINARY). Writes are buffered in memory.
+
+    A file is named after its creation time, process ID and a counter and
+    carries PARTIAL_SUFFIX while being written to, so that readers (see
+    ExportUploader) only ever see complete files. Several processes can
+    write to the same directory. Once closed, hits written are dropped.
+
+    Properties:
+    directory -- Directory holding the export files
+    format -- FORMAT_JSONL or FORMAT_BINARY
+    file_size -- Size in bytes after which a new file is started
+    buffer_size -- Size in bytes of the write buffer
+    dropped -- Amount of hits written after close()
+
+    '''
+    def __init__(self, directory, format=FORMAT_JSONL, file_size=64 * 1024 * 1024, buffer_size=64 * 1024):
+        if format not in FORMATS:
+            raise ValueError('Export format has to be one of the FORMAT_* constant values.')
+
+        self.directory = directory
+        self.format = format
+        self.file_size = file_size
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self.__encode = FORMATS[format][0]
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__file = None
+        self.__size = 0
+        self.__count = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, request, timestamp=None):
+        '''
+        Writes a built urllib request, timestamp defaulting to now. Returns False
+        if the hit got dropped because the sink is closed.
+        '''
+        record = self.__encode(request, time.time() if timestamp is None else timestamp)
+        with self.__lock:
+            if self.__closed:
+                self.dropped += 1
+                logger.warning('Export sink is closed, dropping hit.')
+                return False
+
+            if self.__file is None or self.__size >= self.file_size:
+                self.__rotate()
+
+            self.__file.write(record)
+            self.__size += len(record)
+        return True
+
+    def flush(self):
+        '''Writes the buffered hits to the current file.'''
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+
+    def close(self):
+        '''Completes the current file, no more hits get written afterwards.'''
+        with self.__lock:
+            self.__closed = True
+            self.__complete()
+
+    def __rotate(self):
+        self.__complete()
+        self.__count += 1
+        name = '%013d-%s-%06d.%s%s' % (time.time() * 1000, os.getpid(), self.__count, self.format, PARTIAL_SUFFIX)
+        self.__file = open(os.path.join(self.directory, name), 'ab', self.buffer_size)
+        self.__size = 0
+
+    def __complete(self):
+        if self.__file is not None:
+            self.__file.close()
+            try:
+                os.rename(self.__file.name, self.__file.name[:-len(PARTIAL_SUFFIX)])
+            except OSError as e:
+                logger.warning('Completing export file %s failed: %s', self.__file.name, e)
+            self.__file = None
+
+
+class ExportUploader(object):
+    '''
+    Sends the hits of complete export files, oldest file first, streaming
+    each file in chunks sent concurrently by a bounded amount of threads.
+    Sent files are removed (or kept with keep); hits which failed are
+    written to a new export file, so that the next upload() retries them.
+
+    Partial files of writer processes which no longer exist, like crashed
+    ones (see abandoned_files()), get completed and uploaded as well.
+
+    Properties:
+    directory -- Directory holding the export files
+    send -- Callable which actually sends a single urllib request
+    workers -- Amount of threads sending concurrently
+    chunk_size -- Amount of hits read and sent at once
+    keep -- Whether to rename sent files to "<name>.done" instead of removing them
+
+    '''
+    def __init__(self, directory, send, workers=4, chunk_size=500, keep=False):
+        self.directory = directory
+        self.send = send
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.keep = keep
+
+    def upload(self):
+        '''Uploads all complete export files, returns a FlushResult of all their hits.'''
+        for path in abandoned_files(self.directory):
+            logger.warning('Completing abandoned export file %s', path)
+            try:
+                os.rename(path, path[:-len(PARTIAL_SUFFIX)])
+            except OSError:
+                # Completed by its writer or another uploader meanwhile
+                pass
+
+        sent = failed = dropped = 0
+        for path in export_files(self.directory):
+            result = self.upload_file(path)
+            sent += result.sent
+            failed += result.failed
+            dropped += result.dropped
+        return FlushResult(sent, failed, dropped)
+
+    def upload_file(self, path):
+        '''Uploads the hits of a single export file, returns a FlushResult.'''
+        counts = [0, 0, 0]
+        failures = []
+
+        def send(hit):
+            try:
+                self.send(hit.request)
+            except Exception:
+                failures.append(hit)
+                raise
+
+        def send_chunk(chunk):
+            for i, count in enumerate(flush(chunk, send, self.workers)):
+                counts[i] += count
+
+        chunk = []
+        for hit in read_export(path):
+            chunk.append(hit)
+            if len(chunk) >= self.chunk_size:
+                send_chunk(chunk)
+                chunk = []
+        if chunk:
+            send_chunk(chunk)
+
+        if failures:
+            retry = ExportSink(self.directory, os.path.splitext(path)[1][1:])
+            for hit in failures:
+                retry.write(hit.request, hit.timestamp)
+            retry.close()
+
+        if self.keep:
+            os.rename(path, '%s.done' % path)
+        else:
+            os.remove(path)
+        return FlushResult(*counts)
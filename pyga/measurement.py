@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+'''
+Measurement Protocol support: a MeasurementTracker which encodes the hits of
+the regular request classes as Measurement Protocol payloads and sends up to
+20 of them with a single POST request to the batch endpoint, instead of one
+"__utm.gif" request per hit.
+
+https://developers.google.com/analytics/devguides/collection/protocol/v1/devguide#batch
+'''
+
+import logging
+import threading
+from pyga import utils
+from pyga.requests import (Config, EventRequest, HitResult, ItemRequest, PageViewRequest,
+                           SocialInteractionRequest, Tracker, TransactionRequest,
+                           dispatch_http_request, dispatch_http_requests, register_exit_flush)
+try:
+    from urllib2 import Request as urllib_request
+except ImportError as e:
+    from urllib.request import Request as urllib_request
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = 'https://www.google-analytics.com/batch'
+
+PROTOCOL_VERSION = 1
+
+# Limits of the batch endpoint
+MAX_BATCH_HITS = 20
+MAX_HIT_SIZE = 8 * 1024
+MAX_BATCH_SIZE = 16 * 1024
+
+
+def build_payload(request):
+    '''
+    Encodes a Request (like a PageViewRequest) as Measurement Protocol payload,
+    counting it as a hit of its session just like building its GIF request would.
+
+    The Measurement Protocol has no custom variables: the custom variables of the
+    tracker are sent as the custom dimensions of the same index ("cd<index>"),
+    which carry the value only. Their names and scopes are dropped, these belong
+    to the custom dimension definitions of the GA property.
+    '''
+    request.count_hit()
+
+    tracker = request.tracker
+    visitor = request.visitor
+    params = [
+        ('v', PROTOCOL_VERSION),
+        ('tid', tracker.account_id),
+        ('cid', '%s.%s' % (visitor.unique_id, visitor.first_visit_timestamp)),
+        ('t', HIT_TYPES[request.get_type()]),
+        ('dh', tracker.domain_name),
+        ('uip', utils.anonymize_ip(visitor.ip_address)),
+        ('ua', visitor.user_agent),
+    ]
+    if tracker.config.anonimize_ip_address:
+        params.append(('aip', 1))
+
+    # Like build_visitor_parameters() and build_custom_variable_parameters() of the
+    # GIF requests, which the e-commerce requests skip
+    if not isinstance(request, (TransactionRequest, ItemRequest)):
+        if visitor.locale:
+            params.append(('ul', visitor.locale.replace('_', '-').lower()))
+        if visitor.flash_version:
+            params.append(('fl', visitor.flash_version))
+        if visitor.java_enabled:
+            params.append(('je', 1))
+        if visitor.screen_colour_depth:
+            params.append(('sd', '%s-bits' % visitor.screen_colour_depth))
+        if visitor.screen_resolution:
+            params.append(('sr', visitor.screen_resolution))
+
+        for index, cvar in sorted(tracker.custom_variables.items()):
+            params.append(('cd%s' % index, cvar.value))
+
+    campaign = tracker.campaign
+    if campaign:
+        params.extend((
+            ('cn', campaign.name),
+            ('cs', campaign.source),
+            ('cm', campaign.medium),
+            ('ck', campaign.term),
+            ('cc', campaign.content),
+            ('ci', campaign.id),
+            ('gclid', campaign.g_click_id),
+            ('dclid', campaign.d_click_id),
+        ))
+
+    for cls in type(request).__mro__:
+        if cls in HIT_PARAMETERS:
+            params.extend(HIT_PARAMETERS[cls](request))
+            break
+
+    # Cache buster, has to come last
+    params.append(('z', utils.get_32bit_random_num()))
+
+    encode = utils.encode_query_value
+    return '&'.join(['%s=%s' % (name, encode(value)) for name, value in params
+                     if value is not None and value != ''])
+
+
+def _page_view_parameters(request):
+    page = request.page
+    return (
+        ('dp', page.path),
+        ('dt', page.title),
+        ('de', page.charset),
+        ('dr', page.referrer),
+    )
+
+
+def _event_parameters(request):
+    event = request.event
+    return (
+        ('ec', event.category),
+        ('ea', event.action),
+        ('el', event.label),
+        ('ev', event.value),
+        ('ni', 1 if event.noninteraction else None),
+    )
+
+
+def _transaction_parameters(request):
+    # The Measurement Protocol has nothing for city, state and country
+    transaction = request.transaction
+    return (
+        ('ti', transaction.order_id),
+        ('ta', transaction.affiliation),
+        ('tr', transaction.total),
+        ('tt', transaction.tax),
+        ('ts', transaction.shipping),
+    )
+
+
+def _item_parameters(request):
+    item = request.item
+    return (
+        ('ti', item.order_id),
+        ('in', item.name),
+        ('ip', item.price),
+        ('iq', item.quantity),
+        ('ic', item.sku),
+        ('iv', item.variation),
+    )
+
+
+def _social_parameters(request):
+    social_interaction = request.social_interaction
+    return (
+        ('sn', social_interaction.network),
+        ('sa', social_interaction.action),
+        ('st', social_interaction.target),
+        ('dp', request.page.path if request.page else None),
+    )
+
+
+# Measurement Protocol hit type of each GIF request type ("utmt" parameter)
+HIT_TYPES = {
+    PageViewRequest.TYPE_PAGE: 'pageview',
+    EventRequest.TYPE_EVENT: 'event',
+    TransactionRequest.TYPE_TRANSACTION: 'transaction',
+    ItemRequest.TYPE_ITEM: 'item',
+    SocialInteractionRequest.TYPE_SOCIAL: 'social',
+}
+
+HIT_PARAMETERS = {
+    PageViewRequest: _page_view_parameters,
+    EventRequest: _event_parameters,
+    TransactionRequest: _transaction_parameters,
+    ItemRequest: _item_parameters,
+    SocialInteractionRequest: _social_parameters,
+}
+
+
+def build_batch_request(endpoint, payloads):
+    '''Builds the urllib request POSTing the given payloads, one per line, to endpoint.'''
+    body = '\n'.join(payloads).encode('utf-8')
+    headers = {
+        'Content-Type': 'text/plain',
+        'Content-Length': len(body),
+    }
+    return urllib_request(endpoint, body, headers)
+
+
+class HitBatcher(object):
+    '''
+    Collects payloads into batches within the limits of the batch endpoint.
+    add() returns the batches it completes, each one a list of the (payload, tag)
+    pairs added, tag being anything the caller wants to get back with its payload.
+
+    Properties:
+    max_hits -- Maximum amount of payloads per batch
+    max_batch_size -- Maximum size in bytes of a batch, newlines included
+    max_hit_size -- Maximum size in bytes of a single payload
+
+    '''
+    def __init__(self, max_hits=MAX_BATCH_HITS, max_batch_size=MAX_BATCH_SIZE, max_hit_size=MAX_HIT_SIZE):
+        self.max_hits = max_hits
+        self.max_batch_size = max_batch_size
+        self.max_hit_size = max_hit_size
+        self.__batch = []
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        '''Amount of payloads of the incomplete batch.'''
+        return len(self.__batch)
+
+    def add(self, payload, tag=None):
+        '''
+        Adds a payload and returns the list of batches completed by it, mostly empty.
+        Raises ValueError for payloads exceeding max_hit_size or max_batch_size.
+        '''
+        size = len(payload)
+        if size > min(self.max_hit_size, self.max_batch_size):
+            raise ValueError('Hit of %s bytes exceeds the size limit of the batch endpoint.' % size)
+
+        batches = []
+        with self.__lock:
+            if self.__batch and self.__size + 1 + size > self.max_batch_size:
+                # Doesn't fit anymore, the batch is complete without it
+                batches.append(self.__take())
+
+            self.__size += size + (1 if self.__batch else 0)
+            self.__batch.append((payload, tag))
+
+            if len(self.__batch) >= self.max_hits:
+                batches.append(self.__take())
+        return batches
+
+    def flush(self):
+        '''Returns the incomplete batch, None if there is none.'''
+        with self.__lock:
+            return self.__take() if self.__batch else None
+
+    def __take(self):
+        batch, self.__batch, self.__size = self.__batch, [], 0
+        return batch
+
+
+class MeasurementTracker(Tracker):
+    '''
+    Tracker sending its hits with the Measurement Protocol. The track_* methods
+    encode the hits of the regular request classes (see build_payload()) and
+    collect them into batches of up to max_hits hits, each of them sent with a
+    single POST request to the batch endpoint once complete.
+
+    The batch requests go through the transport chosen by the config, like the
+    GIF requests of Tracker do: they are queued with "queue_requests", spooled
+    with "spool_directory" and so on. An incomplete batch is sent by flush(),
+    pyga.shutdown() and on interpreter exit with config option "flush_on_exit".
+
+    Properties:
+    endpoint -- URL of the batch endpoint
+    batcher -- HitBatcher collecting the hits of the next batch
+
+    '''
+    def __init__(self, account_id='', domain_name='', conf=None, endpoint=BATCH_ENDPOINT,
+                 max_hits=MAX_BATCH_HITS, max_batch_size=MAX_BATCH_SIZE):
+        super(MeasurementTracker, self).__init__(account_id, domain_name, conf)
+        self.endpoint = endpoint
+        self.batcher = HitBatcher(max_hits, max_batch_size)
+
+    def fire(self, request):
+        '''Adds the hit of request to the next batch, which gets sent once complete.'''
+        config = self.config
+        try:
+            batches = self.batcher.add(build_payload(request))
+        except ValueError as e:
+            if config.error_severity == Config.ERROR_SEVERITY_RAISE:
+                raise
+            elif config.error_severity == Config.ERROR_SEVERITY_PRINT:
+                logger.warning('Dropping hit: %s', e)
+            return
+
+        if config.flush_on_exit:
+            register_exit_flush(config.flush_workers, config.flush_timeout)
+        for batch in batches:
+            self.__send(batch)
+
+    def flush_pending(self):
+        '''Sends the incomplete batch right away.'''
+        batch = self.batcher.flush()
+        if batch is not None:
+            self.__send(batch)
+
+    def track_batch(self, request_class, hits):
+        '''
+        Like Tracker.track_batch(), but the hits are packed into their own
+        batches, sent concurrently when they are sent right away. The HitResult
+        of each hit holds the request, response and error of its batch; hits
+        too large for the batch endpoint get a ValueError as error.
+        '''
+        config = self.config
+        batcher = HitBatcher(self.batcher.max_hits, self.batcher.max_batch_size, self.batcher.max_hit_size)
+        results = []
+        batches = []
+        for index, (subject, session, visitor) in enumerate(hits):
+            results.append(None)
+            payload = build_payload(request_class(config, self, visitor, session, subject))
+            try:
+                batches.extend(batcher.add(payload, index))
+            except ValueError as e:
+                results[index] = HitResult(None, None, e)
+
+        batch = batcher.flush()
+        if batch is not None:
+            batches.append(batch)
+
+        requests = [build_batch_request(self.endpoint, [payload for payload, index in batch])
+                    for batch in batches]
+        for batch, result in zip(batches, dispatch_http_requests(config, requests, self.queue)):
+            for payload, index in batch:
+                results[index] = result
+        return results
+
+    def __send(self, batch):
+        request = build_batch_request(self.endpoint, [payload for payload, tag in batch])
+        dispatch_http_request(self.config, request, self.queue)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import deque
+from six.moves.queue import Empty
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+
+class HitQueue(object):
+    '''
+    A bounded, thread safe FIFO (ring buffer) of built hits.
+
+    Properties:
+    maxsize -- Maximum amount of hits held by the queue
+    overflow -- What to do with a new hit when the queue is full, see OVERFLOW_* constants:
+        OVERFLOW_DROP_OLDEST -- Discard the oldest queued hit to make room
+        OVERFLOW_DROP_NEWEST -- Discard the new hit
+        OVERFLOW_BLOCK -- Wait up to block_timeout seconds for room, then discard the new hit
+    block_timeout -- Seconds (float allowed) to wait for room with OVERFLOW_BLOCK,
+        None to wait forever.
+    dropped_oldest -- Amount of queued hits discarded to make room for new ones
+    dropped_newest -- Amount of new hits discarded because the queue was full
+
+    '''
+    OVERFLOW_DROP_OLDEST = 'drop_oldest'
+    OVERFLOW_DROP_NEWEST = 'drop_newest'
+    OVERFLOW_BLOCK = 'block'
+
+    def __init__(self, maxsize=1000, overflow=OVERFLOW_DROP_OLDEST, block_timeout=1):
+        if overflow not in (self.OVERFLOW_DROP_OLDEST, self.OVERFLOW_DROP_NEWEST, self.OVERFLOW_BLOCK):
+            raise ValueError('Queue overflow policy has to be one of the HitQueue.OVERFLOW_* constant values.')
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.__hits = deque()
+        self.__closed = False
+        self.__not_empty = threading.Condition(threading.Lock())
+        self.__not_full = threading.Condition(self.__not_empty)
+
+    @property
+    def dropped(self):
+        '''Total amount of discarded hits.'''
+        return self.dropped_oldest + self.dropped_newest
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    def __len__(self):
+        return len(self.__hits)
+
+    def put(self, hit):
+        '''Appends a hit, returns False if the new hit had to be discarded.'''
+        with self.__not_full:
+            if self.__closed:
+                self.dropped_newest += 1
+                return False
+
+            if len(self.__hits) >= self.maxsize:
+                if self.overflow == self.OVERFLOW_DROP_OLDEST:
+                    self.__hits.popleft()
+                    self.dropped_oldest += 1
+                elif self.overflow == self.OVERFLOW_BLOCK and self.__wait_for_room():
+                    pass
+                else:
+                    self.dropped_newest += 1
+                    logger.warning('Hit queue is full, dropping hit.')
+                    return False
+
+            self.__hits.append(hit)
+            self.__not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        '''
+        Removes and returns the oldest hit, waiting up to timeout seconds for one.
+        Raises Empty on timeout or once the queue is closed and empty.
+        '''
+        with self.__not_empty:
+            deadline = None if timeout is None else time.time() + timeout
+            while not self.__hits:
+                if self.__closed:
+                    raise Empty
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self.__not_empty.wait(remaining)
+
+            hit = self.__hits.popleft()
+            self.__not_full.notify()
+            return hit
+
+    def drain(self):
+        '''Removes and returns all queued hits.'''
+        with self.__not_empty:
+            hits = list(self.__hits)
+            self.__hits.clear()
+            self.__not_full.notify_all()
+            return hits
+
+    def close(self):
+        '''Stops accepting hits and wakes up everybody waiting on the queue.'''
+        with self.__not_empty:
+            self.__closed = True
+            self.__not_empty.notify_all()
+            self.__not_full.notify_all()
+
+    def __wait_for_room(self):
+        deadline = None if self.block_timeout is None else time.time() + self.block_timeout
+        while len(self.__hits) >= self.maxsize and not self.__closed:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.__not_full.wait(remaining)
+        return not self.__closed
@@ -1,17 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import atexit
 import logging
-import calendar
+import threading
+import weakref
+from collections import namedtuple
 from math import floor
+from pyga.connection import ConnectionPool
+from pyga.dispatcher import Dispatcher, flush
+from pyga.exceptions import CircuitOpenError
+from pyga.export import ExportSink
+from pyga.queues import HitQueue
+from pyga.retry import CircuitBreaker, RetryPolicy, is_transient_error
+from pyga.ringbuffer import RingBuffer
+from pyga.spool import DiskSpool, SpoolSender
 from pyga.entities import Campaign, CustomVariable, Event, Item, Page, Session, SocialInteraction, Transaction, Visitor
 import pyga.utils as utils
 from six import itervalues
 try:
-    from urllib import urlencode
     from urllib2 import Request as urllib_request
     from urllib2 import urlopen
 except ImportError as e:
-    from urllib.parse import urlencode
     from urllib.request import Request as urllib_request
     from urllib.request import urlopen
 
@@ -22,13 +31,6 @@ __version__ = '2.6.2'
 logger = logging.getLogger(__name__)
 
 
-class Q(object):
-    REQ_ARRAY = []
-
-    def add_wrapped_request(self, req_wrapper):
-        self.REQ_ARRAY.append(req_wrapper)
-
-
 class GIFRequest(object):
     '''
 
@@ -37,6 +39,7 @@ class GIFRequest(object):
     config -- base.Config object
     x_forwarded_for --
     user_agent -- User Agent String
+    queue -- HitQueue receiving the built request if config option "queue_requests" is enabled
 
     '''
     def __init__(self, config):
@@ -44,18 +47,16 @@ class GIFRequest(object):
         self.config = None
         self.x_forwarded_for = None
         self.user_agent = None
-        self.__Q = Q()
+        self.queue = None
         if isinstance(config, Config):
             self.config = config
 
     def build_http_request(self):
         params = self.build_parameters()
-        query_string = urlencode(params.get_parameters())
-        query_string = query_string.replace('+', '%20')
 
         # Mimic Javascript's encodeURIComponent() encoding for the query
         # string just to be sure we are 100% consistent with GA's Javascript client
-        query_string = utils.convert_to_uri_component_encoding(query_string)
+        query_string = params.get_query_string(self.get_static_query())
 
         # Recent versions of ga.js use HTTP POST requests if the query string is too long
         use_post = len(query_string) > 2036
@@ -68,7 +69,7 @@ class GIFRequest(object):
             post = query_string
 
         headers = {}
-        headers['Host'] = self.config.endpoint.split('/')[2]
+        headers['Host'] = self.get_host_header()
         headers['User-Agent'] = self.user_agent or ''
         headers['X-Forwarded-For'] = self.x_forwarded_for and self.x_forwarded_for or ''
 
@@ -86,28 +87,245 @@ class GIFRequest(object):
         '''Marker implementation'''
         return Parameters()
 
-    def __send(self):
-        request = self.build_http_request()
-        response = None
-
-        #  Do not actually send the request if endpoint host is set to null
-        if self.config.endpoint:
-            response = urlopen(
-                request, timeout=self.config.request_timeout)
+    def get_static_query(self):
+        '''Already encoded Parameters.STATIC_FIELDS of this request, None if unknown.'''
+        return None
 
-        return response
+    def get_host_header(self):
+        return self.config.endpoint.split('/')[2]
 
     def fire(self):
         '''
         Simply delegates to send() if config option "queue_requests" is disabled
-        else enqueues the request into Q object: you should call pyga.shutdowon
-        as last statement, to actually send out all queued requests.
+        else builds the request and enqueues it into the tracker's queue: you should
+        call pyga.shutdown as last statement, to actually send out all queued requests.
+        If config option "spool_directory" is set, the request gets built right
+        away and appended to the disk spool, from which a sender drains it.
+        If config option "fire_and_forget" is enabled, the request gets built
+        right away and is sent out by a background dispatcher thread.
+        If config option "export_directory" is set, the request is written to
+        an export file instead of being sent, see pyga.export.
+        If config option "ring_buffer_path" is set, the request is appended to
+        the shared ring buffer drained by a sidecar, see pyga.ringbuffer.
         '''
-        if self.config.queue_requests:
-            # Queuing results. You should call pyga.shutdown as last statement to send out requests.
-            self.__Q.add_wrapped_request((lambda: self.__send()))
+        dispatch_http_request(self.config, self.build_http_request(), self.queue)
+
+
+def dispatch_http_request(config, request, queue=None):
+    '''
+    Hands an already built urllib request to the transport chosen by config
+    (see GIFRequest.fire()), queue being the HitQueue for option "queue_requests".
+    Returns the response if the request was sent right away, else None.
+    '''
+    if config.export_directory:
+        config.get_export_sink().write(request)
+    elif config.queue_requests and queue is not None:
+        # Queuing results. You should call pyga.shutdown as last statement to send out requests.
+        if queue.put(request):
+            hold_queue(config, queue)
+        if config.flush_on_exit:
+            register_exit_flush(config.flush_workers, config.flush_timeout)
+    elif config.ring_buffer_path:
+        config.get_ring_buffer().append(request)
+    elif config.spool_directory and not config.spool_on_failure:
+        config.get_spool().append(request)
+    elif config.fire_and_forget:
+        config.get_dispatcher().submit(request)
+    else:
+        return deliver_http_request(config, request)
+
+    return None
+
+
+def defers_sending(config, queue=None):
+    '''
+    Whether dispatch_http_request() hands requests to a transport (queue, export,
+    ring buffer, spool or fire_and_forget dispatcher) instead of sending them right away.
+    '''
+    return bool(config.export_directory or (config.queue_requests and queue is not None) or
+                config.ring_buffer_path or (config.spool_directory and not config.spool_on_failure) or
+                config.fire_and_forget)
+
+
+def send_http_request(config, request):
+    '''
+    Sends an already built urllib request to the endpoint of the given config,
+    retrying transient errors. Raises CircuitOpenError without sending anything
+    while the circuit breaker of the config is open.
+    '''
+    #  Do not actually send the request if endpoint host is set to null
+    if not config.endpoint:
+        return None
+
+    breaker = config.get_circuit_breaker()
+    if not breaker.allow():
+        raise CircuitOpenError('Too many failed requests, not sending to %s for now.' % config.endpoint)
+
+    try:
+        response = config.get_retry_policy().call(_urlopen, config, request)
+    except Exception as e:
+        if is_transient_error(e):
+            breaker.record_failure()
         else:
-            self.__send()
+            breaker.record_success()
+        raise
+
+    breaker.record_success()
+    return response
+
+
+def _urlopen(config, request):
+    if config.keep_alive:
+        pool = config.get_connection_pool()
+        # Proxies and redirects are left to urllib
+        if not pool.is_proxied(request.get_full_url()):
+            return pool.urlopen(request, timeout=config.request_timeout)
+    return urlopen(request, timeout=config.request_timeout)
+
+
+def deliver_http_request(config, request):
+    '''
+    Sends an already built urllib request. If sending fails the request gets
+    appended to the disk spool with config option "spool_on_failure", otherwise
+    the error is handled according to config option "error_severity".
+    '''
+    try:
+        return send_http_request(config, request)
+    except Exception as e:
+        if config.spool_directory and config.spool_on_failure:
+            config.get_spool().append(request)
+        elif config.error_severity == Config.ERROR_SEVERITY_RAISE:
+            raise
+        elif config.error_severity == Config.ERROR_SEVERITY_PRINT:
+            logger.warning('Sending request failed: %s', e)
+
+    return None
+
+
+HitResult = namedtuple('HitResult', 'request response error')
+
+
+def deliver_http_requests(config, requests, workers=4):
+    '''
+    Sends already built urllib requests concurrently over the connection pool
+    of config and returns a HitResult (request, response, error) per request,
+    in the given order. Failed requests are appended to the disk spool with
+    config option "spool_on_failure" and logged with ERROR_SEVERITY_PRINT, but
+    never raised: their exception is reported as error of their HitResult.
+    '''
+    results = [None] * len(requests)
+
+    def send(hit):
+        index, request = hit
+        try:
+            results[index] = HitResult(request, send_http_request(config, request), None)
+        except Exception as e:
+            results[index] = HitResult(request, None, e)
+            if config.spool_directory and config.spool_on_failure:
+                config.get_spool().append(request)
+            elif config.error_severity == Config.ERROR_SEVERITY_PRINT:
+                logger.warning('Sending request failed: %s', e)
+
+    flush(list(enumerate(requests)), send, workers)
+    return results
+
+
+def dispatch_http_requests(config, requests, queue=None):
+    '''
+    Batch version of dispatch_http_request(), returning a HitResult per request.
+    Requests sent right away are sent concurrently by config option
+    "batch_workers" threads, see deliver_http_requests().
+    '''
+    if defers_sending(config, queue):
+        for request in requests:
+            dispatch_http_request(config, request, queue)
+        return [HitResult(request, None, None) for request in requests]
+
+    return deliver_http_requests(config, requests, config.batch_workers)
+
+
+# Exit hook state: whether it is registered, the arguments of flush_queues() once
+# register_exit_flush() got called and the transports to close afterwards
+_exit_registered = []
+_exit_flush = []
+_exit_close = []
+_exit_lock = threading.Lock()
+
+# Queues holding hits, with the config to send them with. Referenced until drained,
+# so that the hits of a tracker which got garbage collected are still sent.
+_held_queues = {}
+_held_queues_lock = threading.Lock()
+
+
+def hold_queue(config, queue):
+    '''Keeps queue, which just received a hit, until release_queue() gets called.'''
+    with _held_queues_lock:
+        _held_queues[queue] = config
+
+
+def release_queue(queue):
+    '''Stops keeping queue, called right before draining it.'''
+    with _held_queues_lock:
+        _held_queues.pop(queue, None)
+
+
+def register_exit_flush(workers=4, timeout=None):
+    '''Makes sure pending and queued requests get sent on interpreter exit (only registered once).'''
+    with _exit_lock:
+        if not _exit_flush:
+            _exit_flush.append((workers, timeout))
+        _register_exit()
+
+
+def register_exit_close(close, *args):
+    '''
+    Makes sure close(*args) gets called on interpreter exit, always after the
+    requests of register_exit_flush() were handed over, so that transports get
+    to send or store them.
+    '''
+    with _exit_lock:
+        _exit_close.append((close, args))
+        _register_exit()
+
+
+def _register_exit():
+    # A single hook, as atexit runs hooks in reverse order of registration
+    if not _exit_registered:
+        _exit_registered.append(True)
+        atexit.register(_exit)
+
+
+def _exit():
+    if _exit_flush:
+        flush_queues(*_exit_flush[0])
+    for close, args in _exit_close:
+        try:
+            close(*args)
+        except Exception as e:
+            logger.warning('Closing %r on exit failed: %s', close, e)
+
+
+def flush_queues(workers=4, timeout=None):
+    '''
+    Sends the queued requests of all trackers concurrently and clears their queues.
+    Returns a FlushResult with the amount of sent, failed and dropped requests.
+    '''
+    hits = []
+    for tracker in list(Tracker.instances):
+        try:
+            tracker.flush_pending()
+        except Exception as e:
+            logger.warning('Sending pending hits failed: %s', e)
+        release_queue(tracker.queue)
+        hits.extend((tracker.config, request) for request in tracker.queue.drain())
+
+    # Queues of trackers which are gone
+    with _held_queues_lock:
+        orphans = list(_held_queues.items())
+        _held_queues.clear()
+    for queue, config in orphans:
+        hits.extend((config, request) for request in queue.drain())
+    return flush(hits, lambda hit: send_http_request(*hit), workers, timeout)
 
 
 class Request(GIFRequest):
@@ -132,11 +350,18 @@ class Request(GIFRequest):
         self.tracker = tracker
         self.visitor = visitor
         self.session = session
+        self.queue = tracker.queue
+        # Dict shared by the requests of a batch, see Tracker.track_pageviews()
+        self.visitor_cache = None
 
     def build_http_request(self):
         self.x_forwarded_for = self.visitor.ip_address
         self.user_agent = self.visitor.user_agent
+        self.count_hit()
+        return super(Request, self).build_http_request()
 
+    def count_hit(self):
+        '''Counts this request as a hit of its session and the tracker's campaign.'''
         # Increment session track counter for each request
         self.session.track_count = self.session.track_count + 1
 
@@ -147,7 +372,11 @@ class Request(GIFRequest):
         if self.tracker.campaign:
             self.tracker.campaign.response_count = self.tracker.campaign.response_count + 1
 
-        return super(Request, self).build_http_request()
+    def get_static_query(self):
+        return self.tracker.get_static_query()
+
+    def get_host_header(self):
+        return self.tracker.get_host_header()
 
     def build_parameters(self):
         params = Parameters()
@@ -155,6 +384,41 @@ class Request(GIFRequest):
         params.utmhn = self.tracker.domain_name
         params.utmt = self.get_type()
         params.utmn = utils.get_32bit_random_num()
+
+        if self.visitor_cache is None:
+            params = self.build_visitor_context_parameters(params)
+            params.utmhid = self.session.session_id
+            params.utms = self.session.track_count
+            params = self.build_visitor_parameters(params)
+        else:
+            params.utmhid = self.session.session_id
+            params.utms = self.session.track_count
+            for attr, value in self.__get_cached_visitor_parameters():
+                setattr(params, attr, value)
+
+        params = self.build_custom_variable_parameters(params)
+        params = self.build_campaign_parameters(params)
+        params = self.build_cookie_parameters(params)
+        return params
+
+    def __get_cached_visitor_parameters(self):
+        '''
+        The parameters set by build_visitor_context_parameters() and
+        build_visitor_parameters(), computed once per visitor and batch.
+        '''
+        entry = self.visitor_cache.get(id(self.visitor))
+        # Compare identity too, ids of discarded visitors get reused
+        if entry is None or entry[0] is not self.visitor:
+            defaults = vars(Parameters())
+            params = self.build_visitor_parameters(self.build_visitor_context_parameters(Parameters()))
+            changed = tuple((attr, value) for attr, value in vars(params).items()
+                            if attr not in defaults or defaults[attr] != value)
+            entry = (self.visitor, changed)
+            self.visitor_cache[id(self.visitor)] = entry
+        return entry[1]
+
+    def build_visitor_context_parameters(self, params):
+        '''IP address and user agent of the visitor.'''
         '''
         The "utmip" parameter is only relevant if a mobile analytics ID
         (MO-XXXXXX-X) was given
@@ -173,12 +437,6 @@ class Request(GIFRequest):
             # If anonimization of ip enabled? then!
             params.utmip = utils.anonymize_ip(params.utmip)
 
-        params.utmhid = self.session.session_id
-        params.utms = self.session.track_count
-        params = self.build_visitor_parameters(params)
-        params = self.build_custom_variable_parameters(params)
-        params = self.build_campaign_parameters(params)
-        params = self.build_cookie_parameters(params)
         return params
 
     def build_visitor_parameters(self, params):
@@ -206,58 +464,22 @@ class Request(GIFRequest):
             if len(custom_vars) > 5:
                 logger.warning('The sum of all custom variables cannot exceed 5 in any given request.')
 
-            x10 = X10()
-            x10.clear_key(self.X10_CUSTOMVAR_NAME_PROJECT_ID)
-            x10.clear_key(self.X10_CUSTOMVAR_VALUE_PROJCT_ID)
-            x10.clear_key(self.X10_CUSTOMVAR_SCOPE_PROJECT_ID)
-
-            for cvar in itervalues(custom_vars):
-                name = utils.encode_uri_components(cvar.name)
-                value = utils.encode_uri_components(cvar.value)
-                x10.set_key(
-                    self.X10_CUSTOMVAR_NAME_PROJECT_ID, cvar.index, name)
-                x10.set_key(
-                    self.X10_CUSTOMVAR_VALUE_PROJCT_ID, cvar.index, value)
-
-                if cvar.scope and cvar.scope != CustomVariable.SCOPE_PAGE:
-                    x10.set_key(self.X10_CUSTOMVAR_SCOPE_PROJECT_ID,
-                                cvar.index, cvar.scope)
-
-            params.utme = '%s%s' % (params.utme, x10.render_url_string())
+            params.utme = '%s%s' % (params.utme, self.tracker.get_custom_variables_x10())
 
         return params
 
     def build_campaign_parameters(self, params):
         campaign = self.tracker.campaign
         if campaign:
-            params._utmz = '%s.%s.%s.%s.' % (
+            creation_time, tracking = campaign.get_utmz_tail()
+            params._utmz = '%s.%s.%s.%s.%s' % (
                 self._generate_domain_hash(),
-                calendar.timegm(campaign.creation_time.timetuple()),
+                creation_time,
                 self.visitor.visit_count,
                 campaign.response_count,
+                tracking,
             )
 
-            param_map = {
-                'utmcid': campaign.id,
-                'utmcsr': campaign.source,
-                'utmgclid': campaign.g_click_id,
-                'utmdclid': campaign.d_click_id,
-                'utmccn': campaign.name,
-                'utmcmd': campaign.medium,
-                'utmctr': campaign.term,
-                'utmcct': campaign.content,
-            }
-
-            for k, v in param_map.items():
-                if v:
-                    # Only spaces and pluses get escaped in gaforflash and ga.js, so we do the same
-                    params._utmz = '%s%s=%s%s' % (params._utmz, k,
-                                                  v.replace('+', '%20').replace(' ', '%20'),
-                                                  Campaign.CAMPAIGN_DELIMITER
-                                                  )
-
-            params._utmz = params._utmz.rstrip(Campaign.CAMPAIGN_DELIMITER)
-
         return params
 
     def build_cookie_parameters(self, params):
@@ -265,15 +487,15 @@ class Request(GIFRequest):
         params._utma = "%s.%s.%s.%s.%s.%s" % (
             domain_hash,
             self.visitor.unique_id,
-            calendar.timegm(self.visitor.first_visit_time.timetuple()),
-            calendar.timegm(self.visitor.previous_visit_time.timetuple()),
-            calendar.timegm(self.visitor.current_visit_time.timetuple()),
+            self.visitor.first_visit_timestamp,
+            self.visitor.previous_visit_timestamp,
+            self.visitor.current_visit_timestamp,
             self.visitor.visit_count
         )
         params._utmb = '%s.%s.10.%s' % (
             domain_hash,
             self.session.track_count,
-            calendar.timegm(self.session.start_time.timetuple()),
+            self.session.start_timestamp,
         )
         params._utmc = domain_hash
         cookies = []
@@ -287,11 +509,7 @@ class Request(GIFRequest):
         return params
 
     def _generate_domain_hash(self):
-        hash_val = 1
-        if self.tracker.allow_hash:
-            hash_val = utils.generate_hash(self.tracker.domain_name)
-
-        return hash_val
+        return self.tracker.get_domain_hash()
 
 
 class ItemRequest(Request):
@@ -472,11 +690,25 @@ class Config(object):
         RECOMMENDATION: Exceptions during deveopment, warnings in production.
     queue_requests --  Whether to just queue all requests on HttpRequest.fire()
         and actually send them on shutdown after all other tasks are done.
-        This has two advantages:
-        1) It effectively doesn't affect app performance
-        2) It can e.g. handle custom variables that were set after scheduling a request
+        It effectively doesn't affect app performance. Requests are built when
+        queued and kept in a bounded queue owned by their tracker.
+    queue_size -- Maximum amount of requests queued per tracker.
+    queue_overflow -- What to do when a tracker's queue is full, one of the
+        HitQueue.OVERFLOW_* constants (drop oldest, drop newest or block).
+    queue_block_timeout -- Seconds (float allowed) to wait for room in a full queue
+        with HitQueue.OVERFLOW_BLOCK before the request gets dropped.
+    flush_on_exit -- Whether queued requests get sent automatically on interpreter exit.
+    flush_workers -- Amount of threads concurrently sending queued requests on exit.
+    flush_timeout -- Seconds (float allowed) after which sending queued requests
+        on exit is given up on, None to wait until all of them are sent. Applies
+        to the "fire_and_forget" dispatcher as well.
     fire_and_forget -- Whether to make asynchronous requests to GA without
-        waiting for any response (speeds up doing requests).
+        waiting for any response (speeds up doing requests). Requests are handed
+        to a bounded queue drained by background worker threads.
+    dispatcher_queue_size -- Maximum amount of requests waiting in the "fire_and_forget" queue.
+    dispatcher_overflow -- What to do when the "fire_and_forget" queue is full,
+        one of the HitQueue.OVERFLOW_* constants.
+    dispatcher_workers -- Amount of worker threads sending "fire_and_forget" requests.
     logging_callback -- Logging callback, registered via setLoggingCallback().
         Will be fired whenever a request gets sent out and receives the
         full HTTP request as the first and the full HTTP response
@@ -490,6 +722,45 @@ class Config(object):
     site_speed_sample_rate -- Defines a new sample set size (0-100) for
         Site Speed data collection. By default, a fixed 1% sampling of your site
         visitors make up the data pool from which the Site Speed metrics are derived.
+    spool_directory -- Directory of a durable disk spool. If set, requests are
+        appended to the spool instead of being sent, and sent out in order by a
+        SpoolSender, so they survive endpoint outages and process restarts.
+    spool_segment_size -- Size in bytes after which a new spool segment file is started.
+    spool_on_failure -- Whether to send requests right away and only append them
+        to the disk spool when sending fails or the circuit breaker is open.
+    spool_autosend -- Whether to drain the spool from a background thread of this
+        process. Disable it if a separate process runs the SpoolSender.
+    retry_attempts -- Amount of retries of a request failing with a transient error
+        (connection problems, timeouts, server errors).
+    retry_backoff -- Base delay in seconds before a retry, doubled (and jittered) with every retry.
+    retry_max_backoff -- Upper bound in seconds for the delay before a retry.
+    circuit_breaker_threshold -- Amount of consecutive failed requests after which
+        requests are short-circuited (spooled or dropped) for a cool-down period, 0 (default)
+        to disable. Short-circuited requests raise CircuitOpenError with ERROR_SEVERITY_RAISE.
+    circuit_breaker_cooldown -- Seconds requests are short-circuited once the threshold is reached.
+    keep_alive -- Whether to send requests over a pool of persistent HTTP/1.1
+        connections instead of opening a new connection for every request.
+        Requests to be sent through a proxy (HTTP_PROXY/HTTPS_PROXY environment
+        variables) are sent by urllib nonetheless. The pool doesn't follow
+        redirects, a 3xx response counts as failed request.
+    pool_maxsize -- Maximum amount of idle connections kept per endpoint host.
+    pool_idle_timeout -- Seconds an idle pooled connection is kept before it gets closed.
+    pool_max_requests -- Amount of requests after which a pooled connection gets
+        recycled, None or 0 for no limit.
+    batch_workers -- Amount of threads concurrently sending the requests of a batch
+        (see Tracker.track_pageviews()) when they are sent right away.
+    export_directory -- Directory of export files. If set, requests are written
+        to export files exactly as they would be sent, but never sent. An
+        ExportUploader can send them later on.
+    export_format -- Format of the export files, "jsonl" (export.FORMAT_JSONL)
+        or compact binary records (export.FORMAT_BINARY).
+    export_file_size -- Size in bytes after which a new export file is started.
+    export_buffer_size -- Size in bytes of the write buffer of the export file.
+    ring_buffer_path -- Path of a memory-mapped ring buffer file shared by all
+        processes of a pre-forked server. If set, requests are appended to it
+        and a single sidecar process sends them (see pyga.ringbuffer); requests
+        are dropped while the buffer is full.
+    ring_buffer_size -- Capacity in bytes of a newly created ring buffer file.
 
     '''
     ERROR_SEVERITY_SILECE = 0
@@ -499,19 +770,162 @@ class Config(object):
     def __init__(self):
         self.error_severity = Config.ERROR_SEVERITY_RAISE
         self.queue_requests = False
-        # self.fire_and_forget = False      # not supported as of now
+        self.queue_size = 1000
+        self.queue_overflow = HitQueue.OVERFLOW_DROP_OLDEST
+        self.queue_block_timeout = 1
+        self.flush_on_exit = True
+        self.flush_workers = 4
+        self.flush_timeout = 10
+        self.fire_and_forget = False
+        self.dispatcher_queue_size = 1000
+        self.dispatcher_overflow = HitQueue.OVERFLOW_DROP_NEWEST
+        self.dispatcher_workers = 1
         # self.logging_callback = False     # not supported as of now
         self.request_timeout = 1
         self.endpoint = 'http://www.google-analytics.com/__utm.gif'
         self.anonimize_ip_address = False
         self.site_speed_sample_rate = 1
+        self.spool_directory = None
+        self.spool_segment_size = 4 * 1024 * 1024
+        self.spool_on_failure = False
+        self.spool_autosend = True
+        self.retry_attempts = 0
+        self.retry_backoff = 0.1
+        self.retry_max_backoff = 2
+        self.circuit_breaker_threshold = 0
+        self.circuit_breaker_cooldown = 30
+        self.keep_alive = True
+        self.pool_maxsize = 10
+        self.pool_idle_timeout = 30
+        self.pool_max_requests = 100
+        self.batch_workers = 4
+        self.export_directory = None
+        self.export_format = 'jsonl'
+        self.export_file_size = 64 * 1024 * 1024
+        self.export_buffer_size = 64 * 1024
+        self._export_sink = None
+        self.ring_buffer_path = None
+        self.ring_buffer_size = 8 * 1024 * 1024
+        self._ring_buffer = None
+        self._connection_pool = None
+        self._dispatcher = None
+        self._spool = None
+        self._circuit_breaker = None
+        self._lock = threading.Lock()
 
     def __setattr__(self, name, value):
         if name == 'site_speed_sample_rate':
             if value and (value < 0 or value > 100):
                 raise ValueError('For consistency with ga.js, sample rates must be specified as a number between 0 and 100.')
+        elif name in ('pool_maxsize', 'pool_idle_timeout', 'pool_max_requests'):
+            # Pool settings only apply to a freshly created pool
+            pool = self.__dict__.get('_connection_pool')
+            if pool is not None:
+                object.__setattr__(self, '_connection_pool', None)
+                pool.clear()
+        elif name in ('circuit_breaker_threshold', 'circuit_breaker_cooldown'):
+            object.__setattr__(self, '_circuit_breaker', None)
+        elif name in ('ring_buffer_path', 'ring_buffer_size'):
+            ring = self.__dict__.get('_ring_buffer')
+            if ring is not None:
+                object.__setattr__(self, '_ring_buffer', None)
+                ring.close()
+        elif name in ('export_directory', 'export_format', 'export_file_size', 'export_buffer_size'):
+            sink = self.__dict__.get('_export_sink')
+            if sink is not None:
+                object.__setattr__(self, '_export_sink', None)
+                sink.close()
+
+        if name[0] != '_':
+            # Lets trackers notice that values they cached from this config are outdated
+            object.__setattr__(self, 'revision', self.__dict__.get('revision', 0) + 1)
         object.__setattr__(self, name, value)
 
+    def get_connection_pool(self):
+        '''Lazily creates the connection pool shared by all requests using this config.'''
+        pool = self._connection_pool
+        if pool is None:
+            with self._lock:
+                pool = self._connection_pool
+                if pool is None:
+                    pool = ConnectionPool(self.pool_maxsize,
+                                          self.pool_idle_timeout,
+                                          self.pool_max_requests)
+                    self._connection_pool = pool
+        return pool
+
+    def get_dispatcher(self):
+        '''Lazily creates the background dispatcher used for "fire_and_forget" requests.'''
+        dispatcher = self._dispatcher
+        if dispatcher is None:
+            with self._lock:
+                dispatcher = self._dispatcher
+                if dispatcher is None:
+                    dispatcher = Dispatcher(lambda request: deliver_http_request(self, request),
+                                            self.dispatcher_queue_size,
+                                            self.dispatcher_workers,
+                                            self.dispatcher_overflow,
+                                            self.flush_timeout,
+                                            close_on_exit=False)
+                    register_exit_close(dispatcher.close, self.flush_timeout)
+                    self._dispatcher = dispatcher
+        return dispatcher
+
+    def get_retry_policy(self):
+        return RetryPolicy(self.retry_attempts, self.retry_backoff, self.retry_max_backoff)
+
+    def get_circuit_breaker(self):
+        '''Lazily creates the circuit breaker shared by all requests using this config.'''
+        breaker = self._circuit_breaker
+        if breaker is None:
+            with self._lock:
+                breaker = self._circuit_breaker
+                if breaker is None:
+                    breaker = CircuitBreaker(self.circuit_breaker_threshold,
+                                             self.circuit_breaker_cooldown)
+                    self._circuit_breaker = breaker
+        return breaker
+
+    def get_export_sink(self):
+        '''Lazily creates the sink for "export_directory", completing its file on interpreter exit.'''
+        sink = self._export_sink
+        if sink is None:
+            with self._lock:
+                sink = self._export_sink
+                if sink is None:
+                    sink = ExportSink(self.export_directory, self.export_format,
+                                      self.export_file_size, self.export_buffer_size)
+                    register_exit_close(sink.close)
+                    self._export_sink = sink
+        return sink
+
+    def get_ring_buffer(self):
+        '''Lazily opens the ring buffer at "ring_buffer_path", creating it if missing.'''
+        ring = self._ring_buffer
+        if ring is None:
+            with self._lock:
+                ring = self._ring_buffer
+                if ring is None:
+                    ring = RingBuffer(self.ring_buffer_path, self.ring_buffer_size)
+                    self._ring_buffer = ring
+        return ring
+
+    def get_spool(self):
+        '''
+        Lazily creates the disk spool for "spool_directory" and, with "spool_autosend",
+        starts a background SpoolSender draining it.
+        '''
+        spool = self._spool
+        if spool is None:
+            with self._lock:
+                spool = self._spool
+                if spool is None:
+                    spool = DiskSpool(self.spool_directory, self.spool_segment_size)
+                    if self.spool_autosend:
+                        SpoolSender(spool, lambda request: send_http_request(self, request)).start()
+                    self._spool = spool
+        return spool
+
 
 class Parameters(object):
     '''
@@ -606,6 +1020,24 @@ class Parameters(object):
 
     '''
 
+    # Parameters identical for all requests of a tracker, they always come first
+    STATIC_FIELDS = ('utmwv', 'utmac', 'utmhn')
+
+    # Query string order of all parameters, see get_query_string(): the attribute order
+    # of __init__(), followed by the parameters only set by the request builders
+    FIELDS = STATIC_FIELDS + (
+        'utmt', 'utms', 'utmn', 'utmcc', 'utme', 'utmni', 'aip', 'utmu',
+        'utmp', 'utmdt', 'utmcs', 'utmr',
+        'utmip', 'utmul', 'utmfl', 'utmje', 'utmsc', 'utmsr', 'utmhid',
+        'utmipc', 'utmipn', 'utmipr', 'utmiqt', 'utmiva',
+        'utmtid', 'utmtst', 'utmtto', 'utmttx', 'utmtsp', 'utmtci', 'utmtrg', 'utmtco',
+        'utmcn', 'utmcr', 'utmcid', 'utmcsr', 'utmgclid', 'utmdclid', 'utmccn', 'utmcmd', 'utmctr', 'utmcct',
+        'utmcvr',
+        'utmsn', 'utmsa', 'utmsid',
+        'ua', 'uip', 'utje',
+    )
+    DYNAMIC_FIELDS = FIELDS[len(STATIC_FIELDS):]
+
     def __init__(self):
         # General Parameters
         self.utmwv = Tracker.VERSION
@@ -786,6 +1218,37 @@ class Parameters(object):
 
         return params
 
+    def get_query_string(self, static_query=None):
+        '''
+        Encode all gif request parameters into the final query string in a single pass
+        over FIELDS. The result is identical to urlencode(get_parameters()) with
+        encodeURIComponent() style escaping.
+
+        static_query -- Already encoded STATIC_FIELDS (see Tracker.get_static_query()),
+            those attributes are skipped then.
+        '''
+        encode = utils.encode_query_value
+        values = self.__dict__
+        fields = Parameters.FIELDS if static_query is None else Parameters.DYNAMIC_FIELDS
+        parts = [
+            '%s=%s' % (attr, encode(values[attr]))
+            for attr in fields
+            if values.get(attr)
+        ]
+        if static_query:
+            parts.insert(0, static_query)
+        return '&'.join(parts)
+
+    @staticmethod
+    def encode_static_query(account_id, domain_name):
+        '''Encodes STATIC_FIELDS the same way get_query_string() does.'''
+        encode = utils.encode_query_value
+        return '&'.join([
+            '%s=%s' % (attr, encode(val))
+            for attr, val in zip(Parameters.STATIC_FIELDS, (Tracker.VERSION, account_id, domain_name))
+            if val
+        ])
+
 
 class Tracker(object):
     '''
@@ -798,6 +1261,7 @@ class Tracker(object):
                    default is true to be consistent with the GA Javascript Client
     custom_variables -- CustomVariable instances
     campaign -- Campaign instance
+    queue -- HitQueue holding the requests of this tracker if config option "queue_requests" is enabled
     '''
 
     '''
@@ -812,6 +1276,7 @@ class Tracker(object):
     '''
     VERSION = '5.3.0'
     config = Config()
+    instances = weakref.WeakSet()
 
     def __init__(self, account_id='', domain_name='', conf=None):
         self.account_id = account_id
@@ -821,6 +1286,10 @@ class Tracker(object):
         self.campaign = None
         if isinstance(conf, Config):
             Tracker.config = conf
+        self.queue = HitQueue(self.config.queue_size,
+                              self.config.queue_overflow,
+                              self.config.queue_block_timeout)
+        Tracker.instances.add(self)
 
     def __setattr__(self, name, value):
         if name == 'account_id':
@@ -834,8 +1303,45 @@ class Tracker(object):
             else:
                 value = None
 
+        if name in ('account_id', 'domain_name', 'allow_hash', 'config'):
+            object.__setattr__(self, '_static_cache', None)
+        elif name == 'custom_variables':
+            object.__setattr__(self, '_custom_variables_x10', None)
+
         object.__setattr__(self, name, value)
 
+    def __get_static_cache(self):
+        config = self.config
+        cache = self.__dict__.get('_static_cache')
+        if cache is None or cache[0] is not config or cache[1] != config.revision:
+            cache = (
+                config,
+                config.revision,
+                Parameters.encode_static_query(self.account_id, self.domain_name),
+                config.endpoint.split('/')[2] if config.endpoint else None,
+                utils.generate_hash(self.domain_name) if self.allow_hash else 1,
+            )
+            self._static_cache = cache
+        return cache
+
+    def get_static_query(self):
+        '''
+        Encoded query string prefix of the parameters which are identical for all
+        requests of this tracker, cached until account_id, domain_name or config change.
+        '''
+        return self.__get_static_cache()[2]
+
+    def get_host_header(self):
+        '''"Host" header derived from the endpoint of the config, cached like get_static_query().'''
+        return self.__get_static_cache()[3]
+
+    def get_domain_hash(self):
+        '''
+        Hash of domain_name used in the cookie parameters (1 if allow_hash is disabled),
+        cached until domain_name or allow_hash change.
+        '''
+        return self.__get_static_cache()[4]
+
     def add_custom_variable(self, custom_var):
         '''
         Equivalent of _setCustomVar() in GA Javascript client
@@ -847,11 +1353,58 @@ class Tracker(object):
         custom_var.validate()
         index = custom_var.index
         self.custom_variables[index] = custom_var
+        self._custom_variables_x10 = None
 
     def remove_custom_variable(self, index):
         '''Equivalent of _deleteCustomVar() in GA Javascript client.'''
         if index in self.custom_variables:
             del self.custom_variables[index]
+            self._custom_variables_x10 = None
+
+    def get_custom_variables_x10(self):
+        '''
+        X10 encoding of the custom variables for the "utme" parameter, cached until
+        add_custom_variable() or remove_custom_variable() get called.
+        '''
+        rendered = self.__dict__.get('_custom_variables_x10')
+        if rendered is None:
+            x10 = X10()
+            for cvar in itervalues(self.custom_variables):
+                name = utils.encode_uri_components(cvar.name)
+                value = utils.encode_uri_components(cvar.value)
+                x10.set_key(Request.X10_CUSTOMVAR_NAME_PROJECT_ID, cvar.index, name)
+                x10.set_key(Request.X10_CUSTOMVAR_VALUE_PROJCT_ID, cvar.index, value)
+
+                if cvar.scope and cvar.scope != CustomVariable.SCOPE_PAGE:
+                    x10.set_key(Request.X10_CUSTOMVAR_SCOPE_PROJECT_ID,
+                                cvar.index, cvar.scope)
+
+            rendered = x10.render_url_string()
+            self._custom_variables_x10 = rendered
+        return rendered
+
+    def fire(self, request):
+        '''Hands a request built by one of the track_* methods to the transport.'''
+        request.fire()
+
+    def flush_pending(self):
+        '''
+        Hands over the hits held back by the transport of this tracker, called
+        by flush() and pyga.shutdown(). Tracker holds nothing back, but subclasses
+        collecting hits into batches (see pyga.measurement) do.
+        '''
+        pass
+
+    def flush(self, workers=4, timeout=None):
+        '''
+        Sends the queued requests of this tracker concurrently and clears the queue.
+        Returns a FlushResult with the amount of sent, failed and dropped requests.
+        '''
+        self.flush_pending()
+        release_queue(self.queue)
+        return flush(self.queue.drain(),
+                     lambda request: send_http_request(self.config, request),
+                     workers, timeout)
 
     def track_pageview(self, page, session, visitor):
         '''Equivalent of _trackPageview() in GA Javascript client.'''
@@ -862,8 +1415,7 @@ class Tracker(object):
             'session': session,
             'page': page,
         }
-        request = PageViewRequest(**params)
-        request.fire()
+        self.fire(PageViewRequest(**params))
 
     def track_event(self, event, session, visitor):
         '''Equivalent of _trackEvent() in GA Javascript client.'''
@@ -876,8 +1428,7 @@ class Tracker(object):
             'session': session,
             'event': event,
         }
-        request = EventRequest(**params)
-        request.fire()
+        self.fire(EventRequest(**params))
 
     def track_transaction(self, transaction, session, visitor):
         '''Combines _addTrans(), _addItem() (indirectly) and _trackTrans() of GA Javascript client.'''
@@ -890,8 +1441,7 @@ class Tracker(object):
             'session': session,
             'transaction': transaction,
         }
-        request = TransactionRequest(**params)
-        request.fire()
+        self.fire(TransactionRequest(**params))
 
         for item in transaction.items:
             item.validate()
@@ -903,8 +1453,46 @@ class Tracker(object):
                 'session': session,
                 'item': item,
             }
-            request = ItemRequest(**params)
-            request.fire()
+            self.fire(ItemRequest(**params))
+
+    def track_pageviews(self, hits):
+        '''
+        Batch version of track_pageview() for an iterable of (page, session, visitor)
+        tuples, see track_batch().
+        '''
+        return self.track_batch(PageViewRequest, hits)
+
+    def track_events(self, hits):
+        '''
+        Batch version of track_event() for an iterable of (event, session, visitor)
+        tuples, see track_batch().
+        '''
+        hits = list(hits)
+        for event, session, visitor in hits:
+            event.validate()
+        return self.track_batch(EventRequest, hits)
+
+    def track_batch(self, request_class, hits):
+        '''
+        Builds a request_class request (like PageViewRequest) for every (subject,
+        session, visitor) tuple of hits and hands all of them to the transport at
+        once. Visitor derived parameters are computed once per visitor and batch,
+        so visitor properties should not change during the call.
+
+        When requests are sent right away, they are sent concurrently by
+        config option "batch_workers" threads and errors are reported instead
+        of raised. Returns a HitResult (request, response, error) per hit, in order;
+        response and error are None for queued, spooled or dispatched requests.
+        '''
+        config = self.config
+        visitor_cache = {}
+        requests = []
+        for subject, session, visitor in hits:
+            request = request_class(config, self, visitor, session, subject)
+            request.visitor_cache = visitor_cache
+            requests.append(request.build_http_request())
+
+        return dispatch_http_requests(config, requests, self.queue)
 
     def track_social(self, social_interaction, page, session, visitor):
         '''Equivalent of _trackSocial() in GA Javascript client.'''
@@ -916,8 +1504,7 @@ class Tracker(object):
             'social_interaction': social_interaction,
             'page': page,
         }
-        request = SocialInteractionRequest(**params)
-        request.fire()
+        self.fire(SocialInteractionRequest(**params))
 
 
 class X10(object):
@@ -933,6 +1520,7 @@ class X10(object):
         '*': "'2",
         '!': "'3",
     }
+    __ESCAPE_TABLE = dict((ord(char), escaped) for char, escaped in __ESCAPE_CHAR_MAP.items())
     __MINIMUM = 1
 
     OBJECT_KEY_NUM = 1
@@ -990,13 +1578,7 @@ class X10(object):
 
     def __escape_extensible_value(self, value):
         '''Escape X10 string values to remove ambiguity for special characters.'''
-        def _translate(char):
-            try:
-                return self.__ESCAPE_CHAR_MAP[char]
-            except KeyError:
-                return char
-
-        return ''.join(map(_translate, str(value)))
+        return utils.text_type(value).translate(X10.__ESCAPE_TABLE)
 
     def __render_data_type(self, data):
         '''Given a data array for a certain type, render its string encoding.'''
@@ -1005,43 +1587,36 @@ class X10(object):
 
         for indx, entry in sorted(data.items()):
             if entry:
-                tmpstr = ''
-
                 # Check if we need to append the number. If the last number was
                 # outputted, or if this is the assumed minimum, then we don't.
                 if indx != X10.__MINIMUM and indx - 1 != last_indx:
-                    tmpstr = '%s%s%s' % (tmpstr, indx, X10.__DELIM_NUM_VALUE)
-
-                tmpstr = '%s%s' % (
-                    tmpstr, self.__escape_extensible_value(entry))
-                result.append(tmpstr)
+                    result.append('%s%s%s' % (indx, X10.__DELIM_NUM_VALUE,
+                                              self.__escape_extensible_value(entry)))
+                else:
+                    result.append(self.__escape_extensible_value(entry))
 
             last_indx = indx
 
-        return "%s%s%s" % (X10.__DELIM_BEGIN, X10.__DELIM_SET.join(result), X10.__DELIM_END)
+        return ''.join((X10.__DELIM_BEGIN, X10.__DELIM_SET.join(result), X10.__DELIM_END))
 
-    def __render_project(self, project):
-        '''Given a project array, render its string encoding.'''
-        result = ''
+    def __render_project(self, project, result):
+        '''Given a project array, append its string encoding to result.'''
         need_type_qualifier = False
 
         for val in X10.__KEY, X10.__VALUE:
             if val in project:
-                data = project[val]
                 if need_type_qualifier:
-                    result = '%s%s' % (result, val)
+                    result.append(val)
 
-                result = '%s%s' % (result, self.__render_data_type(data))
+                result.append(self.__render_data_type(project[val]))
                 need_type_qualifier = False
             else:
                 need_type_qualifier = True
 
-        return result
-
     def render_url_string(self):
-        result = ''
+        result = []
         for project_id, project in self.project_data.items():
-            result = '%s%s%s' % (
-                result, project_id, self.__render_project(project))
+            result.append(str(project_id))
+            self.__render_project(project, result)
 
-        return result
+        return ''.join(result)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import random
+import socket
+import threading
+import time
+try:
+    from httplib import HTTPException
+    from urllib2 import HTTPError, URLError
+except ImportError as e:
+    from http.client import HTTPException
+    from urllib.error import HTTPError, URLError
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+
+def is_transient_error(error):
+    '''Server errors, timeouts and connection problems are worth a retry, client errors are not.'''
+    if isinstance(error, HTTPError):
+        return error.code >= 500
+    return isinstance(error, (URLError, HTTPException, socket.error, socket.timeout))
+
+
+class RetryPolicy(object):
+    '''
+    Retries on transient errors with jittered exponential backoff.
+
+    Properties:
+    attempts -- Amount of retries after the first failed attempt
+    backoff -- Base delay in seconds, doubled with every retry
+    max_backoff -- Upper bound in seconds for a single delay
+
+    '''
+    def __init__(self, attempts=0, backoff=0.1, max_backoff=2):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, retry):
+        '''"Full jitter" delay before the given retry (0 based).'''
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** retry)))
+
+    def call(self, func, *args, **kwargs):
+        retry = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if retry >= self.attempts or not is_transient_error(e):
+                    raise
+            time.sleep(self.delay(retry))
+            retry += 1
+
+
+class CircuitBreaker(object):
+    '''
+    Stops sending to an endpoint after a number of consecutive failures.
+    Once the cool-down period is over a single trial request is let through,
+    closing the circuit again on success.
+
+    Properties:
+    threshold -- Amount of consecutive failures opening the circuit, 0 to disable
+    cooldown -- Seconds the circuit stays open before a trial request is allowed
+    failures -- Current amount of consecutive failures
+
+    '''
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = CircuitBreaker.STATE_CLOSED
+        self.__opened_at = 0
+        self.__lock = threading.Lock()
+
+    def allow(self):
+        '''Whether a request may be sent right now.'''
+        if not self.threshold or self.state == CircuitBreaker.STATE_CLOSED:
+            return True
+
+        with self.__lock:
+            if self.state == CircuitBreaker.STATE_OPEN and time.time() - self.__opened_at >= self.cooldown:
+                self.state = CircuitBreaker.STATE_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        if self.failures or self.state != CircuitBreaker.STATE_CLOSED:
+            with self.__lock:
+                self.failures = 0
+                self.state = CircuitBreaker.STATE_CLOSED
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.threshold and (self.state == CircuitBreaker.STATE_HALF_OPEN or self.failures >= self.threshold):
+                self.state = CircuitBreaker.STATE_OPEN
+                self.__opened_at = time.time()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+'''
+A fixed-size ring buffer of hits in a memory-mapped file, shared by all
+processes mapping the same file, like the pre-forked workers of a
+gunicorn/uwsgi server. Workers append their hits with a single memory copy
+under a short file lock; a single sidecar process (or thread) drains the
+buffer with a RingBufferSender and does all the network I/O.
+
+    pyga drain /dev/shm/pyga.ring
+
+runs such a sidecar.
+'''
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from pyga.spool import decode_hit, encode_hit
+try:
+    import fcntl
+except ImportError as e:
+    fcntl = None
+try:
+    from urllib2 import HTTPError
+except ImportError as e:
+    from urllib.error import HTTPError
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PGRB'
+VERSION = 1
+
+# Magic, version, capacity, then read position, write position and amount of dropped hits.
+# Positions only ever grow, the offset into the data area is position % capacity.
+HEADER = struct.Struct('>4sIQ')
+POSITIONS = struct.Struct('>QQQ')
+POSITIONS_OFFSET = HEADER.size
+DATA_OFFSET = 64
+
+RECORD_LENGTH = struct.Struct('>I')
+
+RingBufferStats = namedtuple('RingBufferStats', 'used capacity dropped')
+
+
+class RingBuffer(object):
+    '''
+    Ring buffer of encoded hits (see pyga.spool.encode_hit()) in the file at
+    path, created with capacity bytes for records if missing. An existing file
+    keeps its capacity. Hits appended to a full buffer are dropped and counted.
+
+    Any amount of processes and threads can append, but only one should
+    drain the buffer. Requires fcntl, so it is not available on Windows.
+
+    Properties:
+    path -- Path of the buffer file, ideally on a tmpfs like /dev/shm
+    capacity -- Size in bytes of the data area
+
+    '''
+    def __init__(self, path, capacity=8 * 1024 * 1024):
+        if fcntl is None:
+            raise NotImplementedError('RingBuffer requires fcntl file locks.')
+
+        self.path = path
+        self.capacity = capacity
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__fd = None
+        self.__map = None
+        self.__open()
+
+    def append(self, request):
+        '''Appends a built urllib request, returns False if it got dropped because the buffer is full.'''
+        return self.append_payload(encode_hit(request))
+
+    def append_payload(self, payload):
+        '''Appends an encoded hit, see append().'''
+        record = RECORD_LENGTH.pack(len(payload)) + payload
+        if len(record) > self.capacity:
+            raise ValueError('Hit of %s bytes exceeds the capacity of the ring buffer.' % len(payload))
+
+        with self.__locked() as data:
+            head, tail, dropped = POSITIONS.unpack_from(data, POSITIONS_OFFSET)
+            if tail - head + len(record) > self.capacity:
+                POSITIONS.pack_into(data, POSITIONS_OFFSET, head, tail, dropped + 1)
+                return False
+
+            self.__write(data, tail, record)
+            POSITIONS.pack_into(data, POSITIONS_OFFSET, head, tail + len(record), dropped)
+        return True
+
+    def peek(self, max_hits=100):
+        '''
+        Returns a list of up to max_hits encoded hits from the start of the buffer,
+        without removing them, and the position to pass to commit() once done with them.
+        '''
+        payloads = []
+        with self.__locked() as data:
+            head, tail, dropped = POSITIONS.unpack_from(data, POSITIONS_OFFSET)
+            position = head
+            while position < tail and len(payloads) < max_hits:
+                length, = RECORD_LENGTH.unpack(self.__read(data, position, RECORD_LENGTH.size))
+                payloads.append(self.__read(data, position + RECORD_LENGTH.size, length))
+                position += RECORD_LENGTH.size + length
+        return payloads, position
+
+    def commit(self, position):
+        '''Removes the hits before position, as returned by peek().'''
+        with self.__locked() as data:
+            head, tail, dropped = POSITIONS.unpack_from(data, POSITIONS_OFFSET)
+            if head < position <= tail:
+                POSITIONS.pack_into(data, POSITIONS_OFFSET, position, tail, dropped)
+
+    def stats(self):
+        '''Returns a RingBufferStats with the bytes used, the capacity and the amount of dropped hits.'''
+        with self.__locked() as data:
+            head, tail, dropped = POSITIONS.unpack_from(data, POSITIONS_OFFSET)
+        return RingBufferStats(tail - head, self.capacity, dropped)
+
+    def close(self):
+        with self.__lock:
+            if self.__map is not None:
+                self.__map.close()
+                os.close(self.__fd)
+                self.__map = self.__fd = None
+
+    @contextmanager
+    def __locked(self):
+        with self.__lock:
+            if self.__pid != os.getpid():
+                # flock() doesn't exclude processes sharing an inherited descriptor,
+                # so a forked child opens the file again
+                self.__map.close()
+                os.close(self.__fd)
+                self.__open()
+            fcntl.flock(self.__fd, fcntl.LOCK_EX)
+            try:
+                yield self.__map
+            finally:
+                fcntl.flock(self.__fd, fcntl.LOCK_UN)
+
+    def __open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.read(fd, HEADER.size)
+            if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+                magic, version, capacity = HEADER.unpack(header)
+                if version != VERSION:
+                    raise ValueError('Unsupported ring buffer version %s, expected %s.' % (version, VERSION))
+                self.capacity = capacity
+            else:
+                os.ftruncate(fd, DATA_OFFSET + self.capacity)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, HEADER.pack(MAGIC, VERSION, self.capacity) + POSITIONS.pack(0, 0, 0))
+            data = mmap.mmap(fd, DATA_OFFSET + self.capacity)
+        except Exception:
+            os.close(fd)
+            raise
+        finally:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except (IOError, OSError, ValueError):
+                pass
+
+        self.__fd, self.__map, self.__pid = fd, data, os.getpid()
+
+    def __write(self, data, position, record):
+        start = position % self.capacity
+        first = min(len(record), self.capacity - start)
+        data[DATA_OFFSET + start:DATA_OFFSET + start + first] = record[:first]
+        if first < len(record):
+            data[DATA_OFFSET:DATA_OFFSET + len(record) - first] = record[first:]
+
+    def __read(self, data, position, length):
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        chunk = data[DATA_OFFSET + start:DATA_OFFSET + start + first]
+        if first < length:
+            chunk += data[DATA_OFFSET:DATA_OFFSET + length - first]
+        return chunk
+
+
+class RingBufferSender(object):
+    '''
+    Drains a RingBuffer in order, removing hits once sent. Draining stops at
+    the first hit failing with anything but a client error (HTTP 4xx, which
+    drops the hit) and is retried later; hits keep piling up in the buffer
+    meanwhile, until it is full.
+
+    Properties:
+    ring -- RingBuffer to drain
+    send -- Callable which actually sends a single urllib request
+    interval -- Seconds to wait once the buffer is empty or sending failed
+    batch_size -- Amount of hits taken from the buffer at once
+
+    '''
+    def __init__(self, ring, send, interval=0.1, batch_size=100):
+        self.ring = ring
+        self.send = send
+        self.interval = interval
+        self.batch_size = batch_size
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def drain(self):
+        '''Sends all hits in the buffer, returns the amount of hits sent.'''
+        sent = 0
+        while True:
+            payloads, position = self.ring.peek(self.batch_size)
+            if not payloads:
+                return sent
+
+            for i, payload in enumerate(payloads):
+                try:
+                    self.send(decode_hit(payload))
+                except HTTPError as e:
+                    if e.code >= 500:
+                        return self.__stop_at(payloads, position, i, sent, e)
+                    logger.warning('Dropping buffered hit rejected by the endpoint: %s', e)
+                except Exception as e:
+                    return self.__stop_at(payloads, position, i, sent, e)
+                else:
+                    sent += 1
+            self.ring.commit(position)
+
+    def run(self):
+        '''Drains the buffer until close() gets called, like a sidecar process does.'''
+        while not self.__stop.is_set():
+            try:
+                sent = self.drain()
+            except Exception as e:
+                logger.warning('Draining ring buffer failed: %s', e)
+                sent = 0
+            if not sent:
+                self.__stop.wait(self.interval)
+
+    def start(self):
+        '''Drains the buffer from a background thread of this process.'''
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.run, name='pyga-ring-sender')
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def close(self, timeout=None):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def __stop_at(self, payloads, position, failed, sent, error):
+        logger.warning('Sending buffered hit failed, retrying later: %s', error)
+        if failed:
+            # Remove the hits handled before the failed one
+            self.ring.commit(position - sum(RECORD_LENGTH.size + len(p) for p in payloads[failed:]))
+        return sent
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from pyga.entities import Session
+from pyga.stores import SESSION_TIMEOUT
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+
+class TimerWheel(object):
+    '''
+    A hierarchical timer wheel: keys get scheduled to expire at a deadline and
+    advance() returns the keys whose deadline passed. Scheduling, rescheduling
+    and expiring a key take O(1) amortized time, no matter how many keys are
+    scheduled.
+
+    Level 0 has one slot per tick, every higher level has slots spanning a
+    whole turn of the level below, into which their keys cascade down once
+    that turn comes. Rescheduling leaves the former entry of a key behind,
+    which is skipped when reached.
+
+    Properties:
+    resolution -- Seconds (float allowed) per tick, deadlines are rounded up to it
+    size -- Amount of slots per level
+    levels -- Amount of levels; deadlines beyond size ** levels ticks wait on the
+              top level and cascade again until they are due
+
+    '''
+    def __init__(self, resolution=1, size=64, levels=3, now=None):
+        self.resolution = resolution
+        self.size = size
+        self.levels = levels
+        self.__tick = self.__to_tick(time.time() if now is None else now)
+        self.__wheels = [[[] for i in range(size)] for level in range(levels)]
+        self.__deadlines = {}
+
+    def __len__(self):
+        return len(self.__deadlines)
+
+    def __contains__(self, key):
+        return key in self.__deadlines
+
+    def schedule(self, key, deadline):
+        '''(Re)schedules key to expire at deadline, given in seconds like time.time().'''
+        tick = max(self.__to_tick(deadline, ceil=True), self.__tick + 1)
+        self.__deadlines[key] = tick
+        self.__insert(key, tick)
+
+    def cancel(self, key):
+        '''Unschedules key, returns whether it was scheduled.'''
+        return self.__deadlines.pop(key, None) is not None
+
+    def advance(self, now=None):
+        '''Moves the wheel forward to now and returns the list of expired keys.'''
+        target = self.__to_tick(time.time() if now is None else now)
+        expired = []
+        while self.__tick < target:
+            if not self.__deadlines:
+                # Nothing to expire, skip right to the target
+                self.__tick = target
+                break
+
+            self.__tick += 1
+            tick = self.__tick
+            for level in range(1, self.levels):
+                if tick % (self.size ** level):
+                    break
+                self.__cascade(level)
+
+            slot = self.__wheels[0][tick % self.size]
+            entries, slot[:] = slot[:], []
+            for key, deadline in entries:
+                if self.__deadlines.get(key) != deadline:
+                    continue
+                if deadline <= tick:
+                    del self.__deadlines[key]
+                    expired.append(key)
+                else:
+                    self.__insert(key, deadline)
+        return expired
+
+    def __to_tick(self, seconds, ceil=False):
+        tick = seconds / float(self.resolution)
+        if ceil and tick != int(tick):
+            return int(tick) + 1
+        return int(tick)
+
+    def __insert(self, key, deadline):
+        delta = deadline - self.__tick
+        for level in range(self.levels):
+            if delta < self.size ** (level + 1):
+                span = self.size ** level
+                self.__wheels[level][(deadline // span) % self.size].append((key, deadline))
+                return
+
+        # Too far ahead, wait in the slot of the top level turned to last
+        span = self.size ** (self.levels - 1)
+        self.__wheels[-1][(self.__tick // span - 1) % self.size].append((key, deadline))
+
+    def __cascade(self, level):
+        span = self.size ** level
+        slot = self.__wheels[level][(self.__tick // span) % self.size]
+        entries, slot[:] = slot[:], []
+        for key, deadline in entries:
+            if self.__deadlines.get(key) == deadline:
+                self.__insert(key, deadline)
+
+
+class SessionManager(object):
+    '''
+    Keeps the active Session of every key (like a user or cookie ID) and
+    applies GA's inactivity rule: a session ends once no hit arrived for
+    timeout seconds. Idle sessions are expired using a TimerWheel, so the
+    cost does not grow with the amount of active sessions.
+
+    Call hit() for every tracked hit; once the session of a key expired,
+    the next hit transparently starts a new Session which is added to the
+    visitor with Visitor.add_session().
+
+    Properties:
+    timeout -- Seconds of inactivity after which a session ends
+    on_expire -- Optional callable called with the key and Session of every expired session
+
+    '''
+    def __init__(self, timeout=SESSION_TIMEOUT, on_expire=None, resolution=1):
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.resolution = resolution
+        self.__wheel = None
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        '''Amount of active sessions.'''
+        return len(self.__sessions)
+
+    def get(self, key):
+        '''Returns the active Session of key or None, without counting as activity.'''
+        return self.__sessions.get(key)
+
+    def hit(self, key, visitor, now=None):
+        '''
+        Returns the Session to track a hit of visitor with, starting a new one
+        if key has no active session, and marks the session active at now.
+        '''
+        if now is None:
+            now = time.time()
+
+        with self.__lock:
+            expired = self.__expire(now)
+            session = self.__sessions.get(key)
+            if session is None:
+                session = Session()
+                session.start_timestamp = int(now)
+                if visitor is not None:
+                    visitor.add_session(session)
+                self.__sessions[key] = session
+            self.__wheel.schedule(key, now + self.timeout)
+
+        self.__notify(expired)
+        return session
+
+    def end(self, key):
+        '''Ends the session of key right away, returns it or None.'''
+        with self.__lock:
+            if self.__wheel is not None:
+                self.__wheel.cancel(key)
+            return self.__sessions.pop(key, None)
+
+    def expire(self, now=None):
+        '''Expires idle sessions, returns the list of their keys. hit() does this as well.'''
+        with self.__lock:
+            expired = self.__expire(time.time() if now is None else now)
+        self.__notify(expired)
+        return [key for key, session in expired]
+
+    def __expire(self, now):
+        if self.__wheel is None:
+            # Start at the time of the first hit
+            self.__wheel = TimerWheel(self.resolution, now=now)
+        return [(key, self.__sessions.pop(key)) for key in self.__wheel.advance(now)]
+
+    def __notify(self, expired):
+        if self.on_expire is not None:
+            for key, session in expired:
+                self.on_expire(key, session)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from pyga.exceptions import CircuitOpenError
+from pyga.retry import is_transient_error
+try:
+    from urllib2 import Request as urllib_request
+except ImportError as e:
+    from urllib.request import Request as urllib_request
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('>II')
+
+
+def encode_hit(request):
+    '''Encodes a built urllib request (URL, POST body and headers) into bytes.'''
+    data = request.data if hasattr(request, 'data') else request.get_data()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+
+    hit = {
+        'url': request.get_full_url(),
+        'data': data,
+        'headers': dict((k, str(v)) for k, v in request.header_items()),
+    }
+    return json.dumps(hit, separators=(',', ':')).encode('utf-8')
+
+
+def decode_hit(payload):
+    '''Rebuilds a urllib request from bytes produced by encode_hit().'''
+    hit = json.loads(payload.decode('utf-8'))
+    return urllib_request(hit['url'], hit['data'], hit['headers'])
+
+
+def pack_record(payload):
+    '''Frames a payload as length, CRC32 and payload.'''
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+class DiskSpool(object):
+    '''
+    A durable, append-only spool of hits split into numbered segment files
+    plus a checkpoint file telling how far the hits have been sent.
+
+    Only one process should append to and only one process should drain
+    a given spool directory.
+
+    Properties:
+    directory -- Directory holding the segment and checkpoint files
+    segment_size -- Size in bytes after which a new segment file is started
+    fsync -- Whether to fsync after every appended hit
+
+    '''
+    SEGMENT_SUFFIX = '.seg'
+    CHECKPOINT = 'checkpoint'
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__segment = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def segments(self):
+        '''Sorted sequence numbers of all existing segment files.'''
+        return sorted(int(name[:-len(self.SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.directory)
+                      if name.endswith(self.SEGMENT_SUFFIX))
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, '%020d%s' % (segment, self.SEGMENT_SUFFIX))
+
+    def append(self, request):
+        '''Appends a built urllib request to the current segment.'''
+        record = pack_record(encode_hit(request))
+        with self.__lock:
+            if self.__file is None or self.__file.tell() >= self.segment_size:
+                self.__rotate()
+
+            self.__file.write(record)
+            self.__file.flush()
+            if self.fsync:
+                os.fsync(self.__file.fileno())
+
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def read_checkpoint(self):
+        '''Returns (segment, offset) of the first hit not sent yet.'''
+        try:
+            with open(os.path.join(self.directory, self.CHECKPOINT)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, OSError, ValueError):
+            segments = self.segments()
+            return (segments[0] if segments else 0), 0
+
+    def write_checkpoint(self, segment, offset):
+        path = os.path.join(self.directory, self.CHECKPOINT)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'w') as f:
+            f.write('%s %s' % (segment, offset))
+        os.rename(tmp_path, path)
+
+    def read(self, segment, offset):
+        '''
+        Yields (payload, next_offset) for each complete record of a segment starting at offset.
+        Stops at a partially written record.
+        '''
+        try:
+            f = open(self.segment_path(segment), 'rb')
+        except (IOError, OSError):
+            return
+
+        with f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+                    return
+                offset += RECORD_HEADER.size + length
+                yield payload, offset
+
+    def __rotate(self):
+        if self.__file is not None:
+            self.__file.close()
+
+        segments = self.segments()
+        self.__segment = segments[-1] + 1 if segments else 0
+        self.__file = open(self.segment_path(self.__segment), 'ab')
+
+
+class SpoolSender(object):
+    '''
+    Drains a DiskSpool in order, checkpointing after each sent hit and
+    removing fully sent segments. Draining stops at the first hit failing
+    with a transient error (see pyga.retry.is_transient_error()) and is
+    retried later, so nothing gets lost during endpoint outages. Hits which
+    are never going to succeed, like those rejected with HTTP 4xx, are
+    dropped and counted instead of blocking the spool.
+
+    Properties:
+    spool -- DiskSpool to drain
+    send -- Callable which actually sends a single urllib request
+    interval -- Seconds to wait between two drain runs of the background thread
+    dropped -- Amount of hits dropped because they failed with a permanent error
+
+    '''
+    def __init__(self, spool, send, interval=1):
+        self.spool = spool
+        self.send = send
+        self.interval = interval
+        self.dropped = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def drain(self):
+        '''Sends all complete hits in the spool, returns the amount of hits sent.'''
+        sent = 0
+        segment, offset = self.spool.read_checkpoint()
+        while True:
+            offset, count, done = self.__send_segment(segment, offset)
+            sent += count
+            if not done:
+                return sent
+
+            later = [s for s in self.spool.segments() if s > segment]
+            if not later:
+                return sent
+
+            # The writer moved on to a newer segment, so this one is complete. It may
+            # have appended to it after the read above, so read the rest once more.
+            offset, count, done = self.__send_segment(segment, offset)
+            sent += count
+            if not done:
+                return sent
+
+            self.__remove_segment(segment, offset)
+            segment, offset = later[0], 0
+            self.spool.write_checkpoint(segment, offset)
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name='pyga-spool-sender')
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def close(self, timeout=None):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def __send_segment(self, segment, offset):
+        '''
+        Sends the hits of segment from offset on, checkpointing after each one.
+        Returns the offset reached, the amount of hits sent and whether sending succeeded.
+        '''
+        sent = 0
+        for payload, next_offset in self.spool.read(segment, offset):
+            try:
+                self.send(decode_hit(payload))
+            except Exception as e:
+                if isinstance(e, CircuitOpenError) or is_transient_error(e):
+                    logger.warning('Sending spooled hit failed, retrying later: %s', e)
+                    return offset, sent, False
+                logger.warning('Dropping spooled hit which failed permanently: %s', e)
+                self.dropped += 1
+            else:
+                sent += 1
+            offset = next_offset
+            self.spool.write_checkpoint(segment, offset)
+        return offset, sent, True
+
+    def __remove_segment(self, segment, offset):
+        path = self.spool.segment_path(segment)
+        try:
+            if os.path.getsize(path) > offset:
+                logger.warning('Skipping corrupt remainder of spool segment %s', path)
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __run(self):
+        while not self.__stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                logger.warning('Draining spool failed: %s', e)
+            self.__stop.wait(self.interval)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import sqlite3
+import threading
+from pyga import utils
+from pyga.entities import Session, Visitor
+
+__author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
+__license__ = "Simplified BSD"
+
+logger = logging.getLogger(__name__)
+
+# Sessions time out after 30 minutes of inactivity, just like with the GA Javascript client
+SESSION_TIMEOUT = 30 * 60
+
+
+class Store(object):
+    '''
+    Base class of visitor/session stores, which keep the Visitor and Session
+    of a key (like a user or cookie ID) between requests, the job the "__utma"
+    and "__utmb" cookies do for the GA Javascript client.
+
+    Subclasses implement _read_many(), _write_many() and delete_many().
+
+    Properties:
+    session_timeout -- Seconds of inactivity after which a stored session has expired
+    visitor_timeout -- Seconds of inactivity after which a stored visitor is forgotten,
+                       None to keep visitors as long as the backend does
+
+    '''
+    def __init__(self, session_timeout=SESSION_TIMEOUT, visitor_timeout=None):
+        self.session_timeout = session_timeout
+        self.visitor_timeout = visitor_timeout
+
+    def get_many(self, keys):
+        '''
+        Returns a dict of key to (visitor, session) for all given keys having a visitor stored.
+        session is None if the stored session has expired.
+        '''
+        now = utils.get_timestamp()
+        result = {}
+        for key, (visitor, session, last_activity) in self._read_many(keys).items():
+            idle = now - last_activity
+            if self.visitor_timeout is not None and idle > self.visitor_timeout:
+                continue
+            if session is not None and idle > self.session_timeout:
+                session = None
+            result[key] = (visitor, session)
+        return result
+
+    def put_many(self, items):
+        '''Stores a dict of key to (visitor, session), marking them active right now.'''
+        now = utils.get_timestamp()
+        self._write_many(dict((key, (visitor, session, now)) for key, (visitor, session) in items.items()))
+
+    def get(self, key):
+        '''Returns (visitor, session) of key, (None, None) if nothing is stored.'''
+        return self.get_many((key,)).get(key, (None, None))
+
+    def put(self, key, visitor, session):
+        self.put_many({key: (visitor, session)})
+
+    def load(self, key):
+        '''
+        Returns (visitor, session) of key, creating a new Visitor if none is stored
+        and a new Session, which gets added to the visitor, if the stored one expired.
+        '''
+        visitor, session = self.get(key)
+        if visitor is None:
+            visitor = Visitor()
+        if session is None:
+            session = Session()
+            visitor.add_session(session)
+        return visitor, session
+
+    def save(self, key, visitor, session):
+        '''Stores visitor and session after a hit was tracked with them.'''
+        self.put(key, visitor, session)
+
+    def delete_many(self, keys):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _read_many(self, keys):
+        '''Returns a dict of key to (visitor, session, last_activity) for stored keys.'''
+        raise NotImplementedError
+
+    def _write_many(self, records):
+        '''Stores a dict of key to (visitor, session, last_activity).'''
+        raise NotImplementedError
+
+
+class MemoryStore(Store):
+    '''
+    Keeps visitors and sessions in process memory, evicting the least
+    recently used keys when full. Stored objects are returned as they are,
+    so changes to them are seen by later calls even without put().
+
+    Properties:
+    maxsize -- Maximum amount of keys held
+
+    '''
+    def __init__(self, maxsize=100000, session_timeout=SESSION_TIMEOUT, visitor_timeout=None):
+        super(MemoryStore, self).__init__(session_timeout, visitor_timeout)
+        self.maxsize = maxsize
+        self.__records = utils.LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self.__records)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.__records.pop(key)
+
+    def _read_many(self, keys):
+        result = {}
+        for key in keys:
+            record = self.__records.get(key)
+            if record is not None:
+                result[key] = record
+        return result
+
+    def _write_many(self, records):
+        for key, record in records.items():
+            self.__records.set(key, record)
+
+
+class SQLiteStore(Store):
+    '''
+    Keeps visitors and sessions in a local SQLite database, encoded with
+    their compact to_bytes() representation. Batched calls use a single
+    statement per chunk of keys and a single transaction. Keys are stored
+    as text, so 1 and '1' are the same key.
+
+    Properties:
+    path -- Path of the database file, ':memory:' for a private in-memory database
+    table -- Name of the table used, created if missing
+
+    '''
+    # Stay below SQLite's default limit of 999 variables per statement
+    CHUNK_SIZE = 500
+
+    def __init__(self, path, table='pyga_visitors', session_timeout=SESSION_TIMEOUT, visitor_timeout=None):
+        super(SQLiteStore, self).__init__(session_timeout, visitor_timeout)
+        self.path = path
+        self.table = table
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, visitor BLOB NOT NULL, '
+                'session BLOB, last_activity INTEGER NOT NULL)' % table)
+            self.__connection.execute(
+                'CREATE INDEX IF NOT EXISTS %s_last_activity ON %s (last_activity)' % (table, table))
+
+    def delete_many(self, keys):
+        keys = ['%s' % key for key in keys]
+        with self.__lock:
+            with self.__connection:
+                for i in range(0, len(keys), self.CHUNK_SIZE):
+                    chunk = keys[i:i + self.CHUNK_SIZE]
+                    self.__connection.execute('DELETE FROM %s WHERE key IN (%s)'
+                                              % (self.table, ','.join('?' * len(chunk))), chunk)
+
+    def purge(self):
+        '''Deletes visitors idle for longer than visitor_timeout, returns the amount deleted.'''
+        if self.visitor_timeout is None:
+            return 0
+
+        with self.__lock:
+            with self.__connection:
+                cursor = self.__connection.execute('DELETE FROM %s WHERE last_activity < ?' % self.table,
+                                                   (utils.get_timestamp() - self.visitor_timeout,))
+                return cursor.rowcount
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def _read_many(self, keys):
+        # Results are keyed like requested
+        requested = dict(('%s' % key, key) for key in keys)
+        keys = list(requested)
+        result = {}
+        with self.__lock:
+            for i in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[i:i + self.CHUNK_SIZE]
+                rows = self.__connection.execute(
+                    'SELECT key, visitor, session, last_activity FROM %s WHERE key IN (%s)'
+                    % (self.table, ','.join('?' * len(chunk))), chunk)
+                for key, visitor, session, last_activity in rows:
+                    result[requested[key]] = (
+                        Visitor.from_bytes(bytes(visitor)),
+                        None if session is None else Session.from_bytes(bytes(session)),
+                        last_activity,
+                    )
+        return result
+
+    def _write_many(self, records):
+        rows = [('%s' % key,
+                 sqlite3.Binary(visitor.to_bytes()),
+                 None if session is None else sqlite3.Binary(session.to_bytes()),
+                 last_activity)
+                for key, (visitor, session, last_activity) in records.items()]
+        with self.__lock:
+            with self.__connection:
+                self.__connection.executemany(
+                    'INSERT OR REPLACE INTO %s (key, visitor, session, last_activity) VALUES (?, ?, ?, ?)'
+                    % self.table, rows)
+
+
+class WriteBehindStore(Store):
+    '''
+    Wraps another store, collecting writes in memory and passing them on in
+    batches. Repeated writes of the same key, like one per tracked hit, are
+    coalesced into a single one. Reads see pending writes.
+
+    Pending writes are passed on once batch_size keys are pending, every
+    interval seconds while the background thread runs (see start()) and on close().
+
+    Properties:
+    store -- Store the writes get passed on to
+    batch_size -- Amount of pending keys triggering a write
+    interval -- Seconds between two writes of the background thread
+
+    '''
+    def __init__(self, store, batch_size=500, interval=1):
+        super(WriteBehindStore, self).__init__(store.session_timeout, store.visitor_timeout)
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.__pending = {}
+        self.__flushing = {}
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __len__(self):
+        '''Amount of keys waiting to be written.'''
+        return len(self.__pending)
+
+    def flush(self):
+        '''Passes all pending writes on to the wrapped store.'''
+        with self.__flush_lock:
+            with self.__lock:
+                # Reads keep seeing the records being written until they are
+                pending = self.__flushing = self.__pending
+                self.__pending = {}
+            if not pending:
+                return
+
+            try:
+                self.store._write_many(pending)
+            except Exception:
+                # Keep them, unless they were written again meanwhile
+                with self.__lock:
+                    for key, record in pending.items():
+                        self.__pending.setdefault(key, record)
+                raise
+            finally:
+                with self.__lock:
+                    self.__flushing = {}
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        with self.__lock:
+            for key in keys:
+                self.__pending.pop(key, None)
+                self.__flushing.pop(key, None)
+        self.store.delete_many(keys)
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name='pyga-write-behind')
+            self.__thread.daemon = True
+            self.__thread.start()
+            atexit.register(self.close)
+
+    def close(self, timeout=None):
+        '''Stops the background thread, writes everything pending and closes the wrapped store.'''
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+        self.flush()
+        self.store.close()
+
+    def _read_many(self, keys):
+        result = {}
+        missing = []
+        with self.__lock:
+            for key in keys:
+                record = self.__pending.get(key) or self.__flushing.get(key)
+                if record is None:
+                    missing.append(key)
+                else:
+                    result[key] = record
+        if missing:
+            result.update(self.store._read_many(missing))
+        return result
+
+    def _write_many(self, records):
+        with self.__lock:
+            self.__pending.update(records)
+            full = len(self.__pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def __run(self):
+        while not self.__stop.is_set():
+            self.__stop.wait(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('Writing visitors failed, retrying later: %s', e)
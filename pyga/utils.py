@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 from random import randint
+import calendar
+import math
 import re
+import socket
 import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from datetime import datetime
+from functools import wraps
 
 try:
     from urllib import quote
@@ -19,11 +26,19 @@ else:
 __author__ = "Arun KR (kra3) <the1.arun@gmail.com>"
 __license__ = "Simplified BSD"
 
-RE_IP = re.compile(r'^[\d+]{1,3}\.[\d+]{1,3}\.[\d+]{1,3}\.[\d+]{1,3}$', re.I)
-RE_PRIV_IP = re.compile(r'^(?:127\.0\.0\.1|10\.|192\.168\.|172\.(?:1[6-9]|2[0-9]|3[0-1])\.)')
 RE_LOCALE = re.compile(r'(^|\s*,\s*)([a-zA-Z]{1,8}(-[a-zA-Z]{1,8})*)\s*(;\s*q\s*=\s*(1(\.0{0,3})?|0(\.[0-9]{0,3})))?', re.I)
 RE_GA_ACCOUNT_ID = re.compile(r'^(UA|MO)-[0-9]*-[0-9]*$')
-RE_FIRST_THREE_OCTETS_OF_IP = re.compile(r'^((\d{1,3}\.){3})\d{1,3}$')
+
+LOCALE_CACHE_SIZE = 1024
+DIGITS = '0123456789'
+PRIVATE_172_OCTETS = frozenset('%s' % i for i in range(16, 32))
+IPV4_MAPPED_PREFIX = b'\0' * 10 + b'\xff\xff'
+IPV6_LOOPBACK = b'\0' * 15 + b'\x01'
+
+# Characters left alone by Javascript's encodeURIComponent() but escaped by quote()
+URI_COMPONENT_SAFE_CHARS = "!*'()"
+QUERY_VALUE_CACHE_SIZE = 4096
+_query_value_cache = {}
 
 def convert_ga_timestamp(timestamp_string):
     timestamp = float(timestamp_string)
@@ -31,14 +46,35 @@ def convert_ga_timestamp(timestamp_string):
         timestamp /= 1000
     return datetime.utcfromtimestamp(timestamp)
 
+def parse_ga_timestamp(timestamp_string):
+    '''Like convert_ga_timestamp(), but returns integer epoch seconds. Raises ValueError for inf and nan.'''
+    timestamp = float(timestamp_string)
+    if math.isinf(timestamp) or math.isnan(timestamp):
+        raise ValueError('Invalid timestamp %r' % timestamp_string)
+    if timestamp > ((2 ** 31) - 1):
+        timestamp /= 1000
+    return int(timestamp)
+
+def get_timestamp():
+    '''Current time as integer epoch seconds, all that the GA cookies need.'''
+    return int(time.time())
+
+def timestamp_to_datetime(timestamp):
+    return datetime.utcfromtimestamp(timestamp)
+
+def datetime_to_timestamp(value):
+    '''Integer epoch seconds of a naive UTC datetime.'''
+    return calendar.timegm(value.timetuple())
+
 def get_32bit_random_num():
     return randint(0, 0x7fffffff)
 
 def is_valid_ip(ip):
-    return True if RE_IP.match(str(ip)) else False
+    return classify_ip(ip) is not None
 
 def is_private_ip(ip):
-    return True if RE_PRIV_IP.match(str(ip)) else False
+    info = classify_ip(ip)
+    return info is not None and info.private
 
 def validate_locale(locale):
     return RE_LOCALE.findall(str(locale))
@@ -59,14 +95,180 @@ def generate_hash(tmpstr):
 
     return hash_val
 
+class LRUCache(object):
+    '''
+    A thread safe mapping holding at most maxsize entries,
+    evicting the least recently used one when full.
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def get(self, key, default=None):
+        with self.__lock:
+            try:
+                value = self.__data.pop(key)
+            except KeyError:
+                return default
+            self.__data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__data.pop(key, None)
+            if len(self.__data) >= self.maxsize:
+                self.__data.popitem(last=False)
+            self.__data[key] = value
+
+    def pop(self, key, default=None):
+        with self.__lock:
+            return self.__data.pop(key, default)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+def lru_memoize(maxsize=1024):
+    '''Decorator caching the results of a single argument function in an LRUCache.'''
+    def decorator(func):
+        cache = LRUCache(maxsize)
+        missing = object()
+
+        @wraps(func)
+        def wrapper(arg):
+            result = cache.get(arg, missing)
+            if result is missing:
+                result = func(arg)
+                cache.set(arg, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+# generate_hash() for repeated inputs like user agent strings
+cached_generate_hash = lru_memoize(4096)(generate_hash)
+
+class InternPool(object):
+    '''
+    A bounded pool of canonical string objects. intern() returns the pooled
+    object equal to the given string, so that equal strings held by many objects
+    share one copy, and their hash, which Python caches per string object,
+    gets computed only once. The least recently used strings get evicted.
+    '''
+    def __init__(self, maxsize=4096):
+        self.__strings = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self.__strings)
+
+    def __contains__(self, value):
+        return value in self.__strings
+
+    def intern(self, value):
+        '''Returns the pooled string equal to value; non strings are returned as they are.'''
+        if not isinstance(value, (text_type, bytes)):
+            return value
+
+        pooled = self.__strings.get(value)
+        if pooled is None:
+            self.__strings.set(value, value)
+            return value
+        return pooled
+
+    def clear(self):
+        self.__strings.clear()
+
+IPInfo = namedtuple('IPInfo', 'version private anonymized')
+
+def _is_ipv4(ip):
+    parts = ip.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not 0 < len(part) < 4 or part.strip(DIGITS):
+            return False
+    return True
+
+def _is_private_ipv4(ip):
+    if ip == '127.0.0.1' or ip.startswith('10.') or ip.startswith('192.168.'):
+        return True
+    parts = ip.split('.')
+    return parts[0] == '172' and parts[1] in PRIVATE_172_OCTETS
+
+def _anonymize_ipv4(ip):
+    return '%s.0' % ip.rsplit('.', 1)[0]
+
+def _parse_ipv6(ip):
+    try:
+        return socket.inet_pton(socket.AF_INET6, str(ip.split('%', 1)[0]))
+    except (socket.error, ValueError, AttributeError):
+        # AttributeError: no inet_pton() on this platform
+        return None
+
+def classify_ip(ip):
+    '''
+    Validates an IPv4 or IPv6 address without regular expressions.
+    Returns an IPInfo (version, private, anonymized) tuple or None for invalid addresses.
+
+    IPv4 addresses are checked as leniently as they always were (four groups of 1-3 digits).
+    Anonymized IPv4 addresses have their last octet zeroed, IPv6 addresses keep their
+    first 48 bits only.
+    '''
+    ip = '%s' % ip
+    if _is_ipv4(ip):
+        return IPInfo(4, _is_private_ipv4(ip), _anonymize_ipv4(ip))
+
+    if ':' not in ip:
+        return None
+    packed = _parse_ipv6(ip)
+    if packed is None:
+        return None
+
+    if packed.startswith(IPV4_MAPPED_PREFIX):
+        ipv4 = socket.inet_ntop(socket.AF_INET, packed[12:])
+        return IPInfo(6, _is_private_ipv4(ipv4), '::ffff:%s' % _anonymize_ipv4(ipv4))
+
+    first, second = bytearray(packed[:2])
+    private = (packed == IPV6_LOOPBACK or
+               first & 0xfe == 0xfc or  # Unique local, fc00::/7
+               (first == 0xfe and second & 0xc0 == 0x80))  # Link local, fe80::/10
+    anonymized = socket.inet_ntop(socket.AF_INET6, packed[:6] + b'\0' * 10)
+    return IPInfo(6, private, anonymized)
+
 def anonymize_ip(ip):
     if ip:
-        match = RE_FIRST_THREE_OCTETS_OF_IP.findall(str(ip))
-        if match:
-            return '%s%s' % (match[0][0], '0')
+        info = classify_ip(ip)
+        if info is not None:
+            return info.anonymized
 
     return ''
 
+@lru_memoize(LOCALE_CACHE_SIZE)
+def parse_accept_language(accept_language):
+    '''
+    Returns the preferred locale (like "en_US") of an Accept-Language header value or None.
+    Languages without quality value, as well as those with q=0, count as q=1.
+    '''
+    best = None
+    best_quality = None
+    for match in validate_locale(accept_language):
+        quality = float(match[4] or '0') or 1
+        # Equal qualities keep the order of the header
+        if best_quality is None or quality > best_quality:
+            best, best_quality = match[1], quality
+
+    if best is None:
+        return None
+    return best.replace('-', '_')
+
 def encode_uri_components(value):
     '''Mimics Javascript's encodeURIComponent() function for consistency with the GA Javascript client.'''
     return convert_to_uri_component_encoding(quote(value))
@@ -74,6 +276,30 @@ def encode_uri_components(value):
 def convert_to_uri_component_encoding(value):
     return value.replace('%21', '!').replace('%2A', '*').replace('%27', "'").replace('%28', '(').replace('%29', ')')
 
+def encode_query_value(value):
+    '''
+    Encodes a single query string value in one pass, giving exactly what urlencode()
+    followed by the '+' to '%20' and convert_to_uri_component_encoding() fix-ups would.
+    Results for text values are cached, as most of them repeat from hit to hit.
+    '''
+    is_text = type(value) is text_type
+    if is_text:
+        try:
+            return _query_value_cache[value]
+        except KeyError:
+            pass
+
+    if not isinstance(value, (text_type, bytes)):
+        value = str(value)
+    encoded = quote(value, URI_COMPONENT_SAFE_CHARS)
+
+    if is_text:
+        if len(_query_value_cache) >= QUERY_VALUE_CACHE_SIZE:
+            _query_value_cache.clear()
+        _query_value_cache[value] = encoded
+
+    return encoded
+
 # Taken from expicient.com BJs repo.
 def stringify(s, stype=None, fn=None):
     ''' Converts elements of a complex data structure to strings
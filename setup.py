@@ -23,6 +23,9 @@ setup(name='pyga',
       ],
       install_requires=['setuptools', 'six'],
       packages=find_packages(),
+      entry_points={
+          'console_scripts': ['pyga = pyga.cli:main'],
+      },
       classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
@@ -1 +1,19 @@
 from .serialize import *
+from .connection import *
+from .dispatcher import *
+from .aio import *
+from .queues import *
+from .spool import *
+from .retry import *
+from .parameters import *
+from .x10 import *
+from .entities import *
+from .codec import *
+from .cookies import *
+from .stores import *
+from .sessions import *
+from .cli import *
+from .batch import *
+from .measurement import *
+from .export import *
+from .ringbuffer import *
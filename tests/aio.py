@@ -0,0 +1,211 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import Request as urllib_request
+
+from pyga.aio import AsyncConnectionPool, AsyncTracker
+from pyga.requests import Config, Event, Page, Session, Tracker, Visitor
+from .connection import Collector, GIFHandler
+
+
+class StatusHandler(GIFHandler):
+
+    def do_GET(self):
+        if self.path == '/empty':
+            # No Content-Length, like many servers do for 204
+            self.send_response(204)
+            self.end_headers()
+        elif self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            GIFHandler.do_GET(self)
+
+
+class SlowHandler(GIFHandler):
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.running += 1
+            self.server.max_running = max(self.server.max_running, self.server.running)
+            self.server.content_lengths.append(self.headers.get_all('Content-Length'))
+            if self.server.outages:
+                self.server.outages.pop()
+                status = 503
+            else:
+                status = 200
+        time.sleep(0.1)
+        with self.server.lock:
+            self.server.running -= 1
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        GIFHandler.do_GET(self)
+
+    do_POST = do_GET
+
+
+class Collector6(Collector):
+    address_family = socket.AF_INET6
+
+
+class TestAsyncConnectionPool(unittest.TestCase):
+
+    def serve(self, server):
+        server.peers = set()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def urlopen(self, url):
+        pool = AsyncConnectionPool()
+
+        async def send():
+            try:
+                return await pool.urlopen(urllib_request(url), timeout=2)
+            finally:
+                pool.close()
+        return asyncio.get_event_loop().run_until_complete(send())
+
+    def test_status_handling(self):
+        server = Collector(('127.0.0.1', 0), StatusHandler)
+        self.serve(server)
+        url = 'http://127.0.0.1:%s' % server.server_port
+        self.assertEqual(self.urlopen(url + '/empty').status, 204)
+        with self.assertRaises(HTTPError) as raised:
+            self.urlopen(url + '/missing')
+        self.assertEqual(raised.exception.code, 404)
+
+    @unittest.skipUnless(socket.has_ipv6, 'IPv6 not supported')
+    def test_ipv6_host(self):
+        try:
+            server = Collector6(('::1', 0), StatusHandler)
+        except (OSError, socket.error):
+            self.skipTest('No IPv6 loopback')
+        self.serve(server)
+        response = self.urlopen('http://[::1]:%s/__utm.gif' % server.server_port)
+        self.assertEqual(response.body, b'G')
+
+
+class TestAsyncTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.default_config = Tracker.config
+        self.server = Collector(('127.0.0.1', 0), SlowHandler)
+        self.server.peers = set()
+        self.server.lock = threading.Lock()
+        self.server.running = self.server.max_running = 0
+        self.server.content_lengths = []
+        self.server.outages = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        Tracker.config = self.default_config
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_hits_share_connections(self):
+        config = Config()
+        config.endpoint = 'http://127.0.0.1:%s/__utm.gif' % self.server.server_port
+        tracker = AsyncTracker('UA-0000-0000', 'test.com', config, max_in_flight=2)
+        visitor = Visitor()
+        session = Session()
+
+        async def track():
+            responses = []
+            for i in range(3):
+                responses.append(await tracker.track_pageview(Page('/%s' % i), session, visitor))
+            responses.append(await tracker.track_event(Event('cat', 'act'), session, visitor))
+            tracker.close()
+            return responses
+
+        responses = asyncio.get_event_loop().run_until_complete(track())
+        self.assertEqual([r.status for r in responses], [200] * 4)
+        self.assertEqual(responses[0].body, b'G')
+        self.assertEqual(len(self.server.peers), 1)
+        self.assertEqual(session.track_count, 4)
+
+    def build_tracker(self, max_in_flight=10):
+        config = Config()
+        config.endpoint = 'http://127.0.0.1:%s/__utm.gif' % self.server.server_port
+        config.flush_on_exit = False
+        return AsyncTracker('UA-0000-0000', 'test.com', config, max_in_flight=max_in_flight)
+
+    def run_pageviews(self, tracker, count, path='/'):
+        session = Session()
+
+        async def track():
+            try:
+                return await asyncio.gather(*[tracker.track_pageview(Page('%s%s' % (path, i)), session, Visitor())
+                                              for i in range(count)])
+            finally:
+                tracker.close()
+        return asyncio.get_event_loop().run_until_complete(track())
+
+    def test_max_in_flight(self):
+        responses = self.run_pageviews(self.build_tracker(max_in_flight=2), 6)
+        self.assertEqual([r.status for r in responses], [200] * 6)
+        self.assertEqual(self.server.max_running, 2)
+
+    def test_single_content_length(self):
+        # Long enough to be sent with POST
+        self.run_pageviews(self.build_tracker(), 1, '/%s' % ('x' * 3000))
+        self.assertEqual(len(self.server.content_lengths[0]), 1)
+
+    def test_retry_and_error_severity(self):
+        tracker = self.build_tracker()
+        tracker.config.retry_attempts = 1
+        tracker.config.retry_backoff = 0
+        self.server.outages.append(True)
+        self.assertEqual(self.run_pageviews(tracker, 1)[0].status, 200)
+
+        tracker.config.retry_attempts = 0
+        self.server.outages.append(True)
+        self.assertRaises(HTTPError, self.run_pageviews, tracker, 1)
+
+        tracker.config.error_severity = Config.ERROR_SEVERITY_SILECE
+        self.server.outages.append(True)
+        self.assertEqual(self.run_pageviews(tracker, 1), [None])
+
+    def test_batches_are_coroutines(self):
+        tracker = self.build_tracker(max_in_flight=2)
+        session, visitor = Session(), Visitor()
+        self.server.outages.append(True)
+
+        async def track():
+            try:
+                pageviews = await tracker.track_pageviews((Page('/%s' % i), session, visitor) for i in range(4))
+                events = await tracker.track_events([(Event('cat', 'act'), session, visitor)])
+                return pageviews + events
+            finally:
+                tracker.close()
+
+        results = asyncio.get_event_loop().run_until_complete(track())
+        self.assertEqual(len(results), 5)
+        # The failed hit is reported, not raised
+        self.assertEqual(len([r for r in results if isinstance(r.error, HTTPError)]), 1)
+        self.assertEqual(len([r for r in results if r.response is not None and r.response.status == 200]), 4)
+        self.assertEqual(self.server.max_running, 2)
+        self.assertEqual(session.track_count, 5)
+
+    def test_transports_of_config(self):
+        tracker = self.build_tracker()
+        tracker.config.queue_requests = True
+        self.assertEqual(self.run_pageviews(tracker, 3), [None] * 3)
+        self.assertEqual(len(tracker.queue), 3)
+        self.assertEqual(self.server.content_lengths, [])
+        self.assertEqual(tracker.flush().sent, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+try:
+    from unittest import mock
+except ImportError as e:
+    import mock
+
+from pyga.entities import Event, Page, Session, Visitor
+from pyga.requests import Config, PageViewRequest, Tracker
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Tracker.config
+        self.tracker = Tracker('UA-0000-0000', 'example.com', Config())
+        self.visitor = Visitor()
+        self.visitor.ip_address = '194.54.176.12'
+        self.visitor.user_agent = 'Mozilla/5.0 (X11)'
+        self.visitor.locale = 'en_US'
+        self.visitor.java_enabled = '1'
+
+    def tearDown(self):
+        Tracker.config = self.config
+
+    @mock.patch('pyga.utils.get_32bit_random_num', return_value=12345)
+    def test_same_query_strings(self, random_num):
+        pages = [Page('/a'), Page('/b?c=d'), Page('/e')]
+        expected = []
+        session = Session()
+        for page in pages:
+            request = PageViewRequest(self.tracker.config, self.tracker, self.visitor, session, page)
+            expected.append(request.build_http_request().get_full_url())
+
+        self.tracker.config.queue_requests = True
+        session.track_count = 0
+        results = self.tracker.track_pageviews((page, session, self.visitor) for page in pages)
+        self.assertEqual([result.request.get_full_url() for result in results], expected)
+        self.assertEqual(session.track_count, 3)
+        self.assertEqual(len(self.tracker.queue.drain()), 3)
+
+    @mock.patch('pyga.connection.ConnectionPool.urlopen')
+    def test_results_per_hit(self, urlopen):
+        def respond(request, timeout):
+            if 'utmac' not in request.get_full_url() or 'fail' in request.get_full_url():
+                raise ValueError('broken')
+            return 'ok'
+        urlopen.side_effect = respond
+
+        events = [Event('video', 'play'), Event('video', 'fail'), Event('video', 'stop')]
+        results = self.tracker.track_events((event, Session(), self.visitor) for event in events)
+        self.assertEqual([result.response for result in results], ['ok', None, 'ok'])
+        self.assertTrue(isinstance(results[1].error, ValueError))
+        self.assertEqual(urlopen.call_count, 3)
+
+    def test_invalid_event(self):
+        self.assertRaises(Exception, self.tracker.track_events, [(Event(), Session(), self.visitor)])
+
+
+if __name__ == '__main__':
+    unittest.main()
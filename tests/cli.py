@@ -0,0 +1,90 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError as e:
+    import mock
+
+import pyga.cli
+from pyga.exceptions import WorkerError
+from pyga.requests import Tracker
+
+LINES = [
+    '203.0.113.7 - - [10/Oct/2000:13:55:36 -0700] "GET /index.html HTTP/1.1" 200 2326 '
+    '"http://example.com/start.html" "Mozilla/5.0 (X11)"\n',
+    '203.0.113.7 - - [10/Oct/2000:13:55:40 -0700] "GET /about.html HTTP/1.1" 200 1200 "-" "Mozilla/5.0 (X11)"\n',
+    '198.51.100.2 - - [10/Oct/2000:13:56:00 -0700] "GET /missing HTTP/1.1" 404 0 "-" "curl/7.1"\n',
+    '198.51.100.2 - - [10/Oct/2000:13:56:01 -0700] "POST /form HTTP/1.1" 200 0 "-" "curl/7.1"\n',
+    'garbage\n',
+    '198.51.100.2 - - [10/Oct/2000:14:56:01 +0000] "GET /download.zip HTTP/1.1" 200 10 "-" "curl/7.1"\n',
+]
+
+
+def dying_worker(inbox, results, options):
+    os._exit(3)
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Tracker.config
+        self.directory = tempfile.mkdtemp()
+        self.options = {'account_id': 'UA-0000-0000', 'domain_name': 'example.com', 'dry_run': True}
+
+    def tearDown(self):
+        Tracker.config = self.config
+        shutil.rmtree(self.directory)
+
+    def test_parse_lines(self):
+        entries = list(pyga.cli.parse_lines(LINES))
+        self.assertEqual([entry is not None for entry in entries], [True, True, False, False, False, True])
+        self.assertEqual(entries[0].timestamp, 971211336)
+        self.assertEqual(entries[0].path, '/index.html')
+        self.assertEqual(entries[0].referrer, 'http://example.com/start.html')
+        self.assertEqual(entries[1].referrer, None)
+        self.assertEqual(entries[5].timestamp, 971189761)
+
+    def test_read_gzip(self):
+        path = os.path.join(self.directory, 'access.log.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(''.join(LINES).encode('utf-8'))
+        self.assertEqual(list(pyga.cli.read_lines([path])), LINES)
+
+    def test_replay_sessions(self):
+        replayer = pyga.cli.Replayer(pyga.cli._build_tracker(self.options), dry_run=True)
+        entries = [entry for entry in pyga.cli.parse_lines(LINES) if entry]
+        for entry in entries:
+            replayer.track(entry)
+        visitor = replayer.visitors.get(pyga.cli.visitor_key(entries[0]))
+        self.assertEqual(replayer.sessions.get(pyga.cli.visitor_key(entries[0])).track_count, 2)
+        self.assertEqual(visitor.visit_count, 1)
+
+    def test_replay(self):
+        self.assertEqual(pyga.cli.replay(LINES, self.options)[:3], (6, 3, 3))
+        self.assertEqual(pyga.cli.replay(LINES * 50, self.options, workers=2)[:3], (300, 150, 150))
+
+    def test_failed_hits_are_counted(self):
+        self.options.update(dry_run=False, endpoint='http://127.0.0.1:9/__utm.gif')
+        result = pyga.cli.replay(LINES, self.options)
+        self.assertEqual((result.hits, result.failed), (0, 3))
+        result = pyga.cli.replay(LINES * 10, self.options, workers=2)
+        self.assertEqual((result.hits, result.failed), (0, 30))
+
+    @mock.patch('pyga.cli.WORKER_POLL_INTERVAL', 0.1)
+    @mock.patch('pyga.cli._worker', dying_worker)
+    def test_dead_worker(self):
+        self.assertRaises(WorkerError, pyga.cli.replay, LINES * 1000, self.options, workers=2)
+
+    def test_main(self):
+        path = os.path.join(self.directory, 'access.log')
+        with open(path, 'w') as f:
+            f.write(''.join(LINES))
+        self.assertEqual(pyga.cli.main(['replay', '-q', '-n', '-w', '1', 'UA-0000-0000', 'example.com', path]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
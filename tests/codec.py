@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+try:
+    import cPickle as pickle
+except ImportError as e:
+    import pickle
+
+from pyga.entities import Session, Visitor
+
+
+def state(entity):
+    return dict((name, getattr(entity, name)) for name in entity.FIELDS)
+
+
+class TestCodec(unittest.TestCase):
+
+    def build_visitor(self):
+        visitor = Visitor().extract_from_utma('1.1234.1335113044.1335113045.1335113046.3')
+        visitor.ip_address = '10.0.0.1'
+        visitor.user_agent = u'Mozilla/5.0 (X11; Linux x86_64) é'
+        visitor.locale = 'en_US'
+        visitor.java_enabled = True
+        visitor.screen_resolution = '1024x768'
+        return visitor
+
+    def test_visitor_round_trip(self):
+        visitor = self.build_visitor()
+        data = visitor.to_bytes()
+        self.assertTrue(len(data) < len(pickle.dumps(visitor, 2)))
+        restored = Visitor.from_bytes(data)
+        self.assertEqual(state(restored), state(visitor))
+        self.assertTrue(restored.java_enabled is True)
+        self.assertTrue(restored.flash_version is None)
+
+    def test_session_round_trip(self):
+        session = Session().extract_from_utmb('1.5.10.1335113100')
+        restored = Session.from_bytes(session.to_bytes())
+        self.assertEqual(state(restored), state(session))
+
+    def test_many(self):
+        visitors = [self.build_visitor() for i in range(3)]
+        visitors[1].user_agent = None
+        visitors[2].java_enabled = False
+        restored = Visitor.many_from_bytes(Visitor.many_to_bytes(visitors))
+        self.assertEqual([state(v) for v in restored], [state(v) for v in visitors])
+        self.assertEqual(Visitor.many_from_bytes(Visitor.many_to_bytes([])), [])
+
+    def test_invalid_data(self):
+        data = self.build_visitor().to_bytes()
+        self.assertRaises(ValueError, Visitor.from_bytes, data[:-1])
+        self.assertRaises(ValueError, Visitor.from_bytes, data + b'x')
+        self.assertRaises(ValueError, Visitor.from_bytes, b'\x02' + data[1:])
+        self.assertRaises(ValueError, Session.from_bytes, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import HTTPError, Request as urllib_request
+except ImportError as e:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import HTTPError
+    from urllib.request import Request as urllib_request
+
+from pyga.connection import ConnectionPool
+
+
+class GIFHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.peers.add(self.client_address)
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/__utm.gif')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/gif')
+        self.send_header('Content-Length', '1')
+        self.end_headers()
+        self.wfile.write(b'G')
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class Collector(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Collector(('127.0.0.1', 0), GIFHandler)
+        self.server.peers = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/__utm.gif' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        pool = ConnectionPool(maxsize=2)
+        for i in range(3):
+            response = pool.urlopen(urllib_request('%s?utmn=%s' % (self.url, i)), timeout=2)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.body, b'G')
+        self.assertEqual(len(self.server.peers), 1)
+        pool.clear()
+
+    def test_max_requests_recycles_connection(self):
+        pool = ConnectionPool(max_requests=1)
+        for i in range(2):
+            pool.urlopen(urllib_request(self.url), timeout=2)
+        self.assertEqual(len(self.server.peers), 2)
+        pool.clear()
+
+    def test_stale_connection_is_replaced(self):
+        pool = ConnectionPool()
+        pool.urlopen(urllib_request(self.url), timeout=2)
+        # Simulate a connection that died while idling in the pool
+        pool.idle_timeout = None
+        for idle in pool._ConnectionPool__pools.values():
+            for conn in idle:
+                conn.connection.sock.close()
+        response = pool.urlopen(urllib_request(self.url, 'utmn=1'), timeout=2)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(self.server.peers), 2)
+        pool.clear()
+
+    def test_redirect_is_an_error(self):
+        pool = ConnectionPool(proxies={})
+        url = self.url.replace('__utm.gif', 'redirect')
+        self.assertRaises(HTTPError, pool.urlopen, urllib_request(url), timeout=2)
+        pool.clear()
+
+    def test_proxied_requests_are_left_to_urllib(self):
+        pool = ConnectionPool(proxies={'https': 'http://proxy.example.com:3128'})
+        self.assertTrue(pool.is_proxied('https://www.google-analytics.com/__utm.gif'))
+        self.assertFalse(pool.is_proxied(self.url))
+        self.assertFalse(ConnectionPool(proxies={}).is_proxied(self.url))
+
+
+if __name__ == '__main__':
+    unittest.main()
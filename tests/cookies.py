@@ -0,0 +1,59 @@
+import unittest
+
+from pyga import cookies
+from pyga.entities import Campaign, Session, Visitor
+
+HEADER = ('sessionid=abc; __utma=1.1234.1335113044.1335113045.1335113046.3; '
+          '__utmb=1.5.10.1335113100; __utmc=1; '
+          '__utmz=1.1335113044.1.2.utmcsr=google|utmccn=(organic)|utmcmd=organic|utmctr=blue%20shoes')
+
+
+class TestParseCookieHeader(unittest.TestCase):
+
+    def setUp(self):
+        cookies.clear_cache()
+
+    def test_matches_extract_methods(self):
+        visitor, session, campaign = cookies.parse_cookie_header(HEADER)
+
+        expected = Visitor().extract_from_utma('1.1234.1335113044.1335113045.1335113046.3')
+        for name in ('unique_id', 'first_visit_timestamp', 'previous_visit_timestamp',
+                     'current_visit_timestamp', 'visit_count'):
+            self.assertEqual(getattr(visitor, name), getattr(expected, name))
+
+        expected = Session().extract_from_utmb('1.5.10.1335113100')
+        self.assertEqual((session.track_count, session.start_timestamp),
+                         (expected.track_count, expected.start_timestamp))
+
+        expected = Campaign(Campaign.TYPE_ORGANIC).extract_from_utmz(
+            '1.1335113044.1.2.utmcsr=google|utmccn=(organic)|utmcmd=organic|utmctr=blue%20shoes')
+        self.assertEqual(campaign.get_utmz_tail(), expected.get_utmz_tail())
+        self.assertEqual(campaign.response_count, 2)
+        self.assertEqual(campaign._type, Campaign.TYPE_ORGANIC)
+
+    def test_cached_values_give_new_objects(self):
+        first = cookies.parse_cookie_header(HEADER)
+        first.visitor.visit_count = 10
+        first.campaign.term = 'red shoes'
+        second = cookies.parse_cookie_header(HEADER)
+        self.assertFalse(first.visitor is second.visitor)
+        self.assertEqual(second.visitor.visit_count, 3)
+        self.assertEqual(second.campaign.term, 'blue shoes')
+        self.assertEqual(len(cookies._utma_cache), 1)
+
+    def test_missing_and_invalid_cookies(self):
+        self.assertEqual(cookies.parse_cookie_header('sessionid=abc; flag'), (None, None, None))
+        visitor, session, campaign = cookies.parse_cookie_header(
+            '__utma=1.99999999999.1.2.3.4; __utmb=garbage; __utmz=1.2.3', use_cache=False)
+        self.assertEqual((visitor, session, campaign), (None, None, None))
+        self.assertEqual(len(cookies._utma_cache), 0)
+
+    def test_non_finite_timestamps(self):
+        for timestamp in ('inf', '-inf', 'nan', '1e400'):
+            header = '__utma=1.2.%s.4.5.6; __utmb=1.2.10.%s; __utmz=1.%s.1.1.utmcsr=x' % (
+                timestamp, timestamp, timestamp)
+            self.assertEqual(cookies.parse_cookie_header(header, use_cache=False), (None, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import time
+import unittest
+from mock import patch
+
+from pyga.dispatcher import Dispatcher, flush
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def test_close_drains_queue(self):
+        sent = []
+        dispatcher = Dispatcher(sent.append, queue_size=10, workers=2)
+        for i in range(10):
+            self.assertTrue(dispatcher.submit(i))
+        dispatcher.close(timeout=5)
+        self.assertEqual(sorted(sent), list(range(10)))
+        self.assertFalse(dispatcher.submit(10))
+        self.assertEqual(dispatcher.dropped, 1)
+
+    def test_full_queue_drops_hits(self):
+        release = threading.Event()
+        dispatcher = Dispatcher(lambda hit: release.wait(5), queue_size=1)
+        results = [dispatcher.submit(i) for i in range(5)]
+        self.assertFalse(all(results))
+        self.assertEqual(dispatcher.dropped, results.count(False))
+        release.set()
+        dispatcher.close(timeout=5)
+
+    def test_send_errors_do_not_stop_worker(self):
+        sent = []
+
+        def send(hit):
+            if hit == 0:
+                raise IOError('endpoint down')
+            sent.append(hit)
+
+        dispatcher = Dispatcher(send)
+        dispatcher.submit(0)
+        dispatcher.submit(1)
+        dispatcher.close(timeout=5)
+        self.assertEqual(sent, [1])
+
+    def test_close_timeout_is_total(self):
+        release = threading.Event()
+        dispatcher = Dispatcher(lambda hit: release.wait(5), workers=3)
+        for i in range(6):
+            dispatcher.submit(i)
+        started = time.time()
+        dispatcher.close(timeout=0.3)
+        # One deadline for all workers, not timeout seconds per worker
+        self.assertTrue(time.time() - started < 0.6)
+        release.set()
+
+
+class TestFlush(unittest.TestCase):
+
+    def test_reports_sent_and_failed(self):
+        def send(hit):
+            if hit % 2:
+                raise IOError('endpoint down')
+
+        result = flush(range(10), send, workers=3)
+        self.assertEqual(result, (5, 5, 0))
+
+    def test_deadline_drops_remaining_hits(self):
+        release = threading.Event()
+        result = flush(range(10), lambda hit: release.wait(5), workers=2, timeout=0.1)
+        release.set()
+        self.assertEqual(result.sent, 0)
+        self.assertEqual(result.dropped, 10)
+
+    @patch("pyga.connection.ConnectionPool.urlopen")
+    def test_shutdown_sends_queued_requests(self, mocked):
+        import pyga
+        from pyga.requests import Config, Page, Session, Tracker, Visitor
+
+        default_config = Tracker.config
+        config = Config()
+        config.queue_requests = True
+        config.flush_on_exit = False
+        try:
+            tracker = Tracker('UA-0000-0000', 'test.com', config)
+            session = Session()
+            for i in range(3):
+                tracker.track_pageview(Page('/%s' % i), session, Visitor())
+            self.assertEqual(len(tracker.queue), 3)
+            self.assertEqual(mocked.call_count, 0)
+            result = pyga.shutdown()
+        finally:
+            Tracker.config = default_config
+
+        self.assertEqual(mocked.call_count, 3)
+        self.assertEqual(result.sent, 3)
+        self.assertEqual(len(tracker.queue), 0)
+
+    @patch("pyga.connection.ConnectionPool.urlopen")
+    def test_shutdown_sends_hits_of_collected_trackers(self, mocked):
+        import gc
+        import pyga
+        from pyga.requests import Config, Page, Session, Tracker, Visitor
+
+        default_config = Tracker.config
+        config = Config()
+        config.queue_requests = True
+        config.flush_on_exit = False
+        try:
+            tracker = Tracker('UA-0000-0000', 'test.com', config)
+            tracker.track_pageview(Page('/gone'), Session(), Visitor())
+            del tracker
+            gc.collect()
+            result = pyga.shutdown()
+        finally:
+            Tracker.config = default_config
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(result.sent, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+
+from datetime import datetime
+
+from pyga import utils
+from pyga.entities import Campaign, CustomVariable, Item, Page, Session, Transaction, Visitor
+
+try:
+    import cPickle as pickle
+except ImportError as e:
+    import pickle
+
+
+class TestCampaign(unittest.TestCase):
+
+    def test_utmz_tail(self):
+        campaign = Campaign(Campaign.TYPE_REFERRAL)
+        campaign.source = 'example.com'
+        campaign.content = '/some path+more'
+        creation_time, tracking = campaign.get_utmz_tail()
+        self.assertEqual(tracking, 'utmcsr=example.com|utmccn=(referral)|utmcmd=referral|utmcct=/some%20path%20more')
+
+    def test_utmz_tail_cache_invalidation(self):
+        campaign = Campaign(Campaign.TYPE_DIRECT)
+        self.assertEqual(campaign.get_utmz_tail()[1], 'utmcsr=(direct)|utmccn=(direct)|utmcmd=(none)')
+        campaign.term = 'shoes'
+        self.assertEqual(campaign.get_utmz_tail()[1], 'utmcsr=(direct)|utmccn=(direct)|utmcmd=(none)|utmctr=shoes')
+        campaign.extract_from_utmz('1.1234567890.1.2.utmcsr=google|utmccn=(organic)|utmcmd=organic')
+        self.assertEqual(campaign.get_utmz_tail(),
+                         (1234567890, 'utmcsr=google|utmccn=(organic)|utmcmd=organic|utmctr=shoes'))
+
+    def test_utmz_cookie_parameter(self):
+        from pyga.requests import PageViewRequest, Page, Session, Tracker, Visitor
+
+        tracker = Tracker('UA-0000-0000', 'test.com')
+        tracker.campaign = Campaign(Campaign.TYPE_DIRECT)
+        tracker.campaign.extract_from_utmz('1.1234567890.1.2.utmcsr=(direct)|utmccn=(direct)|utmcmd=(none)')
+        visitor = Visitor()
+        params = PageViewRequest(tracker.config, tracker, visitor, Session(), Page('/')).build_parameters()
+        self.assertEqual(params._utmz, '%s.1234567890.1.2.utmcsr=(direct)|utmccn=(direct)|utmcmd=(none)'
+                         % tracker.get_domain_hash())
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_datetime_views(self):
+        session = Session()
+        session.start_time = datetime(2012, 4, 22, 16, 44, 4)
+        self.assertEqual(session.start_timestamp, 1335113044)
+        session.start_timestamp = 1335113045
+        self.assertEqual(session.start_time, datetime(2012, 4, 22, 16, 44, 5))
+
+    def test_utma_and_utmb(self):
+        visitor = Visitor().extract_from_utma('1.1234.1335113044.1335113045000.1335113046.3')
+        self.assertEqual(visitor.first_visit_timestamp, 1335113044)
+        self.assertEqual(visitor.previous_visit_timestamp, 1335113045)
+        self.assertEqual(visitor.current_visit_timestamp, 1335113046)
+        session = Session().extract_from_utmb('1.5.10.1335113100')
+        self.assertEqual(session.start_timestamp, 1335113100)
+
+        visitor.add_session(session)
+        self.assertEqual(visitor.previous_visit_timestamp, 1335113046)
+        self.assertEqual(visitor.current_visit_timestamp, 1335113100)
+        self.assertEqual(visitor.visit_count, 4)
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        for entity in (Campaign(Campaign.TYPE_DIRECT), CustomVariable(), Page('/'), Session(), Transaction(), Visitor()):
+            self.assertFalse(hasattr(entity, '__dict__'))
+            self.assertRaises(AttributeError, setattr, entity, 'no_such_field', 1)
+
+    def test_validation(self):
+        self.assertRaises(ValueError, CustomVariable, 6)
+        self.assertRaises(ValueError, CustomVariable, 1, scope=4)
+        self.assertRaises(ValueError, Page, 'no-slash')
+        page = Page('/')
+        self.assertRaises(ValueError, setattr, page, 'load_time', 1.5)
+        self.assertRaises(ValueError, setattr, Visitor(), 'unique_id', 0x80000000)
+
+    def test_order_id_propagates_to_items(self):
+        transaction = Transaction()
+        transaction.add_item(Item())
+        transaction.order_id = 'order-1'
+        self.assertEqual(transaction.items[0].order_id, 'order-1')
+
+    def test_pickle_round_trip(self):
+        visitor = Visitor()
+        visitor.user_agent = 'Test'
+        visitor.screen_resolution = '1024x768'
+        restored = pickle.loads(pickle.dumps(visitor))
+        self.assertEqual(restored.__getstate__(), visitor.__getstate__())
+        fields = Visitor.FIELDS + Visitor.LEGACY_FIELDS
+        self.assertEqual(fields, tuple(sorted(visitor.__getstate__(), key=fields.index)))
+
+        campaign = Campaign(Campaign.TYPE_REFERRAL)
+        campaign.source = 'example.com'
+        restored = pickle.loads(pickle.dumps(campaign))
+        self.assertEqual(restored.get_utmz_tail(), campaign.get_utmz_tail())
+
+    def test_legacy_state(self):
+        # Former versions pickled the __dict__ of a Session, holding a datetime
+        session = Session()
+        session.start_timestamp = 1500000000
+        state = session.__getstate__()
+        self.assertEqual(state['start_time'], datetime(2017, 7, 14, 2, 40))
+
+        legacy = Session.__new__(Session)
+        legacy.__setstate__({'session_id': 1, 'track_count': 2, 'start_time': datetime(2017, 7, 14, 2, 40)})
+        self.assertEqual(legacy.start_timestamp, 1500000000)
+        self.assertEqual(legacy.to_bytes(), Session.from_bytes(legacy.to_bytes()).to_bytes())
+
+
+
+class TestInterning(unittest.TestCase):
+
+    def setUp(self):
+        Visitor.intern_pool = utils.InternPool(8)
+
+    def tearDown(self):
+        Visitor.intern_pool = None
+
+    def test_server_meta_strings_are_shared(self):
+        meta = {'HTTP_USER_AGENT': ''.join(['Mozilla/5.0 ', '(X11)']), 'HTTP_ACCEPT_LANGUAGE': 'en-US'}
+        first = Visitor().extract_from_server_meta(meta)
+        meta = {'HTTP_USER_AGENT': ''.join(['Mozilla/5.0 ', '(X11)']), 'HTTP_ACCEPT_LANGUAGE': 'en-US'}
+        second = Visitor().extract_from_server_meta(meta)
+        self.assertTrue(first.user_agent is second.user_agent)
+        self.assertTrue(first.locale is second.locale)
+
+    def test_deserialized_strings_are_shared(self):
+        visitor = Visitor()
+        visitor.user_agent = 'Mozilla/5.0 (X11)'
+        visitor.screen_resolution = '1024x768'
+        first = pickle.loads(pickle.dumps(visitor))
+        second = Visitor.from_bytes(visitor.to_bytes())
+        self.assertTrue(first.user_agent is second.user_agent)
+        self.assertTrue(first.screen_resolution is second.screen_resolution)
+        self.assertEqual(first.generate_hash(), visitor.generate_hash())
+
+    def test_pool_is_bounded(self):
+        pool = utils.InternPool(2)
+        for value in ('a', 'b', 'c'):
+            pool.intern(value)
+        self.assertEqual(len(pool), 2)
+        self.assertFalse('a' in pool)
+        self.assertEqual(pool.intern(5), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
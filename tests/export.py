@@ -0,0 +1,151 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+try:
+    from unittest import mock
+except ImportError as e:
+    import mock
+
+try:
+    from urllib2 import Request as urllib_request
+except ImportError as e:
+    from urllib.request import Request as urllib_request
+
+from pyga.entities import Page, Session, Visitor
+from pyga.export import (FORMAT_BINARY, FORMAT_JSONL, PARTIAL_SUFFIX, ExportSink, ExportUploader,
+                         export_files, read_export)
+from pyga.requests import Config, Tracker
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = Tracker.config
+
+    def tearDown(self):
+        Tracker.config = self.config
+        shutil.rmtree(self.directory)
+
+    def request(self, i):
+        if i % 2:
+            return urllib_request('http://example.com/__utm.gif', 'utmn=%s' % i,
+                                  {'User-Agent': 'Test', 'Content-Length': len('utmn=%s' % i)})
+        return urllib_request('http://example.com/__utm.gif?utmn=%s' % i, None, {'User-Agent': 'Test'})
+
+    def check_round_trip(self, format):
+        sink = ExportSink(self.directory, format, file_size=200)
+        for i in range(10):
+            sink.write(self.request(i), 1000 + i)
+        # The file being written isn't complete yet
+        self.assertEqual(len(export_files(self.directory)), len(os.listdir(self.directory)) - 1)
+        sink.close()
+
+        paths = export_files(self.directory)
+        self.assertTrue(len(paths) > 1)
+        hits = [hit for path in paths for hit in read_export(path)]
+        self.assertEqual([hit.timestamp for hit in hits], list(range(1000, 1010)))
+        for i, hit in enumerate(hits):
+            self.assertEqual(hit.request.get_full_url(), self.request(i).get_full_url())
+            self.assertEqual(hit.request.data, self.request(i).data)
+            self.assertEqual(hit.request.get_header('User-agent'), 'Test')
+
+    def test_jsonl_round_trip(self):
+        self.check_round_trip(FORMAT_JSONL)
+
+    def test_binary_round_trip(self):
+        self.check_round_trip(FORMAT_BINARY)
+
+    @mock.patch('pyga.connection.ConnectionPool.urlopen')
+    def test_config_exports_instead_of_sending(self, urlopen):
+        config = Config()
+        config.export_directory = self.directory
+        tracker = Tracker('UA-0000-0000', 'example.com', config)
+        tracker.track_pageview(Page('/export'), Session(), Visitor())
+        config.get_export_sink().close()
+
+        self.assertFalse(urlopen.called)
+        hits = list(read_export(export_files(self.directory)[0]))
+        self.assertEqual(len(hits), 1)
+        self.assertTrue('utmp=%2Fexport' in hits[0].request.get_full_url())
+
+    def test_uploader_retries_failed_hits(self):
+        sink = ExportSink(self.directory, FORMAT_BINARY, file_size=200)
+        for i in range(10):
+            sink.write(self.request(i))
+        sink.close()
+
+        sent = []
+
+        def send(request):
+            if request.get_full_url().endswith('utmn=4'):
+                raise IOError('endpoint down')
+            sent.append(request)
+
+        result = ExportUploader(self.directory, send, workers=2, chunk_size=3).upload()
+        self.assertEqual((result.sent, result.failed), (9, 1))
+        self.assertEqual(len(sent), 9)
+
+        # Only the failed hit is left for the next run
+        result = ExportUploader(self.directory, sent.append, keep=True).upload()
+        self.assertEqual((result.sent, result.failed), (1, 0))
+        self.assertEqual(export_files(self.directory), [])
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_closed_sink_drops_hits(self):
+        sink = ExportSink(self.directory)
+        self.assertTrue(sink.write(self.request(0)))
+        sink.close()
+        self.assertFalse(sink.write(self.request(1)))
+        self.assertEqual(sink.dropped, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_uploader_takes_over_abandoned_files(self):
+        sink = ExportSink(self.directory, FORMAT_BINARY)
+        sink.write(self.request(0))
+        sink.flush()
+        partial, = os.listdir(self.directory)
+        self.assertTrue(partial.endswith(PARTIAL_SUFFIX))
+
+        # Written by a process which is gone
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        crashed = partial.replace('-%s-' % os.getpid(), '-%s-' % process.pid)
+        shutil.copy(os.path.join(self.directory, partial), os.path.join(self.directory, crashed))
+
+        sent = []
+        result = ExportUploader(self.directory, sent.append).upload()
+        self.assertEqual(result.sent, 1)
+        self.assertEqual(sorted(os.listdir(self.directory)), [partial])
+        sink.close()
+
+    def test_uploader_leaves_files_of_live_writers(self):
+        sink = ExportSink(self.directory, FORMAT_BINARY)
+        for i in range(3):
+            sink.write(self.request(i))
+        sink.flush()
+        partial, = os.listdir(self.directory)
+
+        # Buffered writes leave the mtime behind, however long ago it is
+        old = time.time() - 7200
+        os.utime(os.path.join(self.directory, partial), (old, old))
+        sent = []
+        result = ExportUploader(self.directory, sent.append).upload()
+        self.assertEqual(result.sent, 0)
+        self.assertEqual(os.listdir(self.directory), [partial])
+
+        for i in range(3, 6):
+            self.assertTrue(sink.write(self.request(i)))
+        sink.close()
+        result = ExportUploader(self.directory, sent.append).upload()
+        self.assertEqual(result.sent, 6)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ except ImportError as e:
     from urllib.parse import parse_qs
 
 
-@patch("pyga.requests.urlopen")
+@patch("pyga.connection.ConnectionPool.urlopen")
 class TestGA(unittest.TestCase):
 
     def test_request(self, mocked):
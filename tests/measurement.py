@@ -0,0 +1,189 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+try:
+    from urlparse import parse_qsl
+except ImportError as e:
+    from urllib.parse import parse_qsl
+
+import pyga
+from pyga.entities import CustomVariable, Event, Item, Page, Session, Transaction, Visitor
+from pyga.measurement import HitBatcher, MeasurementTracker, build_payload
+from pyga.requests import Config, EventRequest, ItemRequest, PageViewRequest, Tracker
+from .connection import Collector, GIFHandler
+
+
+class BatchHandler(GIFHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.batches.append((self.path, body.decode('utf-8').split('\n')))
+        GIFHandler.do_GET(self)
+
+
+class TestPayload(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Tracker.config
+        self.tracker = Tracker('UA-0000-0000', 'example.com', Config())
+        self.visitor = Visitor()
+        self.visitor.ip_address = '194.54.176.12'
+        self.visitor.user_agent = 'Mozilla/5.0 (X11)'
+        self.visitor.locale = 'en_US'
+        self.session = Session()
+
+    def tearDown(self):
+        Tracker.config = self.config
+
+    def test_pageview(self):
+        page = Page('/a b')
+        page.title = 'Home'
+        payload = build_payload(PageViewRequest(self.tracker.config, self.tracker, self.visitor, self.session, page))
+        params = dict(parse_qsl(payload))
+        self.assertEqual(params['v'], '1')
+        self.assertEqual(params['tid'], 'UA-0000-0000')
+        self.assertEqual(params['cid'], '%s.%s' % (self.visitor.unique_id, self.visitor.first_visit_timestamp))
+        self.assertEqual(params['t'], 'pageview')
+        self.assertEqual(params['dp'], '/a b')
+        self.assertEqual(params['dt'], 'Home')
+        self.assertEqual(params['uip'], '194.54.176.0')
+        self.assertEqual(params['ua'], 'Mozilla/5.0 (X11)')
+        self.assertEqual(params['ul'], 'en-us')
+        self.assertTrue(payload.endswith('&z=%s' % params['z']))
+        self.assertEqual(self.session.track_count, 1)
+
+    def test_custom_variables_become_custom_dimensions(self):
+        self.tracker.add_custom_variable(CustomVariable(2, 'plan', 'pro'))
+        params = dict(parse_qsl(build_payload(
+            PageViewRequest(self.tracker.config, self.tracker, self.visitor, self.session, Page('/')))))
+        self.assertEqual(params['cd2'], 'pro')
+        self.assertFalse('plan' in params.values())
+
+    def test_event_and_item(self):
+        event = Event('video', 'play', 'intro', 3)
+        params = dict(parse_qsl(build_payload(
+            EventRequest(self.tracker.config, self.tracker, self.visitor, self.session, event))))
+        self.assertEqual((params['t'], params['ec'], params['ea'], params['el'], params['ev']),
+                         ('event', 'video', 'play', 'intro', '3'))
+
+        transaction = Transaction()
+        transaction.order_id = '42'
+        item = Item()
+        item.sku = 'sku-1'
+        item.price = 9.5
+        item.quantity = 2
+        transaction.add_item(item)
+        params = dict(parse_qsl(build_payload(
+            ItemRequest(self.tracker.config, self.tracker, self.visitor, self.session, item))))
+        self.assertEqual((params['t'], params['ti'], params['ic'], params['ip'], params['iq']),
+                         ('item', '42', 'sku-1', '9.5', '2'))
+        # No visitor information for e-commerce requests
+        self.assertFalse('ul' in params)
+
+
+class TestHitBatcher(unittest.TestCase):
+
+    def test_count_limit(self):
+        batcher = HitBatcher(max_hits=2)
+        self.assertEqual(batcher.add('a', 1), [])
+        self.assertEqual(batcher.add('b', 2), [[('a', 1), ('b', 2)]])
+        self.assertEqual(batcher.add('c'), [])
+        self.assertEqual(batcher.flush(), [('c', None)])
+        self.assertEqual(batcher.flush(), None)
+
+    def test_size_limit(self):
+        batcher = HitBatcher(max_batch_size=7, max_hit_size=5)
+        self.assertEqual(batcher.add('aaa'), [])
+        # 3 + newline + 3 bytes still fit, one more byte doesn't
+        self.assertEqual(batcher.add('bbb'), [])
+        self.assertEqual(batcher.add('c'), [[('aaa', None), ('bbb', None)]])
+        self.assertRaises(ValueError, batcher.add, 'dddddd')
+        self.assertEqual(len(batcher), 1)
+
+
+class TestMeasurementTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.default_config = Tracker.config
+        self.server = Collector(('127.0.0.1', 0), BatchHandler)
+        self.server.peers = set()
+        self.server.batches = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.config = Config()
+        self.config.endpoint = 'http://127.0.0.1:%s/__utm.gif' % self.server.server_port
+        self.config.flush_on_exit = False
+        self.tracker = MeasurementTracker('UA-0000-0000', 'example.com', self.config,
+                                          endpoint='http://127.0.0.1:%s/batch' % self.server.server_port)
+        self.visitor = Visitor()
+        self.session = Session()
+
+    def tearDown(self):
+        Tracker.config = self.default_config
+        self.config.get_connection_pool().clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_hits_are_batched(self):
+        for i in range(45):
+            self.tracker.track_pageview(Page('/%s' % i), self.session, self.visitor)
+        self.assertEqual([len(hits) for path, hits in self.server.batches], [20, 20])
+        self.assertEqual(len(self.tracker.batcher), 5)
+
+        self.tracker.flush()
+        self.assertEqual([len(hits) for path, hits in self.server.batches], [20, 20, 5])
+        self.assertEqual(set(path for path, hits in self.server.batches), set(['/batch']))
+        paths = [dict(parse_qsl(hit))['dp'] for path, hits in self.server.batches for hit in hits]
+        self.assertEqual(paths, ['/%s' % i for i in range(45)])
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_queued_batches(self):
+        self.config.queue_requests = True
+        for i in range(25):
+            self.tracker.track_event(Event('cat', 'act'), self.session, self.visitor)
+        self.assertEqual(len(self.tracker.queue), 1)
+        result = self.tracker.flush()
+        self.assertEqual(result.sent, 2)
+        # Queued batches are sent concurrently
+        self.assertEqual(sorted(len(hits) for path, hits in self.server.batches), [5, 20])
+
+    def test_track_batch_results(self):
+        pages = [Page('/%s' % i) for i in range(30)]
+        pages[3].title = 'x' * 9000
+        results = self.tracker.track_pageviews((page, self.session, self.visitor) for page in pages)
+        self.assertEqual(len(results), 30)
+        self.assertTrue(isinstance(results[3].error, ValueError))
+        # The oversized hit is left out, so the first batch ends with the 21st hit
+        self.assertTrue(results[0].request is results[20].request)
+        self.assertTrue(results[21].request is results[29].request)
+        self.assertEqual(results[29].response.status, 200)
+        self.assertEqual(sorted(len(hits) for path, hits in self.server.batches), [9, 20])
+
+    def test_exit_flushes_before_closing_the_dispatcher(self):
+        # The dispatcher gets created after the exit flush is registered on the first hit
+        script = '''
+import sys
+from pyga.entities import Page, Session, Visitor
+from pyga.measurement import MeasurementTracker
+from pyga.requests import Config
+
+config = Config()
+config.fire_and_forget = True
+tracker = MeasurementTracker('UA-0000-0000', 'example.com', config, endpoint=sys.argv[1])
+session, visitor = Session(), Visitor()
+for i in range(25):
+    tracker.track_pageview(Page('/%s' % i), session, visitor)
+'''
+        subprocess.check_call([sys.executable, '-c', script,
+                               'http://127.0.0.1:%s/batch' % self.server.server_port],
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(pyga.__file__))))
+        self.assertEqual(sorted(len(hits) for path, hits in self.server.batches), [5, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
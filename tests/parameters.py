@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+try:
+    from urllib import urlencode
+except ImportError as e:
+    from urllib.parse import urlencode
+
+from pyga import utils
+from pyga.requests import Config, Page, PageViewRequest, Parameters, Session, Tracker, Visitor
+
+
+def legacy_query_string(params):
+    query_string = urlencode(params.get_parameters()).replace('+', '%20')
+    return utils.convert_to_uri_component_encoding(query_string)
+
+
+class TestQueryString(unittest.TestCase):
+
+    def test_matches_legacy_encoding(self):
+        params = Parameters()
+        params.utmac = 'UA-0000-0000'
+        params.utmhn = 'test.com'
+        params.utmn = 123456
+        params.utmp = u"/path with spaces/ümlaut?a=1&b=2+3"
+        params.utmdt = u"It's (a) *title*! 100% ~done~ %21"
+        params.utme = "8(name)9(value'2)11(2)"
+        params.utmcc = '__utma=1.2.3.4.5.6;+__utmz=1.2.3.4.utmcsr=(direct)|utmccn=(direct);'
+        params.utmni = 1
+        params.aip = None
+        params.ua = 'Mozilla/5.0 (X11; Linux x86_64)'
+        params.uip = '1.2.3.0'
+        params.utje = True
+        self.assertEqual(params.get_query_string(), legacy_query_string(params))
+        # Cached values must not change the outcome
+        self.assertEqual(params.get_query_string(), legacy_query_string(params))
+
+    def test_field_table_follows_attribute_order(self):
+        params = Parameters()
+        params.ua = params.uip = params.utje = 'x'
+        self.assertEqual(Parameters.FIELDS, tuple(attr for attr in vars(params) if attr[0] != '_'))
+
+    def test_empty_parameters(self):
+        params = Parameters()
+        self.assertEqual(params.get_query_string(), legacy_query_string(params))
+
+
+class TestStaticQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.default_config = Tracker.config
+
+    def tearDown(self):
+        Tracker.config = self.default_config
+
+    def build(self, tracker):
+        request = PageViewRequest(tracker.config, tracker, Visitor(), Session(), Page('/'))
+        params = request.build_parameters()
+        return request, params
+
+    def test_static_query_matches_full_encoding(self):
+        tracker = Tracker('UA-0000-0000', 'test.com')
+        request, params = self.build(tracker)
+        self.assertEqual(params.get_query_string(request.get_static_query()),
+                         legacy_query_string(params))
+
+    def test_cache_follows_tracker_and_config_changes(self):
+        tracker = Tracker('UA-0000-0000', 'test.com', Config())
+        self.assertEqual(tracker.get_static_query(), 'utmwv=5.3.0&utmac=UA-0000-0000&utmhn=test.com')
+        self.assertEqual(tracker.get_host_header(), 'www.google-analytics.com')
+
+        tracker.domain_name = 'other.com'
+        tracker.config.endpoint = 'http://localhost:8080/__utm.gif'
+        self.assertEqual(tracker.get_static_query(), 'utmwv=5.3.0&utmac=UA-0000-0000&utmhn=other.com')
+        self.assertEqual(tracker.get_host_header(), 'localhost:8080')
+
+    def test_domain_hash_is_cached(self):
+        tracker = Tracker('UA-0000-0000', 'test.com')
+        self.assertEqual(tracker.get_domain_hash(), utils.generate_hash('test.com'))
+        tracker.allow_hash = False
+        self.assertEqual(tracker.get_domain_hash(), 1)
+        tracker.allow_hash = True
+        tracker.domain_name = 'other.com'
+        self.assertEqual(tracker.get_domain_hash(), utils.generate_hash('other.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import threading
+import unittest
+
+from pyga.queues import Empty, HitQueue
+
+
+class TestHitQueue(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        queue = HitQueue(2, HitQueue.OVERFLOW_DROP_OLDEST)
+        for i in range(4):
+            self.assertTrue(queue.put(i))
+        self.assertEqual(queue.drain(), [2, 3])
+        self.assertEqual(queue.dropped_oldest, 2)
+        self.assertEqual(queue.dropped, 2)
+
+    def test_drop_newest(self):
+        queue = HitQueue(2, HitQueue.OVERFLOW_DROP_NEWEST)
+        results = [queue.put(i) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(queue.drain(), [0, 1])
+        self.assertEqual(queue.dropped_newest, 2)
+
+    def test_block_waits_for_room(self):
+        queue = HitQueue(1, HitQueue.OVERFLOW_BLOCK, block_timeout=5)
+        queue.put(0)
+        timer = threading.Timer(0.05, queue.get)
+        timer.start()
+        self.assertTrue(queue.put(1))
+        timer.join()
+        self.assertEqual(queue.drain(), [1])
+
+    def test_block_times_out(self):
+        queue = HitQueue(1, HitQueue.OVERFLOW_BLOCK, block_timeout=0.01)
+        queue.put(0)
+        self.assertFalse(queue.put(1))
+        self.assertEqual(queue.dropped_newest, 1)
+
+    def test_get_on_closed_queue(self):
+        queue = HitQueue()
+        queue.put(0)
+        queue.close()
+        self.assertEqual(queue.get(), 0)
+        self.assertRaises(Empty, queue.get)
+        self.assertFalse(queue.put(1))
+
+    def test_invalid_overflow(self):
+        self.assertRaises(ValueError, HitQueue, 1, 'spill')
+
+
+if __name__ == '__main__':
+    unittest.main()
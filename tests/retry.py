@@ -0,0 +1,99 @@
+import socket
+import unittest
+from mock import patch
+
+from pyga.exceptions import CircuitOpenError
+from pyga.retry import CircuitBreaker, RetryPolicy
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    @patch("pyga.retry.time.sleep")
+    def test_retries_transient_errors(self, sleep):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise socket.timeout('timed out')
+            return 'ok'
+
+        self.assertEqual(RetryPolicy(attempts=2).call(flaky), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @patch("pyga.retry.time.sleep")
+    def test_does_not_retry_other_errors(self, sleep):
+        def broken():
+            raise ValueError('bug')
+
+        self.assertRaises(ValueError, RetryPolicy(attempts=2).call, broken)
+        self.assertEqual(sleep.call_count, 0)
+
+    def test_delay_is_bounded(self):
+        policy = RetryPolicy(backoff=0.1, max_backoff=0.5)
+        for retry in range(10):
+            self.assertTrue(0 <= policy.delay(retry) <= 0.5)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_threshold_and_recovers(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.STATE_OPEN)
+
+        # Cool-down is over: exactly one trial request is let through
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.STATE_CLOSED)
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.STATE_OPEN)
+
+    @patch("pyga.connection.ConnectionPool.urlopen")
+    def test_open_circuit_short_circuits_requests(self, mocked):
+        from pyga.requests import Config, Page, Session, Tracker, Visitor
+
+        mocked.side_effect = socket.error('connection refused')
+        default_config = Tracker.config
+        config = Config()
+        config.circuit_breaker_threshold = 2
+        config.error_severity = Config.ERROR_SEVERITY_SILECE
+        try:
+            tracker = Tracker('UA-0000-0000', 'test.com', config)
+            for i in range(5):
+                tracker.track_pageview(Page('/'), Session(), Visitor())
+            config.error_severity = Config.ERROR_SEVERITY_RAISE
+            self.assertRaises(CircuitOpenError, tracker.track_pageview,
+                              Page('/'), Session(), Visitor())
+        finally:
+            Tracker.config = default_config
+
+        self.assertEqual(mocked.call_count, 2)
+
+    @patch("pyga.connection.ConnectionPool.urlopen")
+    def test_circuit_breaker_is_disabled_by_default(self, mocked):
+        from pyga.requests import Config, Page, Session, Tracker, Visitor
+
+        mocked.side_effect = socket.error('connection refused')
+        default_config = Tracker.config
+        try:
+            tracker = Tracker('UA-0000-0000', 'test.com', Config())
+            for i in range(10):
+                self.assertRaises(socket.error, tracker.track_pageview, Page('/'), Session(), Visitor())
+        finally:
+            Tracker.config = default_config
+
+        self.assertEqual(mocked.call_count, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
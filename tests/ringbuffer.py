@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError as e:
+    import mock
+
+try:
+    from urllib2 import HTTPError, Request as urllib_request
+except ImportError as e:
+    from urllib.error import HTTPError
+    from urllib.request import Request as urllib_request
+
+from pyga.entities import Page, Session, Visitor
+from pyga.requests import Config, Tracker
+from pyga.ringbuffer import RingBuffer, RingBufferSender
+
+
+def request(i):
+    return urllib_request('http://example.com/__utm.gif?utmn=%s' % i, None, {'User-Agent': 'Test'})
+
+
+def append_hits(ring, worker, count):
+    for i in range(count):
+        ring.append(request('%s-%s' % (worker, i)))
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'pyga.ring')
+        self.config = Tracker.config
+
+    def tearDown(self):
+        Tracker.config = self.config
+        shutil.rmtree(self.directory)
+
+    def drain(self, ring):
+        sent = []
+        RingBufferSender(ring, lambda r: sent.append(r.get_full_url())).drain()
+        return sent
+
+    def test_wraps_around(self):
+        ring = RingBuffer(self.path, capacity=500)
+        for i in range(100):
+            self.assertTrue(ring.append(request(i)))
+            self.assertEqual(self.drain(ring), [request(i).get_full_url()])
+        self.assertEqual(ring.stats().used, 0)
+        ring.close()
+
+    def test_full_buffer_drops_newest(self):
+        ring = RingBuffer(self.path, capacity=500)
+        results = [ring.append(request(i)) for i in range(10)]
+        self.assertEqual(results.count(False), ring.stats().dropped)
+        self.assertTrue(0 < ring.stats().dropped < 10)
+        sent = self.drain(ring)
+        self.assertEqual(sent, [request(i).get_full_url() for i in range(results.index(False))])
+
+        # Capacity is taken from the existing file
+        self.assertEqual(RingBuffer(self.path, capacity=4096).capacity, 500)
+        ring.close()
+
+    def test_failed_send_resumes(self):
+        ring = RingBuffer(self.path)
+        for i in range(4):
+            ring.append(request(i))
+
+        sent = []
+        outages = [IOError('endpoint down')]
+
+        def flaky_send(r):
+            if r.get_full_url().endswith('utmn=1'):
+                raise HTTPError(r.get_full_url(), 400, 'Bad Request', {}, None)
+            if r.get_full_url().endswith('utmn=2') and outages:
+                raise outages.pop()
+            sent.append(r.get_full_url())
+
+        sender = RingBufferSender(ring, flaky_send)
+        self.assertEqual(sender.drain(), 1)
+        self.assertEqual(sender.drain(), 2)
+        self.assertEqual(sent, [request(i).get_full_url() for i in (0, 2, 3)])
+        ring.close()
+
+    def test_processes_share_buffer(self):
+        ring = RingBuffer(self.path, capacity=64 * 1024)
+        # Children inherit the open buffer and have to reopen it for locking
+        ring.append(request('parent'))
+        # Forked like pre-forked server workers, where available
+        context = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+        processes = [context.Process(target=append_hits, args=(ring, worker, 50)) for worker in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        sent = self.drain(ring)
+        self.assertEqual(len(sent), 151)
+        for worker in range(3):
+            self.assertEqual([url for url in sent if '=%s-' % worker in url],
+                             [request('%s-%s' % (worker, i)).get_full_url() for i in range(50)])
+        ring.close()
+
+    @mock.patch('pyga.connection.ConnectionPool.urlopen')
+    def test_config_appends_to_ring_buffer(self, urlopen):
+        config = Config()
+        config.ring_buffer_path = self.path
+        tracker = Tracker('UA-0000-0000', 'example.com', config)
+        tracker.track_pageview(Page('/ring'), Session(), Visitor())
+
+        self.assertFalse(urlopen.called)
+        sent = self.drain(RingBuffer(self.path))
+        self.assertEqual(len(sent), 1)
+        self.assertTrue('utmp=%2Fring' in sent[0])
+        config.get_ring_buffer().close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,3 +19,23 @@ class TestSerialize(unittest.TestCase):
         serialized_visitor = pickle.dumps(visitor)
         deserialized_visitor = pickle.loads(serialized_visitor)
         self.assertEqual(visitor.unique_id, deserialized_visitor.unique_id)
+
+    def test_legacy_datetime_state(self):
+        """
+        Visitors pickled by former versions hold datetime objects
+        """
+        from datetime import datetime
+        from pyga.requests import Visitor
+
+        first = datetime(2012, 4, 22, 16, 44, 4)
+        visitor = Visitor.__new__(Visitor)
+        visitor.__setstate__({
+            'unique_id': 1234, 'first_visit_time': first, 'previous_visit_time': first,
+            'current_visit_time': first, 'visit_count': 1, 'ip_address': None,
+            'user_agent': 'Test', 'locale': None, 'flash_version': None,
+            'java_enabled': None, 'screen_colour_depth': None, 'screen_resolution': None,
+        })
+        self.assertEqual(visitor.first_visit_timestamp, 1335113044)
+        self.assertEqual(visitor.current_visit_time, first)
+        deserialized_visitor = pickle.loads(pickle.dumps(visitor))
+        self.assertEqual(deserialized_visitor.previous_visit_time, first)
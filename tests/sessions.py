@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from pyga.entities import Visitor
+from pyga.sessions import SessionManager, TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_expires_at_deadline(self):
+        wheel = TimerWheel(size=4, levels=2, now=0)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 10)
+        wheel.schedule('c', 100)  # beyond 4 ** 2 ticks
+        self.assertEqual(wheel.advance(2), [])
+        self.assertEqual(wheel.advance(3), ['a'])
+        self.assertEqual(wheel.advance(9), [])
+        self.assertEqual(wheel.advance(10), ['b'])
+        self.assertEqual(wheel.advance(99), [])
+        self.assertEqual(wheel.advance(100), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_reschedule_and_cancel(self):
+        wheel = TimerWheel(now=0)
+        wheel.schedule('a', 5)
+        wheel.schedule('a', 20)
+        wheel.schedule('b', 5)
+        wheel.cancel('b')
+        self.assertEqual(wheel.advance(10), [])
+        self.assertEqual(wheel.advance(20), ['a'])
+
+    def test_matches_brute_force(self):
+        rnd = random.Random(1)
+        wheel = TimerWheel(size=8, levels=3, now=0)
+        deadlines = {}
+        now = 0
+        for step in range(2000):
+            now += rnd.randint(0, 20)
+            expired = sorted(wheel.advance(now))
+            due = sorted(key for key, deadline in deadlines.items() if deadline <= now)
+            self.assertEqual(expired, due)
+            for key in due:
+                del deadlines[key]
+
+            key = rnd.randint(0, 50)
+            deadlines[key] = now + rnd.randint(1, 3000)
+            wheel.schedule(key, deadlines[key])
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def test_rollover_after_inactivity(self):
+        expired = []
+        manager = SessionManager(on_expire=lambda key, session: expired.append(key))
+        visitor = Visitor().extract_from_utma('1.1234.1000.1000.1000.1')
+        first = manager.hit('u1', visitor, now=1000)
+        self.assertEqual(visitor.visit_count, 1)
+        self.assertTrue(manager.hit('u1', visitor, now=1000 + 29 * 60) is first)
+        self.assertTrue(manager.hit('u1', visitor, now=1000 + 58 * 60) is first)
+
+        manager.hit('u2', Visitor(), now=1000 + 89 * 60)
+        self.assertEqual(expired, ['u1'])
+        self.assertTrue(manager.get('u1') is None)
+
+        second = manager.hit('u1', visitor, now=1000 + 90 * 60)
+        self.assertFalse(second is first)
+        self.assertEqual(visitor.visit_count, 2)
+        self.assertEqual(visitor.current_visit_timestamp, second.start_timestamp)
+        self.assertEqual(len(manager), 2)
+
+    def test_expire_and_end(self):
+        manager = SessionManager(timeout=60)
+        manager.hit('u1', None, now=0)
+        manager.hit('u2', None, now=30)
+        self.assertEqual(manager.expire(now=61), ['u1'])
+        self.assertTrue(manager.end('u2') is not None)
+        self.assertEqual(manager.expire(now=1000), [])
+        self.assertEqual(len(manager), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
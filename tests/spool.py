@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import unittest
+
+try:
+    from urllib2 import HTTPError, Request as urllib_request
+except ImportError as e:
+    from urllib.error import HTTPError
+    from urllib.request import Request as urllib_request
+
+from pyga.spool import DiskSpool, SpoolSender, decode_hit, encode_hit
+
+
+class TestDiskSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def request(self, i):
+        return urllib_request('http://example.com/__utm.gif?utmn=%s' % i,
+                              None, {'User-Agent': 'Test'})
+
+    def test_hit_round_trip(self):
+        request = urllib_request('http://example.com/__utm.gif', 'utmn=1',
+                                 {'User-Agent': 'Test', 'Content-Length': 6})
+        decoded = decode_hit(encode_hit(request))
+        self.assertEqual(decoded.get_full_url(), request.get_full_url())
+        self.assertEqual(decoded.data, 'utmn=1')
+        self.assertEqual(decoded.get_header('User-agent'), 'Test')
+
+    def test_drains_in_order_across_segments(self):
+        spool = DiskSpool(self.directory, segment_size=100)
+        for i in range(10):
+            spool.append(self.request(i))
+        self.assertTrue(len(spool.segments()) > 1)
+
+        sent = []
+        sender = SpoolSender(spool, lambda r: sent.append(r.get_full_url()))
+        self.assertEqual(sender.drain(), 10)
+        self.assertEqual(sent, [self.request(i).get_full_url() for i in range(10)])
+        self.assertEqual(len(spool.segments()), 1)
+        self.assertEqual(sender.drain(), 0)
+        spool.close()
+
+    def test_failed_send_resumes_from_checkpoint(self):
+        spool = DiskSpool(self.directory)
+        for i in range(3):
+            spool.append(self.request(i))
+        spool.close()
+
+        sent = []
+
+        def flaky_send(request):
+            if len(sent) == 1:
+                raise IOError('endpoint down')
+            sent.append(request.get_full_url())
+
+        self.assertEqual(SpoolSender(spool, flaky_send).drain(), 1)
+
+        # A restarted process picks up where the previous one stopped
+        spool = DiskSpool(self.directory)
+        self.assertEqual(SpoolSender(spool, lambda r: sent.append(r.get_full_url())).drain(), 2)
+        self.assertEqual(sent, [self.request(i).get_full_url() for i in range(3)])
+
+    def test_rejected_hit_is_dropped(self):
+        spool = DiskSpool(self.directory)
+        for i in range(4):
+            spool.append(self.request(i))
+        spool.close()
+
+        sent = []
+
+        def send(request):
+            url = request.get_full_url()
+            if url.endswith('utmn=1'):
+                raise HTTPError(url, 400, 'Bad Request', {}, None)
+            if url.endswith('utmn=2'):
+                raise HTTPError(url, 302, 'Found', {}, None)
+            sent.append(url)
+
+        sender = SpoolSender(spool, send)
+        self.assertEqual(sender.drain(), 2)
+        self.assertEqual(sender.dropped, 2)
+        self.assertEqual(sent, [self.request(i).get_full_url() for i in (0, 3)])
+        self.assertEqual(sender.drain(), 0)
+
+    def test_records_appended_while_draining_are_sent(self):
+        spool = DiskSpool(self.directory)
+        spool.append(self.request(0))
+        spool.write_checkpoint(0, 0)
+        segments = spool.segments
+        writes = [self.request(1)]
+
+        def rotating_writer():
+            # The writer appends to the drained segment and then moves on
+            if writes:
+                spool.append(writes.pop())
+                spool.close()
+                open(spool.segment_path(segments()[0] + 1), 'ab').close()
+            return segments()
+
+        spool.segments = rotating_writer
+        sent = []
+        self.assertEqual(SpoolSender(spool, lambda r: sent.append(r.get_full_url())).drain(), 2)
+        self.assertEqual(sent, [self.request(i).get_full_url() for i in range(2)])
+        self.assertEqual(len(segments()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
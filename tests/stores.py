@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError as e:
+    import mock
+
+from pyga.entities import Session, Visitor
+from pyga.stores import MemoryStore, SQLiteStore, WriteBehindStore
+
+
+class StoreTests(object):
+
+    def build(self, key):
+        visitor = Visitor().extract_from_utma('1.%s.1335113044.1335113045.1335113046.3' % key)
+        visitor.user_agent = 'Test'
+        return visitor, Session()
+
+    def test_get_many_and_put_many(self):
+        self.store.put_many(dict((key, self.build(key)) for key in range(1, 4)))
+        result = self.store.get_many([1, 3, 5])
+        self.assertEqual(sorted(result), [1, 3])
+        visitor, session = result[3]
+        self.assertEqual(visitor.unique_id, 3)
+        self.assertEqual(visitor.visit_count, 3)
+        self.assertTrue(isinstance(session, Session))
+        self.assertEqual(self.store.get(5), (None, None))
+
+    def test_session_expiry(self):
+        with mock.patch('pyga.utils.get_timestamp', return_value=1000000):
+            self.store.put(1, *self.build(1))
+        with mock.patch('pyga.utils.get_timestamp', return_value=1000000 + 29 * 60):
+            self.assertTrue(self.store.get(1)[1] is not None)
+        with mock.patch('pyga.utils.get_timestamp', return_value=1000000 + 31 * 60):
+            visitor, session = self.store.get(1)
+            self.assertEqual(visitor.unique_id, 1)
+            self.assertTrue(session is None)
+
+            visitor, session = self.store.load(1)
+            self.assertEqual(visitor.visit_count, 4)
+            self.assertEqual(visitor.current_visit_timestamp, session.start_timestamp)
+
+    def test_load_new_visitor(self):
+        visitor, session = self.store.load('new')
+        self.assertEqual(visitor.visit_count, 1)
+        session.track_count = 2
+        self.store.save('new', visitor, session)
+        self.assertEqual(self.store.get('new')[1].track_count, 2)
+        self.store.delete_many(['new'])
+        self.assertEqual(self.store.get('new'), (None, None))
+
+
+class TestMemoryStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore(maxsize=10)
+
+    def test_evicts_least_recently_used(self):
+        store = MemoryStore(maxsize=2)
+        for key in range(3):
+            store.put(key, *self.build(key + 1))
+        self.assertEqual(sorted(store.get_many(range(3))), [1, 2])
+
+
+class TestSQLiteStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SQLiteStore(os.path.join(self.directory, 'visitors.db'), visitor_timeout=3600)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_purge(self):
+        with mock.patch('pyga.utils.get_timestamp', return_value=1000000):
+            self.store.put_many({1: self.build(1), 2: self.build(2)})
+        with mock.patch('pyga.utils.get_timestamp', return_value=1000000 + 7200):
+            self.store.put(2, *self.build(2))
+            self.assertEqual(sorted(self.store.get_many([1, 2])), [2])
+            self.assertEqual(self.store.purge(), 1)
+
+
+class TestWriteBehindStore(StoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MemoryStore()
+        self.store = WriteBehindStore(self.backend, batch_size=3)
+
+    def test_writes_are_batched_and_coalesced(self):
+        visitor, session = self.build(1)
+        for i in range(5):
+            self.store.save(1, visitor, session)
+        self.store.put(2, *self.build(2))
+        self.assertEqual(len(self.backend), 0)
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(sorted(self.store.get_many([1, 2])), [1, 2])
+
+        self.store.put(3, *self.build(3))
+        self.assertEqual(len(self.backend), 3)
+        self.assertEqual(len(self.store), 0)
+
+    def test_close_flushes(self):
+        self.store.put(1, *self.build(1))
+        self.store.close()
+        self.assertEqual(self.backend.get(1)[0].unique_id, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
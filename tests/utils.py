@@ -12,6 +12,80 @@ class TestAnonymizeIp(unittest.TestCase):
         self.assertEqual(
             "192.168.137.0", utils.anonymize_ip("192.168.137.123"))
 
+    def test_with_ipv6(self):
+        self.assertEqual("2001:db8:85a3::", utils.anonymize_ip("2001:db8:85a3:8d3:1319:8a2e:370:7348"))
+        self.assertEqual("::ffff:8.8.8.0", utils.anonymize_ip("::ffff:8.8.8.8"))
+        self.assertEqual("", utils.anonymize_ip("2001:db8::g"))
+
+
+class TestClassifyIp(unittest.TestCase):
+    def test_ipv4(self):
+        self.assertEqual(utils.classify_ip("1.2.3.4"), (4, False, "1.2.3.0"))
+        self.assertTrue(utils.is_private_ip("172.16.0.1"))
+        self.assertFalse(utils.is_private_ip("172.32.0.1"))
+        self.assertFalse(utils.is_valid_ip("1.2.3"))
+        self.assertFalse(utils.is_valid_ip("1.2.3.4444"))
+
+    def test_ipv6(self):
+        self.assertTrue(utils.is_valid_ip("2001:db8::1"))
+        self.assertFalse(utils.is_private_ip("2001:db8::1"))
+        for ip in ("::1", "fe80::1%eth0", "fd12:3456::1", "::ffff:10.1.2.3"):
+            self.assertTrue(utils.is_private_ip(ip), ip)
+        self.assertFalse(utils.is_valid_ip("2001:db8:::1"))
+
+    def test_server_meta(self):
+        from pyga.entities import Visitor
+
+        visitor = Visitor().extract_from_server_meta({
+            'REMOTE_ADDR': '2001:db8::1',
+            'HTTP_X_FORWARDED_FOR': 'fd00::1',
+            'HTTP_ACCEPT_LANGUAGE': 'de;q=0.5, fr-CH;q=0.8, it;q=0.8',
+        })
+        self.assertEqual(visitor.ip_address, '2001:db8::1')
+        self.assertEqual(visitor.locale, 'fr_CH')
+
+
+class TestParseAcceptLanguage(unittest.TestCase):
+    def test_preferred_locale(self):
+        self.assertEqual(utils.parse_accept_language("en-US,en;q=0.9"), "en_US")
+        self.assertEqual(utils.parse_accept_language("da;q=0.7, en-gb"), "en_gb")
+        # q=0 has always been treated like q=1
+        self.assertEqual(utils.parse_accept_language("fr;q=0, de;q=0.9"), "fr")
+        self.assertEqual(utils.parse_accept_language("*"), None)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_cached_generate_hash(self):
+        value = 'Mozilla/5.0 (X11; Linux x86_64)'
+        self.assertEqual(utils.cached_generate_hash(value), utils.generate_hash(value))
+        self.assertTrue(value in utils.cached_generate_hash.cache)
+        self.assertEqual(utils.cached_generate_hash(value), utils.generate_hash(value))
+
+    def test_lru_memoize(self):
+        calls = []
+
+        @utils.lru_memoize(2)
+        def cached_generate_hash(value):
+            calls.append(value)
+            return utils.generate_hash(value)
+
+        value = 'Mozilla/5.0 (X11; Linux x86_64)'
+        self.assertEqual(cached_generate_hash(value), utils.generate_hash(value))
+        self.assertTrue(value in cached_generate_hash.cache)
+        self.assertEqual(cached_generate_hash(value), utils.generate_hash(value))
+        self.assertEqual(calls, [value])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from pyga.requests import CustomVariable, Tracker, X10
+
+
+class TestX10(unittest.TestCase):
+
+    def test_render_url_string(self):
+        x10 = X10()
+        x10.set_key(5, X10.OBJECT_KEY_NUM, 'category')
+        x10.set_key(5, X10.TYPE_KEY_NUM, "it's (a) *test*!")
+        x10.set_value(5, X10.VALUE_VALUE_NUM, 10)
+        x10.set_key(8, 1, 'a')
+        x10.set_key(8, 3, 'c')
+        x10.set_value(14, 2, 100)
+        self.assertEqual(x10.render_url_string(),
+                         "5(category*it'0s (a'1 '2test'2'3)(10)8(a*3!c)14v(2!100)")
+
+    def test_unicode_values(self):
+        x10 = X10()
+        x10.set_key(5, X10.OBJECT_KEY_NUM, u'caf\xe9!')
+        self.assertEqual(x10.render_url_string(), u"5(caf\xe9'3)")
+
+
+class TestCustomVariablesCache(unittest.TestCase):
+
+    def test_cache_invalidated_by_add_and_remove(self):
+        tracker = Tracker('UA-0000-0000', 'test.com')
+        tracker.add_custom_variable(CustomVariable(1, 'name', 'value'))
+        self.assertEqual(tracker.get_custom_variables_x10(), '8(name)9(value)')
+
+        tracker.add_custom_variable(CustomVariable(2, 'user type', 'member', CustomVariable.SCOPE_VISITOR))
+        self.assertEqual(tracker.get_custom_variables_x10(),
+                         '8(name*user%20type)9(value*member)11(2!1)')
+
+        tracker.remove_custom_variable(1)
+        self.assertEqual(tracker.get_custom_variables_x10(), '8(2!user%20type)9(2!member)11(2!1)')
+
+
+if __name__ == '__main__':
+    unittest.main()